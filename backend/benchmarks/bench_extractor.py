@@ -0,0 +1,116 @@
+"""
+プロジェクトのページからの本文抽出のベンチマーク。
+benchmarks/corpus/ のHTMLをローカルのHTTPサーバーから配信し、ページごとの時間・メモリのピーク・抽出した文字数を比べる。
+  before: ページ全体を読み込んで BeautifulSoup(lxml) で解析する以前の scrape_text_from_url
+  after : utils.fetch_page_text（ストリーミングで読み、settings の上限に達したら読み込みをやめる）
+
+corpus のページは、よくあるページの形（日本語のLP・巨大なインラインJSのSPA・Shift_JISの表組み・長いブログ記事・
+短すぎるページ・文字コードの宣言がないページ）を手で再現したもの。
+before の計測には beautifulsoup4 と lxml が必要。
+
+使い方（backend ディレクトリで）:
+  python benchmarks/bench_extractor.py --rounds 20
+"""
+import argparse
+import functools
+import http.server
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from bs4 import BeautifulSoup
+
+import utils
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def _scrape_before(url: str) -> str | None:
+    # 以前の utils.scrape_text_from_url と同じ処理
+    try:
+        headers = { 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36' }
+        response = requests.get(url, headers=headers, timeout=15)
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding
+        soup = BeautifulSoup(response.text, 'lxml')
+        for script_or_style in soup(["script", "style"]):
+            script_or_style.decompose()
+        text = soup.get_text()
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = '\n'.join(chunk for chunk in chunks if chunk)
+        if len(text) < 100:
+            return None
+        return text
+    except requests.RequestException as e:
+        print(f"Error fetching or reading URL {url}: {e}")
+        return None
+
+def _scrape_after(url: str) -> str | None:
+    page = utils.fetch_page_text(url)
+    return page["text"] if page else None
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+class _QuietServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # after は上限に達すると接続を途中で閉じるので、サーバー側の ConnectionResetError は表示しない
+        pass
+
+def _start_server() -> http.server.ThreadingHTTPServer:
+    server = _QuietServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=CORPUS_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _measure(scrape, url: str, rounds: int) -> tuple[float, int, str | None]:
+    """(1回あたりの時間の中央値[ms], メモリのピーク[バイト], 抽出したテキスト) を返す"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        text = scrape(url)
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    scrape(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    server = _start_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    pages = sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith(".html"))
+    print(f"{'page':<20} {'size':>8}  {'before ms':>9} {'after ms':>9}  {'before peak':>11} {'after peak':>10}  {'before chars':>12} {'after chars':>11}")
+    totals = {"before_ms": 0.0, "after_ms": 0.0, "before_peak": 0, "after_peak": 0}
+    for name in pages:
+        url = f"{base_url}/{name}"
+        before_ms, before_peak, before_text = _measure(_scrape_before, url, args.rounds)
+        after_ms, after_peak, after_text = _measure(_scrape_after, url, args.rounds)
+        totals["before_ms"] += before_ms
+        totals["after_ms"] += after_ms
+        totals["before_peak"] = max(totals["before_peak"], before_peak)
+        totals["after_peak"] = max(totals["after_peak"], after_peak)
+        print(
+            f"{name:<20} {os.path.getsize(os.path.join(CORPUS_DIR, name)) / 1024:7.0f}K  {before_ms:9.2f} {after_ms:9.2f}  "
+            f"{before_peak / 1024:10.0f}K {after_peak / 1024:9.0f}K  {len(before_text or ''):12,} {len(after_text or ''):11,}"
+        )
+    server.shutdown()
+    print(
+        f"total {totals['before_ms']:.1f} -> {totals['after_ms']:.1f} ms ({totals['before_ms'] / totals['after_ms']:.1f}x), "
+        f"max peak {totals['before_peak'] / 1024:.0f}K -> {totals['after_peak'] / 1024:.0f}K"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+投稿生成1回あたりのコミット数と保存時間のベンチマーク。
+生成結果（--posts 件の投稿）を保存する処理を --rounds 回くり返し、1回あたりのコミット数・SQL文の数・時間を比べる。
+  before: latest_ai_response の更新と、投稿1件ごとに add / commit / refresh をくり返す以前の方法
+  after : crud.create_project_posts（1文のINSERT ... RETURNING と1回のコミット）
+
+一時ディレクトリのSQLiteファイルに対して実行する（--database-url で PostgreSQL なども指定できる）。
+
+使い方（backend ディレクトリで）:
+  python benchmarks/bench_generation_commits.py --posts 5 --rounds 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--database-url", default=None)
+    return parser.parse_args()
+
+args = _parse_args()
+# config を読み込む前に、計測用のデータベースを指定しておく
+os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-commits-'), 'bench.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import crud, database, models, search
+
+def _save_before(db, contents: list[str], project_id: int, ai_text: str):
+    # 以前の generate_posts_api と同じ保存の仕方
+    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
+    db_project.latest_ai_response = ai_text
+    db.commit()
+    db.refresh(db_project)
+    created = []
+    for content in contents:
+        db_post = models.Post(content=content, project_id=project_id)
+        db.add(db_post)
+        db.commit()
+        db.refresh(db_post)
+        created.append(db_post)
+    return created
+
+def _save_after(db, contents: list[str], project_id: int, ai_text: str):
+    return crud.create_project_posts(db, contents, project_id=project_id, ai_response=ai_text)
+
+def _measure(label: str, save, project_id: int, contents: list[str], rounds: int):
+    counts = {"commits": 0, "statements": 0}
+    def count_commit(session):
+        counts["commits"] += 1
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counts["statements"] += 1
+    event.listen(Session, "after_commit", count_commit)
+    event.listen(database.engine, "before_cursor_execute", count_statement)
+    db = database.SessionLocal()
+    try:
+        ai_text = "\n---\n".join(contents)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            created = save(db, contents, project_id, ai_text)
+            assert [db_post.content for db_post in created] == contents
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+        event.remove(Session, "after_commit", count_commit)
+        event.remove(database.engine, "before_cursor_execute", count_statement)
+    print(
+        f"{label:<7} {counts['commits'] / rounds:5.1f} commits/generation  "
+        f"{counts['statements'] / rounds:5.1f} statements/generation  {elapsed * 1000 / rounds:7.2f} ms/generation"
+    )
+    return elapsed
+
+def main():
+    models.Base.metadata.create_all(bind=database.engine)
+    search.init(database.engine)
+    db = database.SessionLocal()
+    try:
+        project = models.Project(name="Bench", url="https://example.com", enrichment_status="done")
+        db.add(project)
+        db.commit()
+        project_id = project.id
+    finally:
+        db.close()
+
+    contents = [f"生成された投稿 {i + 1} です。#AI" for i in range(args.posts)]
+    print(f"{args.posts} posts/generation x {args.rounds} rounds ({database.engine.url.get_backend_name()})")
+    before = _measure("before", _save_before, project_id, contents, args.rounds)
+    after = _measure("after", _save_after, project_id, contents, args.rounds)
+    print(f"save time: {before / after:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+GET /posts の絞り込みとキーセット・ページネーションのベンチマーク。
+--posts 件（既定は 100,000 と 1,000,000）の投稿を一時ディレクトリのSQLiteに入れ、よく使う絞り込みごとに
+  - crud.get_posts が発行するSQLの EXPLAIN QUERY PLAN（インデックスを使っているか・一時B-treeで並べ替えていないか）
+  - next_cursor をたどって --pages ページ読むときの、1ページあたりの時間
+を表示する。--without-indexes を付けると、posts の複合インデックスを消した状態（以前の構成）で同じ計測をする。
+
+使い方（backend ディレクトリで）:
+  python benchmarks/bench_posts_query.py --posts 100000 1000000 --pages 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--without-indexes", action="store_true")
+    return parser.parse_args()
+
+args = _parse_args()
+_tmp_dir = tempfile.mkdtemp(prefix="bench-posts-")
+# config を読み込む前に、計測用のデータベースを指定しておく
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+from sqlalchemy import event, insert, text
+
+import crud, database, models
+
+STATUSES = ("draft", "draft", "scheduled", "posted", "posted", "posted", "failed")
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+# (名前, crud.get_posts に渡す絞り込み)
+QUERY_SHAPES = [
+    ("all, newest first", {"sort": "created_at"}),
+    ("one project", {"sort": "created_at", "project_id": 7}),
+    ("scheduled today", {
+        "sort": "scheduled_at", "statuses": ["scheduled"],
+        "scheduled_from": NOW, "scheduled_to": NOW + timedelta(days=1),
+    }),
+    ("scheduled, all", {"sort": "scheduled_at", "statuses": ["scheduled"]}),
+    ("posted last week", {
+        "sort": "posted_at", "statuses": ["posted"],
+        "posted_from": NOW - timedelta(days=7), "posted_to": NOW,
+    }),
+]
+
+def _reset_database():
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    if args.without_indexes:
+        with database.engine.begin() as connection:
+            for index in models.Post.__table__.indexes:
+                if len(index.columns) > 1:
+                    connection.execute(text(f"DROP INDEX {index.name}"))
+
+def _seed(post_count: int):
+    random.seed(21)
+    with database.engine.begin() as connection:
+        connection.execute(insert(models.Project), [
+            {"name": f"project {i}", "url": f"https://example.com/{i}", "enrichment_status": "done"}
+            for i in range(1, args.projects + 1)
+        ])
+        batch = []
+        for i in range(post_count):
+            status = random.choice(STATUSES)
+            # 過去1年に散らばった作成日時（同じ秒に複数の投稿が入ることもある）
+            created_at = NOW - timedelta(seconds=random.randint(0, 365 * 24 * 3600), microseconds=random.randint(0, 999_999))
+            row = {
+                "content": f"post {i}",
+                "status": status,
+                "project_id": random.randint(1, args.projects),
+                "created_at": created_at,
+                "scheduled_at": None,
+                "posted_at": None,
+            }
+            if status == "scheduled":
+                row["scheduled_at"] = NOW + timedelta(minutes=random.randint(-60, 30 * 24 * 60))
+            elif status == "posted":
+                row["posted_at"] = created_at + timedelta(hours=random.randint(0, 48))
+            batch.append(row)
+            if len(batch) == 50_000:
+                connection.execute(insert(models.Post), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(models.Post), batch)
+        connection.execute(text("ANALYZE"))
+
+def _query_plan(db, filters: dict) -> list[str]:
+    """2ページ目（カーソルあり）を読むときに crud.get_posts が発行したSELECTを、同じパラメータで EXPLAIN QUERY PLAN にかける"""
+    first_page = crud.get_posts(db, limit=args.limit, **filters)
+    after = (getattr(first_page[-1], filters["sort"]), first_page[-1].id) if first_page else None
+    captured = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        crud.get_posts(db, limit=args.limit, after=after, **filters)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+    statement, parameters = captured[-1]
+    raw = db.connection().connection.driver_connection
+    return [row[-1] for row in raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()]
+
+def _page_through(db, filters: dict) -> tuple[float, int]:
+    """next_cursor をたどって args.pages ページ読み、(1ページあたりのミリ秒, 読んだ件数) を返す"""
+    column_name = filters["sort"]
+    after = None
+    pages = rows = 0
+    started = time.perf_counter()
+    while pages < args.pages:
+        posts = crud.get_posts(db, limit=args.limit, after=after, **filters)
+        pages += 1
+        rows += len(posts)
+        if len(posts) < args.limit:
+            break
+        after = (getattr(posts[-1], column_name), posts[-1].id)
+        db.expunge_all()
+    return (time.perf_counter() - started) * 1000 / pages, rows
+
+def main():
+    for post_count in args.posts:
+        _reset_database()
+        started = time.perf_counter()
+        _seed(post_count)
+        print(f"\n=== {post_count:,} posts (seeded in {time.perf_counter() - started:.0f}s){' without composite indexes' if args.without_indexes else ''} ===")
+        db = database.SessionLocal()
+        try:
+            for name, filters in QUERY_SHAPES:
+                plan = _query_plan(db, filters)
+                ms_per_page, rows = _page_through(db, filters)
+                uses_index = all("USING" in step and "INDEX" in step for step in plan if step.startswith(("SCAN", "SEARCH")))
+                sorts_in_memory = any("TEMP B-TREE" in step for step in plan)
+                verdict = "ok" if uses_index and not sorts_in_memory else "FULL SCAN / SORT"
+                print(f"{name:<18} {ms_per_page:8.2f} ms/page  {rows:>5} rows  [{verdict}]")
+                for step in plan:
+                    print(f"    {step}")
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
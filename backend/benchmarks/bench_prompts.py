@@ -0,0 +1,166 @@
+"""
+一括生成のプロンプト組み立てのベンチマーク。
+プロジェクト × キャラクター × ペルソナの組み合わせを順に組み立てて、1秒あたりの件数を比べる。
+  before: 組み合わせごとにキャラクター・ペルソナのセクションを作り、テンプレートに str.replace を7回かける以前の方法
+  after : prompts.render（コンパイル済みテンプレートの1回の結合と、キャッシュ済みのセクション）
+続けて、一時ディレクトリのSQLiteに入れたキャラクター・ペルソナを読み込むところから計測する。
+  before: 組み合わせごとに crud.get_character / crud.get_target_persona で読み込む（プロンプト1件につきSELECT 2回）
+  after : prompts.profiles から読む（温まったあとはDBに問い合わせない）
+
+使い方（backend ディレクトリで）:
+  python benchmarks/bench_prompts.py --projects 30 --characters 4 --personas 3 --rounds 20
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config を読み込む前に、計測用のデータベースを指定しておく
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-prompts-'), 'bench.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+from sqlalchemy import event
+
+import crud, database, models, prompts
+
+TEMPLATE = (
+    "あなたはSNSマーケティングの専門家です。{{language}}で、以下のプロジェクトを紹介するX投稿を5つ作成してください。\n"
+    "{{character_section}}\n{{target_persona_section}}\n"
+    "# プロジェクト\n- 名前: {{project_name}}\n- URL: {{project_url}}\n- ハッシュタグ: {{hashtags}}\n"
+    "# リサーチ結果\n{{research_summary}}\n"
+    "# 指示\n" + "- 投稿は140文字以内で、具体的な数字やベネフィットを含めてください。\n" * 20 +
+    "- 投稿同士は '---' で区切ってください。\n"
+)
+
+def _render_before(template: str, project, character, target_persona, language: str) -> str:
+    # 以前の generate_posts_api と同じ組み立て方
+    character_prompt_part = f"""
+# 投稿者キャラクター情報
+あなたは以下の設定を持つ、非常に魅力的な人物です。このキャラクターに完全になりきって、コンテンツを作成してください。
+- 肩書: {character.title}
+- 専門分野: {character.expertise}
+- 背景: {character.background}
+- 価値観: {character.values_beliefs}
+- 目標: {character.goal}
+- 口調: {character.base_tone}で、以下の特徴を持つ: {character.style_features}
+- 口癖: {character.catchphrases}
+- 読者に与えたい印象: {character.impression}
+"""
+    target_persona_prompt_part = f"""
+# ターゲット読者情報
+以下のペルソナを持つ読者に、最も響くようにコンテンツを作成してください。
+- ペルソナ: {target_persona.name}
+- 抱えている課題: {target_persona.challenges}
+- 達成したいこと: {target_persona.goals}
+- 知識レベル: {target_persona.knowledge_level}
+- 心を動かすキーワード: {target_persona.keywords}
+- 行動の決め手: {target_persona.decision_triggers}
+"""
+    prompt = template.replace("{{language}}", language or "日本語")
+    prompt = prompt.replace("{{character_section}}", character_prompt_part)
+    prompt = prompt.replace("{{target_persona_section}}", target_persona_prompt_part)
+    prompt = prompt.replace("{{project_name}}", project.name)
+    prompt = prompt.replace("{{project_url}}", project.url)
+    prompt = prompt.replace("{{research_summary}}", project.research_summary or "調査結果なし")
+    prompt = prompt.replace("{{hashtags}}", project.hashtags or "")
+    return prompt
+
+def _fixtures(project_count: int, character_count: int, persona_count: int):
+    projects = [
+        models.Project(
+            id=i, name=f"プロジェクト{i}", url=f"https://example.com/{i}", hashtags="#AI #SaaS",
+            research_summary="このプロダクトは中小企業の業務を自動化するクラウドサービスです。" * 60
+        )
+        for i in range(project_count)
+    ]
+    characters = [
+        models.Character(
+            id=i + 1, name=f"キャラクター{i}", title="エンジニア", expertise="生成AI", background="スタートアップで10年" * 10,
+            values_beliefs="現場主義", goal="フォロワー1万人", base_tone="常体", style_features="簡潔",
+            catchphrases="要するに", impression="頼れる先輩", version=1
+        )
+        for i in range(character_count)
+    ]
+    personas = [
+        models.TargetPersona(
+            id=i + 1, name=f"ペルソナ{i}", challenges="人手不足" * 10, goals="業務効率化", knowledge_level="初心者",
+            keywords="自動化, 時短", decision_triggers="無料トライアル", version=1
+        )
+        for i in range(persona_count)
+    ]
+    return projects, characters, personas
+
+def _measure(label: str, render, combinations: list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for project, character, persona in combinations:
+            render(project, character, persona)
+    elapsed = time.perf_counter() - started
+    rate = rounds * len(combinations) / elapsed
+    print(f"{label:<7} {rate:,.0f} prompts/s ({elapsed * 1000 / (rounds * len(combinations)):.3f} ms/prompt)")
+    return rate
+
+def _measure_with_lookups(setting, combinations: list, characters: list, personas: list, rounds: int):
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        db.add_all(characters + personas)
+        db.commit()
+        # 組み合わせには、DBに入れたものとは別のオブジェクトからIDだけを渡す
+        ids = [(project, character.id, persona.id) for project, character, persona in combinations]
+        lookups = {
+            "before": lambda c, t: (crud.get_character(db, character_id=c), crud.get_target_persona(db, persona_id=t)),
+            "after": lambda c, t: (prompts.profiles.get_character(db, character_id=c), prompts.profiles.get_target_persona(db, persona_id=t)),
+        }
+        rates = {}
+        for label, lookup in lookups.items():
+            def build(project, character_id, persona_id):
+                character, persona = lookup(character_id, persona_id)
+                return prompts.render(setting, project=project, character=character, target_persona=persona, language="日本語")
+            # 温めてから、計測中に発行されたSQLを数える
+            for combination in ids:
+                build(*combination)
+            statements = []
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            event.listen(database.engine, "before_cursor_execute", count)
+            try:
+                rates[label] = _measure(label, build, ids, rounds)
+            finally:
+                event.remove(database.engine, "before_cursor_execute", count)
+            print(f"        {len(statements) / (rounds * len(ids)):.2f} queries/prompt")
+        print(f"build throughput with lookups: {rates['after'] / rates['before']:.1f}x")
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=30)
+    parser.add_argument("--characters", type=int, default=4)
+    parser.add_argument("--personas", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    projects, characters, personas = _fixtures(args.projects, args.characters, args.personas)
+    combinations = list(itertools.product(projects, characters, personas))
+    setting = models.Setting(key="default_post_prompt", value=TEMPLATE)
+
+    # 2つの方法で同じプロンプトになることを確かめてから計測する
+    project, character, persona = combinations[0]
+    assert _render_before(TEMPLATE, project, character, persona, "日本語") == prompts.render(
+        setting, project=project, character=character, target_persona=persona, language="日本語"
+    )
+
+    print(f"{len(combinations)} combinations x {args.rounds} rounds")
+    before = _measure("before", lambda p, c, t: _render_before(TEMPLATE, p, c, t, "日本語"), combinations, args.rounds)
+    after = _measure("after", lambda p, c, t: prompts.render(setting, project=p, character=c, target_persona=t, language="日本語"), combinations, args.rounds)
+    print(f"rendering throughput: {after / before:.1f}x")
+
+    print()
+    _measure_with_lookups(setting, combinations, characters, personas, args.rounds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+X APIクライアントのマイクロベンチマーク。
+ローカルのスタブHTTPサーバーに POST /2/tweets を送り、1投稿あたりのレイテンシを比べる。
+  before: 投稿のたびに tweepy.Client（とHTTPセッション）を作り直す、以前の x_client の方法
+  after : x_client.get_x_client_v2() のキャッシュ済みクライアントとキープアライブ接続を使い回す方法
+
+使い方（backend ディレクトリで）:
+  python benchmarks/bench_x_client.py --posts 300 --connect-delay-ms 20
+--connect-delay-ms は新しい接続ごとにサーバー側で待つ時間で、本番のTCP/TLSハンドシェイクの往復を模したもの。
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# スタブにしか送らないので、認証情報はダミーにしておく（.env の値は使わない）
+for key in ("X_API_KEY", "X_API_KEY_SECRET", "X_ACCESS_TOKEN", "X_ACCESS_TOKEN_SECRET"):
+    os.environ[key] = "bench"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tweepy
+from requests.adapters import HTTPAdapter
+
+import x_client
+from config import settings
+
+X_API_HOST = "https://api.twitter.com"
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connect_delay = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        # ヘッダと本文を別々に書くので、Nagleアルゴリズムと遅延ACKで応答が40msほど止まらないようにする
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        type(self).connections += 1
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        text = json.loads(body or b"{}").get("text", "")
+        payload = json.dumps({"data": {"id": "1", "text": text}}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class _StubAdapter(HTTPAdapter):
+    """api.twitter.com 宛てのリクエストを、ローカルのスタブサーバーに向け直すアダプタ"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        request.url = request.url.replace(X_API_HOST, self.base_url, 1)
+        return super().send(request, **kwargs)
+
+def _post_with_new_client(base_url: str, text: str):
+    # 以前の get_x_client_v2() と同じく、投稿のたびにクライアントを作る
+    client = tweepy.Client(
+        consumer_key=os.getenv("X_API_KEY"),
+        consumer_secret=os.getenv("X_API_KEY_SECRET"),
+        access_token=os.getenv("X_ACCESS_TOKEN"),
+        access_token_secret=os.getenv("X_ACCESS_TOKEN_SECRET")
+    )
+    client.session.mount(X_API_HOST, _StubAdapter(base_url))
+    try:
+        return client.create_tweet(text=text).data
+    finally:
+        client.session.close()
+
+def _post_with_cached_client(text: str):
+    return x_client.get_x_client_v2().create_tweet(text=text).data
+
+def _measure(label: str, post, posts: int) -> dict:
+    _StubHandler.connections = 0
+    latencies = []
+    for i in range(posts):
+        started = time.perf_counter()
+        post(f"bench {i}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    result = {
+        "label": label,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "connections": _StubHandler.connections,
+    }
+    print(f"{label:<7} mean={result['mean_ms']:.2f}ms p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms connections={result['connections']}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=300)
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    _StubHandler.connect_delay = args.connect_delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    x_client.get_x_client_v2().session.mount(X_API_HOST, _StubAdapter(base_url, pool_maxsize=settings.X_HTTP_POOL_SIZE))
+    try:
+        # 1回ずつ先に送って、インポートなどの初回だけの処理を計測から外す
+        _post_with_new_client(base_url, "warmup")
+        _post_with_cached_client("warmup")
+        before = _measure("before", lambda text: _post_with_new_client(base_url, text), args.posts)
+        after = _measure("after", _post_with_cached_client, args.posts)
+        print(f"per-post latency: {before['mean_ms'] / after['mean_ms']:.1f}x faster with cached clients")
+    finally:
+        x_client.close_clients()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
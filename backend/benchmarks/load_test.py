@@ -0,0 +1,265 @@
+"""
+APIの負荷テスト。アプリを別プロセスの uvicorn で起動し、同時接続数ごとのスループットとレイテンシ（p50 / p99）を計測する。
+  crud      : 投稿一覧・プロジェクト一覧・キャラクター一覧の読み込みと、投稿の更新（--write-ratio の割合）を混ぜたリクエスト
+  generation: 常に --generations 件の投稿生成（LLMは --llm-delay-ms 待ってから固定の文章を返すスタブ）を走らせながら、
+              同じ crud のリクエストを送る。生成の待ち時間中に接続プールを使い切ると、crud 側がタイムアウトや500になる。
+
+データベースは一時ディレクトリのSQLiteに、プロジェクト20件・投稿4,000件を入れてから計測する。
+--app-dir に別のチェックアウト（例: git worktree add /tmp/before <commit>）の backend を渡すと、同じ条件で比べられる。
+
+使い方（backend ディレクトリで）:
+  python benchmarks/load_test.py --concurrency 16 64 --requests 3000
+  python benchmarks/load_test.py --scenario generation --generations 15 --llm-delay-ms 2000
+  python benchmarks/load_test.py --app-dir /tmp/before/backend
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_COUNT = 20
+POSTS_PER_PROJECT = 200
+GENERATED_TEXT = "一つ目の投稿です。\n---\n二つ目の投稿です。\n---\n三つ目の投稿です。"
+
+def _serve(args):
+    """（子プロセス）データベースを用意し、LLMをスタブに差し替えてアプリを起動する"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.database}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    sys.path.insert(0, args.app_dir)
+    os.chdir(args.app_dir)
+
+    from sqlalchemy import insert
+    import uvicorn
+    import database, models
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as connection:
+        connection.execute(insert(models.Project), [
+            {"name": f"project {i}", "url": f"https://example.com/{i}"} for i in range(1, PROJECT_COUNT + 1)
+        ])
+        connection.execute(insert(models.Post), [
+            {"content": f"投稿 {i}-{j} 自動化", "project_id": i, "status": "draft"}
+            for i in range(1, PROJECT_COUNT + 1) for j in range(POSTS_PER_PROJECT)
+        ])
+        connection.execute(insert(models.Setting), [{"key": "default_post_prompt", "value": "{{project_name}} の投稿を作成してください。"}])
+    try:
+        import search
+        search.init(database.engine)
+    except ImportError:
+        pass
+
+    try:
+        import llm
+    except ImportError:
+        llm = None
+    if llm is not None:
+        async def generate(prompt, *positional, **keywords):
+            await asyncio.sleep(args.llm_delay_ms / 1000)
+            return GENERATED_TEXT
+        llm.generate = generate
+
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, lifespan="off", log_level="warning")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_server(args) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    database = os.path.join(tempfile.mkdtemp(prefix="load-test-"), "load.db")
+    process = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--app-dir", os.path.abspath(args.app_dir), "--database", database,
+        "--port", str(port), "--llm-delay-ms", str(args.llm_delay_ms),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            httpx.get(f"{base_url}/characters/", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError("The app exited before it started listening")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The app did not start listening")
+
+class HTTPStatusError(Exception):
+    pass
+
+class _Connection:
+    """
+    1本のキープアライブ接続でリクエストを1つずつ送る、計測用の最小限の HTTP/1.1 クライアント。
+    httpx は同時接続数が多いとクライアント側のCPU使用量が大きく増え、同じCPUで動くサーバーの計測を歪めるので使わない。
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method: str, path: str, payload: dict | None = None) -> bytes:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if payload is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        try:
+            self._writer.write(head.encode() + b"\r\n" + body)
+            status_code = int((await self._reader.readline()).split()[1])
+            headers = {}
+            while (line := await self._reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                response_body = await self._reader.readexactly(int(headers["content-length"]))
+            elif headers.get("transfer-encoding") == "chunked":
+                response_body = b""
+                while size := int((await self._reader.readline()).strip(), 16):
+                    response_body += await self._reader.readexactly(size + 2)
+                await self._reader.readline()
+            else:
+                response_body = b""
+        except Exception:
+            self.close()
+            raise
+        if status_code >= 400:
+            raise HTTPStatusError(f"{method} {path}: {status_code}")
+        return response_body
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+async def _crud_request(connection: _Connection, write_ratio: float) -> float:
+    started = time.perf_counter()
+    roll = random.random()
+    if roll < write_ratio:
+        await connection.request("PUT", f"/posts/{random.randint(1, PROJECT_COUNT * POSTS_PER_PROJECT)}", {"content": "更新 自動化"})
+    elif roll < write_ratio + (1 - write_ratio) * 0.5:
+        await connection.request("GET", f"/posts?limit=20&project_id={random.randint(1, PROJECT_COUNT)}")
+    elif roll < write_ratio + (1 - write_ratio) * 0.75:
+        await connection.request("GET", "/projects/summaries")
+    else:
+        await connection.request("GET", "/characters/")
+    return time.perf_counter() - started
+
+def _percentile(latencies: list[float], ratio: float) -> float:
+    return latencies[min(int(len(latencies) * ratio), len(latencies) - 1)] * 1000
+
+async def _run_crud(base_url: str, concurrency: int, total: int, write_ratio: float, generations: int = 0) -> dict:
+    host, port = base_url.removeprefix("http://").split(":")
+    connections = [_Connection(host, int(port)) for _ in range(concurrency)]
+    for connection in connections:
+        await _crud_request(connection, write_ratio)
+
+    latencies = []
+    errors = []
+    remaining = total
+
+    async def client(connection: _Connection):
+        # 同時接続数ぶんのクライアントが、それぞれ自分の接続で次のリクエストを送り続ける
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                latencies.append(await _crud_request(connection, write_ratio))
+            except (OSError, asyncio.IncompleteReadError, HTTPStatusError) as e:
+                # 失敗したリクエストも、失敗が返るまでの時間をレイテンシに含める（プール待ちのタイムアウトは遅い応答として数える）
+                latencies.append(time.perf_counter() - started)
+                errors.append(type(e).__name__)
+
+    crud_done = asyncio.Event()
+    generation_results = []
+
+    async def generate(project_id: int):
+        # crud のリクエストを送り終えるまで、生成をくり返す
+        connection = _Connection(host, int(port))
+        try:
+            while not crud_done.is_set():
+                try:
+                    await connection.request("POST", f"/projects/{project_id}/generate-posts", {"no_cache": True})
+                    generation_results.append(None)
+                except (OSError, asyncio.IncompleteReadError, HTTPStatusError) as e:
+                    generation_results.append(type(e).__name__)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    generation_tasks = [asyncio.create_task(generate(i % PROJECT_COUNT + 1)) for i in range(generations)]
+    # 生成がLLMの応答を待っている間に crud のリクエストを送る
+    await asyncio.sleep(0.2 if generations else 0)
+    await asyncio.gather(*(client(connection) for connection in connections))
+    elapsed = time.perf_counter() - started
+    crud_done.set()
+    await asyncio.gather(*generation_tasks)
+    for connection in connections:
+        connection.close()
+
+    latencies.sort()
+    return {
+        "rps": (len(latencies) - len(errors)) / elapsed,
+        "p50": _percentile(latencies, 0.5) if latencies else 0.0,
+        "p99": _percentile(latencies, 0.99) if latencies else 0.0,
+        "errors": len(errors),
+        "generations": len(generation_results),
+        "generation_errors": sum(1 for result in generation_results if result),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=BACKEND_DIR)
+    parser.add_argument("--scenario", choices=["crud", "generation"], default="crud")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--generations", type=int, default=15)
+    parser.add_argument("--llm-delay-ms", type=int, default=2000)
+    # 子プロセスでアプリを起動するときの引数
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args)
+        return
+
+    # timeout コマンドなどで止められても、起動したアプリのプロセスを残さない
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    process, base_url = _start_server(args)
+    try:
+        generations = args.generations if args.scenario == "generation" else 0
+        print(f"{args.app_dir} ({args.scenario}{f', {generations} generations x {args.llm_delay_ms} ms' if generations else ''})")
+        for concurrency in args.concurrency:
+            result = asyncio.run(_run_crud(base_url, concurrency, args.requests, args.write_ratio, generations))
+            line = f"concurrency {concurrency:>3}: {result['rps']:6.0f} req/s  p50 {result['p50']:6.0f} ms  p99 {result['p99']:6.0f} ms  errors {result['errors']}"
+            if generations:
+                line += f"  failed generations {result['generation_errors']}/{result['generations']}"
+            print(line)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,19 @@ load_dotenv()
 class Settings:
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # APIのエンドポイントが使う非同期ドライバのURL。未指定なら DATABASE_URL から作る（sqlite → aiosqlite、postgresql → asyncpg）
+    ASYNC_DATABASE_URL: str | None = os.getenv("ASYNC_DATABASE_URL")
 
     # Gemini AI
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    # Geminiへの同時リクエスト数の上限と、1回の呼び出しのタイムアウト秒数
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+    # 生成結果のディスクキャッシュ（既定では無効）
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
 
     # X (Twitter) API
     X_API_KEY: str = os.getenv("X_API_KEY")
@@ -22,5 +32,83 @@ class Settings:
     CLOUDINARY_API_KEY: str = os.getenv("CLOUDINARY_API_KEY")
     CLOUDINARY_API_SECRET: str = os.getenv("CLOUDINARY_API_SECRET")
 
+    # X APIとのHTTP接続（キープアライブで使い回すコネクション数とタイムアウト秒数）
+    X_HTTP_POOL_SIZE: int = int(os.getenv("X_HTTP_POOL_SIZE", "10"))
+    X_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("X_HTTP_CONNECT_TIMEOUT", "5"))
+    X_HTTP_READ_TIMEOUT: float = float(os.getenv("X_HTTP_READ_TIMEOUT", "30"))
+
+    # 画像付き投稿のメディア処理
+    # ダウンロードした画像はこのサイズまではメモリに置き、超えたら一時ファイルに書き出す
+    X_MEDIA_SPOOL_MAX_BYTES: int = int(os.getenv("X_MEDIA_SPOOL_MAX_BYTES", str(1024 * 1024)))
+    # これより大きいメディアはチャンクアップロードで少しずつ送る
+    X_MEDIA_CHUNKED_THRESHOLD: int = int(os.getenv("X_MEDIA_CHUNKED_THRESHOLD", str(1024 * 1024)))
+    X_MEDIA_MAX_BYTES: int = int(os.getenv("X_MEDIA_MAX_BYTES", str(15 * 1024 * 1024)))
+    # 再利用する media_id のキャッシュ件数
+    X_MEDIA_CACHE_SIZE: int = int(os.getenv("X_MEDIA_CACHE_SIZE", "256"))
+
+    # 投稿画像のアップロード
+    IMAGE_UPLOAD_MAX_BYTES: int = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    IMAGE_UPLOAD_WORKERS: int = int(os.getenv("IMAGE_UPLOAD_WORKERS", "4"))
+
+    # 予約投稿のディスパッチ
+    POST_DISPATCH_WORKERS: int = int(os.getenv("POST_DISPATCH_WORKERS", "8"))
+    POST_DISPATCH_BATCH_SIZE: int = int(os.getenv("POST_DISPATCH_BATCH_SIZE", "50"))
+    # 429や5xxなど一時的なエラーの再試行（指数バックオフ＋ジッター）
+    POST_MAX_RETRIES: int = int(os.getenv("POST_MAX_RETRIES", "5"))
+    POST_RETRY_BASE_SECONDS: float = float(os.getenv("POST_RETRY_BASE_SECONDS", "30"))
+    POST_RETRY_MAX_SECONDS: float = float(os.getenv("POST_RETRY_MAX_SECONDS", "900"))
+    # 0より大きい場合、他のレプリカで予約された投稿を拾うためにN分ごとにタイマーをDBと再同期する
+    POST_TIMER_RESYNC_MINUTES: int = int(os.getenv("POST_TIMER_RESYNC_MINUTES", "0"))
+    # 送信中（posting）のままこの分数を過ぎた投稿は、プロセスが途中で止まったとみなして失敗にする（0で確認しない）
+    POST_POSTING_STALE_MINUTES: int = int(os.getenv("POST_POSTING_STALE_MINUTES", "15"))
+    # 0より大きい場合、他のレプリカで止まった投稿を拾うためにN分ごとにも確認する（既定では起動時と、その時点で残っていた投稿の期限にだけ確認する）
+    POST_POSTING_STALE_CHECK_MINUTES: int = int(os.getenv("POST_POSTING_STALE_CHECK_MINUTES", "0"))
+
+    # メトリクスの更新（N分ごとに次回更新時刻を過ぎたツイートを確認する。0分を指定すると定期実行しない）
+    METRICS_REFRESH_INTERVAL_MINUTES: int = int(os.getenv("METRICS_REFRESH_INTERVAL_MINUTES", "15"))
+    METRICS_REFRESH_CONCURRENCY: int = int(os.getenv("METRICS_REFRESH_CONCURRENCY", "4"))
+
+    # 一括生成ジョブ
+    GENERATION_JOB_WORKERS: int = int(os.getenv("GENERATION_JOB_WORKERS", "4"))
+    # 一括生成がGeminiに送るリクエスト数の上限（1分あたり）。画面からの生成のために枠を残しておく
+    GENERATION_JOB_REQUESTS_PER_MINUTE: float = float(os.getenv("GENERATION_JOB_REQUESTS_PER_MINUTE", "30"))
+    GENERATION_JOB_MAX_ATTEMPTS: int = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+    GENERATION_JOB_MAX_ITEMS: int = int(os.getenv("GENERATION_JOB_MAX_ITEMS", "1000"))
+    # 0より大きい場合、他のレプリカで登録されたジョブを拾うためにN秒ごとに読み取りだけのクエリで確認する
+    GENERATION_JOB_POLL_SECONDS: float = float(os.getenv("GENERATION_JOB_POLL_SECONDS", "0"))
+
+    # プロンプトテンプレートなどの設定と、キャラクター・ペルソナのキャッシュ。他のプロセスでの更新を、最長でこの秒数の遅れで反映する
+    SETTINGS_CACHE_POLL_SECONDS: float = float(os.getenv("SETTINGS_CACHE_POLL_SECONDS", "5"))
+
+    # プロジェクトURLの読み込みとAI要約（バックグラウンドで同時に処理する件数）
+    ENRICHMENT_WORKERS: int = int(os.getenv("ENRICHMENT_WORKERS", "4"))
+    PROJECT_BULK_IMPORT_MAX_ITEMS: int = int(os.getenv("PROJECT_BULK_IMPORT_MAX_ITEMS", "500"))
+
+    # プロジェクトURLの定期再クロール（N時間ごと。0を指定すると定期実行しない）
+    RECRAWL_INTERVAL_HOURS: float = float(os.getenv("RECRAWL_INTERVAL_HOURS", "24"))
+    RECRAWL_CONCURRENCY: int = int(os.getenv("RECRAWL_CONCURRENCY", "4"))
+    # 同じホストへのリクエストの最小間隔（秒）。同じホストには1件ずつしかアクセスしない
+    CRAWL_HOST_MIN_INTERVAL_SECONDS: float = float(os.getenv("CRAWL_HOST_MIN_INTERVAL_SECONDS", "5"))
+    # 1ページから読み込む上限（ダウンロードするバイト数と、抽出するテキストの文字数）
+    SCRAPE_MAX_BYTES: int = int(os.getenv("SCRAPE_MAX_BYTES", str(2 * 1024 * 1024)))
+    SCRAPE_MAX_CHARS: int = int(os.getenv("SCRAPE_MAX_CHARS", "50000"))
+    # ページ要約のチャンクの最大文字数と、1ページの要約に読み込むテキストの上限（トークン数の見積もり）
+    SUMMARY_CHUNK_CHARS: int = int(os.getenv("SUMMARY_CHUNK_CHARS", "4000"))
+    SUMMARY_TOKEN_BUDGET: int = int(os.getenv("SUMMARY_TOKEN_BUDGET", "32000"))
+
+    # データベースの接続プール（SQLiteのメモリDBでは使わない）
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    # 空きの接続がないときに待つ秒数（超えるとエラー）
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # この秒数より古い接続は作り直す（DBやプロキシにアイドル接続を切られる前に）。-1で作り直さない
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # 接続を使う前に生きているか確かめ、切れていれば作り直す（SQLiteのファイルへの接続は切れないので確かめない）
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # SQLiteで他の接続が書き込み中のとき、"database is locked" にせず待つ時間（ミリ秒）
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+    # SQLiteの synchronous（WALモードでは NORMAL でも、電源断以外でデータは失われない）
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
 # 設定のインスタンスを作成して、他のファイルから使えるようにする
 settings = Settings()
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import database, crud, utils
+from config import settings
+
+class HostGate:
+    """
+    同じホストへのアクセスを1件ずつに制限し、前回のアクセスから min_interval 秒あける。
+    ホストごとに独立しているので、別々のホストへのアクセスは並行して進む。
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._last_access: dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            last_access = self._last_access.get(host)
+            if last_access is not None:
+                delay = last_access + self.min_interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                yield
+            finally:
+                self._last_access[host] = loop.time()
+
+_gate = HostGate(settings.CRAWL_HOST_MIN_INTERVAL_SECONDS)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _get_cache(url: str):
+    db = database.SessionLocal()
+    try:
+        db_cache = crud.get_crawl_cache(db, url=url)
+        if db_cache is None:
+            return None
+        return {
+            "etag": db_cache.etag,
+            "last_modified": db_cache.last_modified,
+            "content_hash": db_cache.content_hash,
+            "text": db_cache.text,
+        }
+    finally:
+        db.close()
+
+def _save_cache(url: str, page: dict, text_hash: str | None):
+    db = database.SessionLocal()
+    try:
+        crud.save_crawl_cache(
+            db,
+            url=url,
+            text=page["text"],
+            content_hash=text_hash,
+            etag=page["etag"],
+            last_modified=page["last_modified"],
+            fetched_at=datetime.now(timezone.utc)
+        )
+    finally:
+        db.close()
+
+def _save_summarized_hash(url: str, text_hash: str):
+    db = database.SessionLocal()
+    try:
+        crud.update_crawl_cache_hash(db, url=url, content_hash=text_hash)
+    finally:
+        db.close()
+
+def _touch_cache(url: str):
+    db = database.SessionLocal()
+    try:
+        crud.touch_crawl_cache(db, url=url, checked_at=datetime.now(timezone.utc))
+    finally:
+        db.close()
+
+async def fetch_page(url: str) -> tuple[str | None, bool]:
+    """
+    URLのテキストを、前回の取得結果を使った条件付きGETで取得する。
+    (テキスト, 最後に要約したときから内容が変わったか) を返す。304のときはキャッシュしておいたテキストを返し、取得に失敗したらテキストは None。
+    要約できたら、呼び出し側で mark_summarized を呼ぶ（要約に失敗したときは、次回も変更ありとして扱われる）。
+    """
+    cached = await asyncio.to_thread(_get_cache, url)
+    async with _gate.slot(urlparse(url).netloc.lower()):
+        page = await asyncio.to_thread(
+            utils.fetch_page_text,
+            url,
+            cached["etag"] if cached else None,
+            cached["last_modified"] if cached else None,
+            settings.SCRAPE_MAX_BYTES,
+            settings.SCRAPE_MAX_CHARS
+        )
+    if page is None:
+        return None, False
+    if page["not_modified"] and cached:
+        await asyncio.to_thread(_touch_cache, url)
+        changed = not cached["text"] or cached["content_hash"] != content_hash(cached["text"])
+        return cached["text"], changed
+    if page["not_modified"]:
+        # キャッシュがないのに304が返ることはないはずだが、念のため条件なしで取り直す
+        async with _gate.slot(urlparse(url).netloc.lower()):
+            page = await asyncio.to_thread(utils.fetch_page_text, url, None, None, settings.SCRAPE_MAX_BYTES, settings.SCRAPE_MAX_CHARS)
+        if page is None or page["not_modified"]:
+            return None, False
+
+    # content_hash は要約が済んだときに mark_summarized で更新するので、ここでは前回の値のまま保存する
+    summarized_hash = cached["content_hash"] if cached else None
+    await asyncio.to_thread(_save_cache, url, page, summarized_hash)
+    changed = not page["text"] or summarized_hash != content_hash(page["text"])
+    return page["text"], changed
+
+async def mark_summarized(url: str, text: str):
+    """fetch_page で受け取ったテキストの要約が保存できたことを記録する（次回から、同じ内容なら変更なしとみなす）"""
+    await asyncio.to_thread(_save_summarized_hash, url, content_hash(text))
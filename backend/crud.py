@@ -1,116 +1,571 @@
-from sqlalchemy.orm import Session
-from datetime import datetime
+import itertools
+import json
+from sqlalchemy import and_, case, func, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from datetime import datetime, timezone, timedelta
 import models
 import schemas
+import search
+
+def _update_returning(db: Session, model, key_column, key, values: dict):
+    """
+    1行を UPDATE ... RETURNING の1文で更新し、更新後の行を返す関数（該当する行がなければ None。コミットは呼び出し側で行う）。
+    返すのはORMのオブジェクトではなく行なので、コミット後に属性を読んでも再読み込みのSELECTは走らない。
+    RETURNING に対応したDB（SQLite 3.35 以降・PostgreSQL）が前提で、投稿やジョブの確保（claim_due_posts など）も
+    RETURNING に頼っている。対応していないDBでは、起動時に database.check_returning_support がエラーにする。
+    """
+    columns = model.__table__.c
+    if not values:
+        return db.execute(select(*columns).where(key_column == key)).first()
+    stmt = update(model).where(key_column == key).values(**values).execution_options(synchronize_session=False)
+    return db.execute(stmt.returning(*columns)).first()
 
 # --- Project CRUD ---
 def get_project(db: Session, project_id: int):
     return db.query(models.Project).filter(models.Project.id == project_id).first()
 
+def get_project_detail(db: Session, project_id: int):
+    """投稿とnote記事をまとめて読み込んだプロジェクトを返す関数（プロジェクト1件・投稿・記事の3クエリで済む）"""
+    return db.query(models.Project).options(
+        selectinload(models.Project.posts),
+        selectinload(models.Project.note_articles)
+    ).filter(models.Project.id == project_id).first()
+
 def get_projects(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Project).order_by(models.Project.id.desc()).offset(skip).limit(limit).all()
+    return db.query(models.Project).options(
+        selectinload(models.Project.posts),
+        selectinload(models.Project.note_articles)
+    ).order_by(models.Project.id.desc()).offset(skip).limit(limit).all()
+
+def get_project_list(db: Session, limit: int = 50, before_id: int | None = None):
+    """
+    一覧表示用に、プロジェクトの基本項目と状態ごとの投稿数を1回のクエリで返す関数。
+    ID の降順に並べ、before_id より小さいIDのプロジェクトから limit 件を返す（キーセット・ページネーション）。
+    """
+    page = select(
+        models.Project.id,
+        models.Project.name,
+        models.Project.url,
+        models.Project.hashtags,
+        models.Project.enrichment_status,
+        models.Project.created_at,
+        models.Project.updated_at
+    ).order_by(models.Project.id.desc()).limit(limit)
+    if before_id is not None:
+        page = page.where(models.Project.id < before_id)
+    page = page.subquery()
+
+    Post = models.Post
+    query = select(
+        page,
+        func.count(case((Post.status == "draft", 1))).label("draft_count"),
+        func.count(case((Post.status == "scheduled", 1))).label("scheduled_count"),
+        func.count(case((Post.status == "posted", 1))).label("posted_count")
+    ).outerjoin(Post, Post.project_id == page.c.id).group_by(*page.c).order_by(page.c.id.desc())
+    return db.execute(query).all()
 
-def create_project(db: Session, project: schemas.ProjectCreate, research_summary: str | None = None):
+def create_project(db: Session, project: schemas.ProjectCreate, research_summary: str | None = None, enrichment_status: str = "pending"):
     db_project = models.Project(
         name=project.name, 
         url=project.url, 
         research_summary=research_summary,
-        hashtags=project.hashtags
+        hashtags=project.hashtags,
+        enrichment_status=enrichment_status
     )
     db.add(db_project)
+    db.flush()
+    search.index_projects(db, [db_project])
     db.commit()
     db.refresh(db_project)
     return db_project
 
-def update_project(db: Session, project_id: int, project: schemas.ProjectCreate):
-    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
+def create_projects(db: Session, projects: list[schemas.ProjectCreate]):
+    """複数のプロジェクトを1文のINSERTでまとめて作成する関数（要約は後からバックグラウンドで行う）"""
+    if not projects:
+        return []
+    projects_table = models.Project.__table__
+    db_projects = db.execute(
+        insert(projects_table).returning(*projects_table.c, sort_by_parameter_order=True),
+        [
+            {"name": project.name, "url": project.url, "hashtags": project.hashtags, "enrichment_status": "pending"}
+            for project in projects
+        ]
+    ).all()
+    search.index_projects(db, db_projects)
+    db.commit()
+    return db_projects
+
+def get_pending_enrichment_project_ids(db: Session):
+    """
+    要約待ちのプロジェクトIDを返す関数（起動時の再登録用）。
+    前回のプロセスが処理中のまま止まったプロジェクトも、要約待ちに戻してから返す。
+    """
+    db.execute(
+        update(models.Project)
+        .where(models.Project.enrichment_status == "running")
+        .values(enrichment_status="pending")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    rows = db.query(models.Project.id).filter(models.Project.enrichment_status == "pending").order_by(models.Project.id).all()
+    return [project_id for project_id, in rows]
+
+def claim_project_enrichment(db: Session, project_id: int):
+    """要約待ちのプロジェクトを "running" にして確保し、URLを返す関数（他のワーカーが確保済みなら None）"""
+    url = db.execute(
+        update(models.Project)
+        .where(models.Project.id == project_id, models.Project.enrichment_status == "pending")
+        .values(enrichment_status="running", enrichment_error=None)
+        .returning(models.Project.url)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    return url
+
+# 検索の索引に入れるプロジェクトの列
+_PROJECT_SEARCH_COLUMNS = (
+    models.Project.id,
+    models.Project.name,
+    models.Project.hashtags,
+    models.Project.research_summary,
+    models.Project.latest_ai_response
+)
+
+def finish_project_enrichment(db: Session, project_id: int, status: str, research_summary: str | None = None, error: str | None = None):
+    values = {"enrichment_status": status, "enrichment_error": error}
+    if research_summary is not None:
+        values["research_summary"] = research_summary
+    db_project = db.execute(
+        update(models.Project)
+        .where(models.Project.id == project_id)
+        .values(**values)
+        .returning(*_PROJECT_SEARCH_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if db_project is not None and research_summary is not None:
+        search.index_projects(db, [db_project])
+    db.commit()
+
+def _update_project(db: Session, project_id: int, values: dict):
+    db_project = _update_returning(db, models.Project, models.Project.id, project_id, values)
     if db_project:
-        db_project.name = project.name
-        db_project.url = project.url
-        db_project.hashtags = project.hashtags
+        search.index_projects(db, [db_project])
         db.commit()
-        db.refresh(db_project)
     return db_project
 
+def update_project(db: Session, project_id: int, project: schemas.ProjectCreate):
+    return _update_project(db, project_id, {"name": project.name, "url": project.url, "hashtags": project.hashtags})
+
 def update_project_summary(db: Session, project_id: int, summary: str):
-    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if db_project:
-        db_project.research_summary = summary
-        db.commit()
-        db.refresh(db_project)
-    return db_project
+    return _update_project(db, project_id, {"research_summary": summary})
 
 def update_project_ai_response(db: Session, project_id: int, ai_response: str):
-    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if db_project:
-        db_project.latest_ai_response = ai_response
-        db.commit()
-        db.refresh(db_project)
-    return db_project
+    return _update_project(db, project_id, {"latest_ai_response": ai_response})
 
 def delete_project(db: Session, project_id: int):
     db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
     if db_project:
         # The relationship cascade will handle deleting associated posts and note_articles
         db.delete(db_project)
+        search.remove_project(db, project_id)
         db.commit()
         return {"ok": True}
     return None
 
+def get_project_urls_for_recrawl(db: Session):
+    """要約待ち・処理中ではないプロジェクトの (id, url) を返す関数（定期再クロール用）"""
+    return db.query(models.Project.id, models.Project.url).filter(
+        models.Project.enrichment_status.not_in(["pending", "running"])
+    ).order_by(models.Project.id).all()
+
+# --- CrawlCache CRUD ---
+def get_crawl_cache(db: Session, url: str):
+    return db.query(models.CrawlCache).filter(models.CrawlCache.url == url).first()
+
+def save_crawl_cache(db: Session, url: str, text: str | None, content_hash: str | None, etag: str | None, last_modified: str | None, fetched_at: datetime):
+    db_cache = db.query(models.CrawlCache).filter(models.CrawlCache.url == url).first()
+    if not db_cache:
+        db_cache = models.CrawlCache(url=url)
+        db.add(db_cache)
+    db_cache.text = text
+    db_cache.content_hash = content_hash
+    db_cache.etag = etag
+    db_cache.last_modified = last_modified
+    db_cache.fetched_at = fetched_at
+    db_cache.checked_at = fetched_at
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同じURLを別のワーカーが同時に保存した場合は、その行を上書きし直す
+        db.rollback()
+        return save_crawl_cache(db, url, text, content_hash, etag, last_modified, fetched_at)
+    db.refresh(db_cache)
+    return db_cache
+
+def update_crawl_cache_hash(db: Session, url: str, content_hash: str):
+    """要約が済んだテキストのハッシュを記録する関数"""
+    db.execute(
+        update(models.CrawlCache)
+        .where(models.CrawlCache.url == url)
+        .values(content_hash=content_hash)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+def touch_crawl_cache(db: Session, url: str, checked_at: datetime):
+    db.execute(
+        update(models.CrawlCache)
+        .where(models.CrawlCache.url == url)
+        .values(checked_at=checked_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+# --- ChunkSummary CRUD ---
+def get_chunk_summaries(db: Session, chunk_hashes: list[str]) -> dict[str, str]:
+    if not chunk_hashes:
+        return {}
+    rows = db.query(models.ChunkSummary.chunk_hash, models.ChunkSummary.summary).filter(
+        models.ChunkSummary.chunk_hash.in_(chunk_hashes)
+    ).all()
+    return dict(rows)
+
+def save_chunk_summaries(db: Session, summaries: dict[str, str], model_name: str):
+    """チャンクの要約をまとめて保存する関数（別のワーカーが先に保存した行はそのまま残す）"""
+    existing = get_chunk_summaries(db, chunk_hashes=list(summaries))
+    rows = [
+        {"chunk_hash": chunk_hash, "model": model_name, "summary": summary}
+        for chunk_hash, summary in summaries.items() if chunk_hash not in existing
+    ]
+    if not rows:
+        return
+    try:
+        db.execute(insert(models.ChunkSummary), rows)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
 # --- Post CRUD ---
 def get_post(db: Session, post_id: int):
     return db.query(models.Post).filter(models.Post.id == post_id).first()
 
-def create_project_post(db: Session, post: schemas.PostCreate, project_id: int):
-    db_post = models.Post(**post.model_dump(), project_id=project_id)
+# GET /posts の並び順（並べる列と昇順かどうか）。同じ値の投稿は id で並べる
+POST_SORT_ORDERS = {
+    "created_at": (models.Post.created_at, False),
+    "scheduled_at": (models.Post.scheduled_at, True),
+    "posted_at": (models.Post.posted_at, False),
+}
+
+def get_posts(
+    db: Session,
+    sort: str = "created_at",
+    statuses: list[str] | None = None,
+    project_id: int | None = None,
+    scheduled_from: datetime | None = None,
+    scheduled_to: datetime | None = None,
+    posted_from: datetime | None = None,
+    posted_to: datetime | None = None,
+    after: tuple | None = None,
+    limit: int = 50,
+):
+    """
+    投稿を絞り込んで、(並べる列, id) の順に limit 件返す関数。
+    after に前のページの最後の (値, id) を渡すと、その続きから返す（キーセット・ページネーション）。
+    """
+    column, ascending = POST_SORT_ORDERS[sort]
+    query = db.query(models.Post).filter(column.is_not(None))
+    if statuses:
+        query = query.filter(models.Post.status.in_(statuses))
+    if project_id is not None:
+        query = query.filter(models.Post.project_id == project_id)
+    if scheduled_from is not None:
+        query = query.filter(models.Post.scheduled_at >= scheduled_from)
+    if scheduled_to is not None:
+        query = query.filter(models.Post.scheduled_at < scheduled_to)
+    if posted_from is not None:
+        query = query.filter(models.Post.posted_at >= posted_from)
+    if posted_to is not None:
+        query = query.filter(models.Post.posted_at < posted_to)
+    if after is not None:
+        key = tuple_(column, models.Post.id)
+        query = query.filter(key > tuple_(*after) if ascending else key < tuple_(*after))
+    if ascending:
+        query = query.order_by(column.asc(), models.Post.id.asc())
+    else:
+        query = query.order_by(column.desc(), models.Post.id.desc())
+    return query.limit(limit).all()
+
+def create_project_post(db: Session, post: schemas.PostCreate, project_id: int, character_id: int | None = None):
+    db_post = models.Post(**post.model_dump(), project_id=project_id, character_id=character_id)
     db.add(db_post)
+    db.flush()
+    search.index_posts(db, [db_post])
     db.commit()
     db.refresh(db_post)
     return db_post
 
-def update_post(db: Session, post_id: int, content: str):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+def _insert_project_posts(db: Session, contents: list[str], project_id: int, character_id: int | None = None, ai_response: str | None = None):
+    """
+    投稿をまとめて1文のINSERTで追加し、追加した行をRETURNINGでそのまま受け取る（コミットは呼び出し側で行う）。
+    ai_response を渡すと、同じトランザクションでプロジェクトの latest_ai_response も更新する。
+    """
+    if ai_response is not None:
+        db_project = db.execute(
+            update(models.Project)
+            .where(models.Project.id == project_id)
+            .values(latest_ai_response=ai_response)
+            .returning(*_PROJECT_SEARCH_COLUMNS)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if db_project is not None:
+            search.index_projects(db, [db_project])
+    if not contents:
+        return []
+    posts_table = models.Post.__table__
+    db_posts = db.execute(
+        # 複数行のINSERTでも、RETURNINGの行を渡した順（＝生成順）で受け取る
+        insert(posts_table).returning(*posts_table.c, sort_by_parameter_order=True),
+        [{"content": content, "project_id": project_id, "character_id": character_id} for content in contents]
+    ).all()
+    search.index_posts(db, db_posts)
+    return db_posts
+
+def create_project_posts(db: Session, contents: list[str], project_id: int, character_id: int | None = None, ai_response: str | None = None):
+    """生成された投稿を1回のトランザクションで保存する関数（途中で失敗しても、一部だけ保存されることはない）"""
+    db_posts = _insert_project_posts(db, contents, project_id=project_id, character_id=character_id, ai_response=ai_response)
+    db.commit()
+    return db_posts
+
+def _update_post(db: Session, post_id: int, values: dict):
+    db_post = _update_returning(db, models.Post, models.Post.id, post_id, values)
     if db_post:
-        db_post.content = content
         db.commit()
-        db.refresh(db_post)
     return db_post
 
-def update_post_status(db: Session, post_id: int, status: str, tweet_id: str | None = None):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+def update_post(db: Session, post_id: int, content: str):
+    db_post = _update_returning(db, models.Post, models.Post.id, post_id, {"content": content})
     if db_post:
-        db_post.status = status
-        if tweet_id:
-            db_post.tweet_id = tweet_id
+        search.index_posts(db, [db_post])
         db.commit()
-        db.refresh(db_post)
     return db_post
 
+def update_post_status(db: Session, post_id: int, status: str, tweet_id: str | None = None, failure_reason: str | None = None):
+    values = {"status": status}
+    if tweet_id:
+        values["tweet_id"] = tweet_id
+    if failure_reason:
+        values["failure_reason"] = failure_reason
+    elif status == "posted":
+        values["failure_reason"] = None
+    if status == "posted":
+        values["posted_at"] = datetime.now(timezone.utc)
+        values["metrics_refresh_due_at"] = values["posted_at"] + FIRST_METRICS_REFRESH_DELAY
+    return _update_post(db, post_id, values)
+
+def get_scheduled_post_times(db: Session):
+    """予約中の投稿のIDと予約時刻だけを返す関数（タイマーの初期化用）"""
+    return db.query(models.Post.id, models.Post.scheduled_at).filter(
+        models.Post.status == "scheduled",
+        models.Post.scheduled_at.is_not(None)
+    ).all()
+
+def claim_due_posts(db: Session, now: datetime, limit: int):
+    """
+    予約時間を過ぎた投稿を "posting" 状態にして確保し、確保できた投稿を返す関数。
+    他のワーカーがロック中の行はスキップするので、複数のレプリカから同時に呼ばれても
+    同じ投稿が二重に確保されることはない。
+    """
+    due_post_ids = (
+        select(models.Post.id)
+        .where(models.Post.status == "scheduled", models.Post.scheduled_at <= now)
+        .order_by(models.Post.scheduled_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(models.Post)
+        .where(models.Post.id.in_(due_post_ids), models.Post.status == "scheduled")
+        .values(status="posting", posting_started_at=now)
+        .returning(models.Post.id, models.Post.content, models.Post.image_url, models.Post.retry_count)
+        .execution_options(synchronize_session=False)
+    )
+    claimed_posts = db.execute(stmt).all()
+    db.commit()
+    return claimed_posts
+
+def fail_posting_posts(db: Session, failure_reason: str, started_before: datetime | None = None, post_ids: list[int] | None = None):
+    """
+    送信中（"posting"）のまま残った投稿を "failed" にして、そのIDを返す関数。
+    started_before を渡すとそれより前に確保された投稿だけ、post_ids を渡すとその投稿だけを対象にする。
+    Xに届いたかどうか分からない投稿なので、二重投稿を避けるため予約状態には戻さない。
+    """
+    conditions = [models.Post.status == "posting"]
+    if started_before is not None:
+        conditions.append(or_(models.Post.posting_started_at.is_(None), models.Post.posting_started_at < started_before))
+    if post_ids is not None:
+        conditions.append(models.Post.id.in_(post_ids))
+    # 該当する投稿がなければ、書き込みのトランザクションを始めずに済ませる
+    if db.query(models.Post.id).filter(*conditions).first() is None:
+        return []
+    failed_post_ids = db.execute(
+        update(models.Post)
+        .where(*conditions)
+        .values(status="failed", failure_reason=failure_reason)
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return failed_post_ids
+
+def get_oldest_posting_started_at(db: Session) -> datetime | None:
+    """送信中（"posting"）の投稿のうち、最も古い確保時刻を返す関数"""
+    return db.query(func.min(models.Post.posting_started_at)).filter(models.Post.status == "posting").scalar()
+
+def defer_post(db: Session, post_id: int, retry_at: datetime, failure_reason: str | None = None, count_retry: bool = False):
+    """確保済みの投稿を予約状態に戻し、retry_at に再送させる関数"""
+    values = {"status": "scheduled", "scheduled_at": retry_at}
+    if failure_reason:
+        values["failure_reason"] = failure_reason
+    if count_retry:
+        values["retry_count"] = func.coalesce(models.Post.retry_count, 0) + 1
+    db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+def get_dispatch_queue_counts(db: Session, now: datetime):
+    """送信待ち（予約時刻を過ぎた投稿）と送信中の投稿の件数を1回のクエリで数える関数"""
+    due_count, posting_count = db.query(
+        func.count(case((and_(models.Post.status == "scheduled", models.Post.scheduled_at <= now), 1))),
+        func.count(case((models.Post.status == "posting", 1)))
+    ).filter(models.Post.status.in_(["scheduled", "posting"])).one()
+    return due_count, posting_count
+
 def schedule_post(db: Session, post_id: int, scheduled_at: datetime):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if db_post:
-        db_post.scheduled_at = scheduled_at
-        db_post.status = "scheduled"
-        db.commit()
-        db.refresh(db_post)
-    return db_post
+    return _update_post(db, post_id, {"scheduled_at": scheduled_at, "status": "scheduled"})
 
 def update_post_image_url(db: Session, post_id: int, image_url: str):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if db_post:
-        db_post.image_url = image_url
+    return _update_post(db, post_id, {"image_url": image_url})
+
+# X APIのメトリクスのうち、Postに保存する項目
+POST_METRIC_FIELDS = ("retweet_count", "reply_count", "like_count", "impression_count")
+# 投稿直後、最初にメトリクスを取得するまでの時間
+FIRST_METRICS_REFRESH_DELAY = timedelta(hours=1)
+
+def _post_metric_values(metrics: dict) -> dict:
+    return {field: metrics[field] for field in POST_METRIC_FIELDS if field in metrics}
+
+def get_posts_for_metrics_refresh(db: Session, due_before: datetime | None = None):
+    """
+    投稿済みでツイートIDを持つ投稿の (post_id, tweet_id, posted_at) を返す関数。
+    due_before を渡すと、メトリクスの次回更新時刻を過ぎた投稿だけに絞り込む。
+    """
+    query = db.query(
+        models.Post.id,
+        models.Post.tweet_id,
+        func.coalesce(models.Post.posted_at, models.Post.scheduled_at, models.Post.created_at)
+    ).filter(
+        models.Post.status == "posted",
+        models.Post.tweet_id.is_not(None)
+    )
+    if due_before is not None:
+        query = query.filter(
+            (models.Post.metrics_refresh_due_at.is_(None)) | (models.Post.metrics_refresh_due_at <= due_before)
+        )
+    return query.order_by(models.Post.id).all()
+
+def bulk_update_post_metrics(db: Session, metrics_by_post_id: dict[int, dict], next_refresh_by_post_id: dict[int, datetime], captured_at: datetime):
+    """
+    複数の投稿のメトリクスを主キー指定のバルクUPDATEで書き込み、同じトランザクションで
+    履歴テーブルにスナップショットを追記する関数
+    """
+    rows = [
+        {"id": post_id, "metrics_refresh_due_at": next_refresh_by_post_id[post_id], **_post_metric_values(metrics)}
+        for post_id, metrics in metrics_by_post_id.items()
+    ]
+    if rows:
+        db.execute(update(models.Post), rows)
+        db.execute(insert(models.PostMetricSnapshot), [
+            {"post_id": post_id, "captured_at": captured_at, **_post_metric_values(metrics)}
+            for post_id, metrics in metrics_by_post_id.items()
+        ])
         db.commit()
-        db.refresh(db_post)
-    return db_post
+    return len(rows)
+
+def get_post_metric_history(db: Session, post_id: int):
+    return db.query(models.PostMetricSnapshot).filter(
+        models.PostMetricSnapshot.post_id == post_id
+    ).order_by(models.PostMetricSnapshot.captured_at).all()
+
+def get_metrics_summary(db: Session, project_id: int | None = None, character_id: int | None = None):
+    """
+    プロジェクトまたはキャラクター単位で、投稿済みツイートのメトリクス合計と日別の推移をSQLで集計する関数。
+    日別の推移は、投稿ごとにその日の最大値（カウンターは単調増加）を取ってから日ごとに合計する。
+    """
+    post_filters = [models.Post.status == "posted"]
+    if project_id is not None:
+        post_filters.append(models.Post.project_id == project_id)
+    if character_id is not None:
+        post_filters.append(models.Post.character_id == character_id)
+
+    totals = db.query(
+        func.count(models.Post.id).label("posted_count"),
+        *[func.coalesce(func.sum(getattr(models.Post, field)), 0).label(field) for field in POST_METRIC_FIELDS]
+    ).filter(*post_filters).one()
+
+    snapshot = models.PostMetricSnapshot
+    day = func.date(snapshot.captured_at).label("day")
+    per_post_per_day = (
+        select(
+            snapshot.post_id,
+            day,
+            *[func.max(getattr(snapshot, field)).label(field) for field in POST_METRIC_FIELDS]
+        )
+        .join(models.Post, models.Post.id == snapshot.post_id)
+        .where(*post_filters)
+        .group_by(snapshot.post_id, day)
+        .subquery()
+    )
+    daily = db.execute(
+        select(
+            per_post_per_day.c.day,
+            *[func.sum(per_post_per_day.c[field]).label(field) for field in POST_METRIC_FIELDS]
+        )
+        .group_by(per_post_per_day.c.day)
+        .order_by(per_post_per_day.c.day)
+    ).all()
+
+    return {**totals._asdict(), "daily": [row._asdict() for row in daily]}
 
 def delete_post(db: Session, post_id: int):
     db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if db_post:
         db.delete(db_post)
+        search.remove(db, "post", post_id)
         db.commit()
         return {"ok": True}
     return None
 
+# --- ImageAsset CRUD ---
+def get_image_asset_by_hash(db: Session, content_hash: str):
+    return db.query(models.ImageAsset).filter(models.ImageAsset.content_hash == content_hash).first()
+
+def create_image_asset(db: Session, content_hash: str, url: str, byte_size: int):
+    db_asset = models.ImageAsset(content_hash=content_hash, url=url, byte_size=byte_size)
+    db.add(db_asset)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同じ画像が同時にアップロードされた場合は、先に登録された方を使う
+        db.rollback()
+        return get_image_asset_by_hash(db, content_hash=content_hash)
+    db.refresh(db_asset)
+    return db_asset
+
 # --- Character CRUD ---
 def get_character(db: Session, character_id: int):
     return db.query(models.Character).filter(models.Character.id == character_id).first()
@@ -126,13 +581,12 @@ def create_character(db: Session, character: schemas.CharacterCreate):
     return db_character
 
 def update_character(db: Session, character_id: int, character: schemas.CharacterCreate):
-    db_character = db.query(models.Character).filter(models.Character.id == character_id).first()
+    values = character.model_dump(exclude_unset=True)
+    if values:
+        values["version"] = models.Character.version + 1
+    db_character = _update_returning(db, models.Character, models.Character.id, character_id, values)
     if db_character:
-        update_data = character.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_character, key, value)
         db.commit()
-        db.refresh(db_character)
     return db_character
 
 def delete_character(db: Session, character_id: int):
@@ -143,6 +597,20 @@ def delete_character(db: Session, character_id: int):
         return {"ok": True}
     return None
 
+# --- Character / TargetPersona 共通 ---
+def get_profile_row(db: Session, model, row_id: int):
+    """キャラクター・ペルソナの1行を、セッションに結びつかない行として返す関数（プロンプト用のキャッシュに持たせるため）"""
+    return db.execute(select(*model.__table__.c).where(model.id == row_id)).first()
+
+def get_profiles_fingerprint(db: Session):
+    """キャラクターとペルソナそれぞれの件数・バージョンの合計・IDの合計を1回のクエリで返す関数（どこかのプロセスで変わったかどうかを安く確かめるため）"""
+    columns = []
+    for model in (models.Character, models.TargetPersona):
+        columns.append(select(func.count(model.id)).scalar_subquery())
+        columns.append(select(func.coalesce(func.sum(model.version), 0)).scalar_subquery())
+        columns.append(select(func.coalesce(func.sum(model.id), 0)).scalar_subquery())
+    return tuple(db.execute(select(*columns)).one())
+
 # --- Setting CRUD ---
 def get_setting(db: Session, key: str):
     return db.query(models.Setting).filter(models.Setting.key == key).first()
@@ -150,12 +618,15 @@ def get_setting(db: Session, key: str):
 def get_all_settings(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Setting).offset(skip).limit(limit).all()
 
+def get_settings_fingerprint(db: Session):
+    """設定の件数とバージョンの合計を返す関数（どこかのプロセスで設定が変わったかどうかを安く確かめるため）"""
+    return tuple(db.query(func.count(models.Setting.id), func.coalesce(func.sum(models.Setting.version), 0)).one())
+
 def update_setting(db: Session, key: str, setting: schemas.SettingUpdate):
-    db_setting = db.query(models.Setting).filter(models.Setting.key == key).first()
-    if db_setting and setting.value is not None:
-        db_setting.value = setting.value
+    values = {"value": setting.value, "version": models.Setting.version + 1} if setting.value is not None else {}
+    db_setting = _update_returning(db, models.Setting, models.Setting.key, key, values)
+    if db_setting and values:
         db.commit()
-        db.refresh(db_setting)
     return db_setting
     
 # --- TargetPersona CRUD ---
@@ -173,13 +644,12 @@ def create_target_persona(db: Session, persona: schemas.TargetPersonaCreate):
     return db_persona
 
 def update_target_persona(db: Session, persona_id: int, persona: schemas.TargetPersonaCreate):
-    db_persona = db.query(models.TargetPersona).filter(models.TargetPersona.id == persona_id).first()
+    values = persona.model_dump(exclude_unset=True)
+    if values:
+        values["version"] = models.TargetPersona.version + 1
+    db_persona = _update_returning(db, models.TargetPersona, models.TargetPersona.id, persona_id, values)
     if db_persona:
-        update_data = persona.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_persona, key, value)
         db.commit()
-        db.refresh(db_persona)
     return db_persona
 
 def delete_target_persona(db: Session, persona_id: int):
@@ -195,24 +665,197 @@ def delete_target_persona(db: Session, persona_id: int):
 def create_note_article(db: Session, article: schemas.NoteArticleCreate, project_id: int):
     db_article = models.NoteArticle(**article.model_dump(), project_id=project_id)
     db.add(db_article)
+    db.flush()
+    search.index_note_articles(db, [db_article])
     db.commit()
     db.refresh(db_article)
     return db_article
 
 def update_note_article(db: Session, article_id: int, article: schemas.NoteArticleUpdate):
-    db_article = db.query(models.NoteArticle).filter(models.NoteArticle.id == article_id).first()
+    db_article = _update_returning(db, models.NoteArticle, models.NoteArticle.id, article_id, article.model_dump(exclude_unset=True))
     if db_article:
-        update_data = article.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_article, key, value)
+        search.index_note_articles(db, [db_article])
         db.commit()
-        db.refresh(db_article)
     return db_article
 
 def delete_note_article(db: Session, article_id: int):
     db_article = db.query(models.NoteArticle).filter(models.NoteArticle.id == article_id).first()
     if db_article:
         db.delete(db_article)
+        search.remove(db, "note_article", article_id)
         db.commit()
         return {"ok": True}
     return None
+
+# --- GenerationJob CRUD ---
+GENERATION_JOB_ACTIVE_STATUSES = ("pending", "running")
+
+def create_generation_job(db: Session, job: schemas.GenerationJobCreate):
+    """プロジェクト × キャラクター × ペルソナの組み合わせごとに項目を作り、ジョブと一緒に1回のコミットで保存する関数"""
+    combinations = dict.fromkeys(itertools.product(
+        job.project_ids,
+        job.character_ids or [None],
+        job.target_persona_ids or [None]
+    ))
+    db_job = models.GenerationJob(status="pending", language=job.language, no_cache=job.no_cache)
+    db.add(db_job)
+    db.flush()
+    db.execute(insert(models.GenerationJobItem), [
+        {
+            "job_id": db_job.id,
+            "project_id": project_id,
+            "character_id": character_id,
+            "target_persona_id": target_persona_id,
+            "status": "pending",
+            "attempts": 0,
+        }
+        for project_id, character_id, target_persona_id in combinations
+    ])
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_generation_job(db: Session, job_id: int):
+    return db.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).first()
+
+def get_generation_job_progress(db: Session, job_id: int):
+    """ジョブの進み具合（状態ごとの件数と、ここまでに生成された投稿ID）をまとめて返す関数"""
+    db_job = get_generation_job(db, job_id=job_id)
+    if not db_job:
+        return None
+    items = []
+    counts = {status: 0 for status in ("pending", "running", "done", "failed")}
+    for db_item in db_job.items:
+        counts[db_item.status] = counts.get(db_item.status, 0) + 1
+        items.append({
+            "id": db_item.id,
+            "project_id": db_item.project_id,
+            "character_id": db_item.character_id,
+            "target_persona_id": db_item.target_persona_id,
+            "status": db_item.status,
+            "attempts": db_item.attempts,
+            "error": db_item.error,
+            "post_ids": json.loads(db_item.post_ids) if db_item.post_ids else [],
+        })
+    return {
+        "id": db_job.id,
+        "status": db_job.status,
+        "language": db_job.language,
+        "created_at": db_job.created_at,
+        "finished_at": db_job.finished_at,
+        "total": len(items),
+        **counts,
+        "post_ids": [post_id for item in items for post_id in item["post_ids"]],
+        "items": items,
+    }
+
+def _claimable_generation_job_item_filter(now: datetime):
+    Item = models.GenerationJobItem
+    return and_(Item.status == "pending", or_(Item.available_at.is_(None), Item.available_at <= now))
+
+def has_claimable_generation_job_items(db: Session, now: datetime) -> bool:
+    """確保できる処理待ちの項目があるかどうかを、読み取りだけで確かめる関数"""
+    return db.query(models.GenerationJobItem.id).filter(_claimable_generation_job_item_filter(now)).first() is not None
+
+def get_generation_job_item_deadlines(db: Session) -> tuple[datetime | None, datetime | None]:
+    """再試行待ちの項目の available_at のうち最も早いものと、"running" の項目の started_at のうち最も古いものを返す関数"""
+    Item = models.GenerationJobItem
+    next_available_at = select(func.min(Item.available_at)).where(Item.status == "pending").scalar_subquery()
+    oldest_started_at = select(func.min(Item.started_at)).where(Item.status == "running").scalar_subquery()
+    return tuple(db.execute(select(next_available_at, oldest_started_at)).one())
+
+def claim_generation_job_item(db: Session, now: datetime):
+    """
+    処理待ちの項目を1つ "running" にして確保する関数。
+    他のワーカーがロック中の行はスキップするので、複数のワーカー・レプリカから同時に呼ばれても二重に確保されない。
+    """
+    Item = models.GenerationJobItem
+    next_item_id = (
+        select(Item.id)
+        .where(_claimable_generation_job_item_filter(now))
+        .order_by(Item.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Item)
+        .where(Item.id.in_(next_item_id), Item.status == "pending")
+        .values(status="running", attempts=Item.attempts + 1, started_at=now)
+        .returning(Item.id, Item.job_id, Item.project_id, Item.character_id, Item.target_persona_id, Item.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    claimed_item = db.execute(stmt).first()
+    if claimed_item:
+        db.execute(
+            update(models.GenerationJob)
+            .where(models.GenerationJob.id == claimed_item.job_id, models.GenerationJob.status == "pending")
+            .values(status="running")
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return claimed_item
+
+def _finish_generation_job_if_done(db: Session, job_id: int, now: datetime):
+    """処理待ち・処理中の項目が残っていなければ、ジョブを完了にする（コミットは呼び出し側で行う）"""
+    Item = models.GenerationJobItem
+    has_active_items = select(Item.id).where(Item.job_id == job_id, Item.status.in_(GENERATION_JOB_ACTIVE_STATUSES)).exists()
+    has_failed_items = select(Item.id).where(Item.job_id == job_id, Item.status == "failed").exists()
+    db.execute(
+        update(models.GenerationJob)
+        .where(models.GenerationJob.id == job_id, ~has_active_items)
+        .values(
+            status=case((has_failed_items, "completed_with_errors"), else_="completed"),
+            finished_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def complete_generation_job_item(db: Session, item, contents: list[str], ai_response: str, now: datetime):
+    """項目の生成結果（投稿と latest_ai_response）の保存と、項目の完了を1回のトランザクションで行う関数"""
+    db_posts = _insert_project_posts(db, contents, project_id=item.project_id, character_id=item.character_id, ai_response=ai_response)
+    db.execute(
+        update(models.GenerationJobItem)
+        .where(models.GenerationJobItem.id == item.id)
+        .values(status="done", post_ids=json.dumps([db_post.id for db_post in db_posts]), error=None, finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    _finish_generation_job_if_done(db, job_id=item.job_id, now=now)
+    db.commit()
+    return db_posts
+
+def release_generation_job_item(db: Session, item_id: int, job_id: int, error: str, now: datetime, retry_at: datetime | None = None) -> bool:
+    """
+    処理中の項目を、retry_at があれば再試行待ちに戻し、なければ "failed" にする関数。
+    すでに完了した項目（結果の保存とシャットダウンが重なった場合など）は変えずに False を返す。
+    """
+    values = {"error": error}
+    if retry_at is not None:
+        values.update(status="pending", available_at=retry_at)
+    else:
+        values.update(status="failed", finished_at=now)
+    result = db.execute(
+        update(models.GenerationJobItem)
+        .where(models.GenerationJobItem.id == item_id, models.GenerationJobItem.status == "running")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount and retry_at is None:
+        _finish_generation_job_if_done(db, job_id=job_id, now=now)
+    db.commit()
+    return bool(result.rowcount)
+
+def reset_stale_generation_job_items(db: Session, started_before: datetime) -> int:
+    """プロセスの停止などで "running" のまま残った項目を、処理待ちに戻す関数"""
+    Item = models.GenerationJobItem
+    conditions = (Item.status == "running", Item.started_at < started_before)
+    # 該当する項目がなければ、書き込みのトランザクションを始めずに済ませる
+    if db.query(Item.id).filter(*conditions).first() is None:
+        return 0
+    result = db.execute(
+        update(Item)
+        .where(*conditions)
+        .values(status="pending", available_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,91 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import crud, database
+
+# crud の関数を、APIの AsyncSession から await で呼べるようにしたもの。
+# 中身は AsyncSession.run_sync で crud の同じ関数を動かすので、クエリは crud に1か所でまとまったまま、
+# DBとのやりとり（aiosqlite / asyncpg）の待ち時間にはイベントループが他のリクエストを処理できる。
+# スケジューラーやワーカーのスレッドは、これまでどおり crud を同期のセッションで使う。
+
+# SQLiteは同時に1つの接続しか書き込めず、ロック待ちの接続はだんだん長くなるスリープで待たされる。
+# 非同期のエンドポイントからの書き込みは専用の1スレッドで順番に実行し、ロックが空いたらすぐに次が書き込めるようにする。
+# aiosqlite ではクエリのたびにイベントループとの行き来があり、混んでいると書き込み1件でロックを長く持ってしまうので、
+# トランザクションごと同期のセッションでまとめて実行する
+_sqlite_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer") if database.async_engine.dialect.name == "sqlite" else None
+
+def _run_sync(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+def _write_in_session(fn, args, kwargs):
+    # 返したオブジェクトをセッションを閉じた後も読めるよう、コミットで属性を期限切れにしない
+    with Session(database.engine, autoflush=False, expire_on_commit=False) as db:
+        return fn(db, *args, **kwargs)
+
+def _run_sync_write(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        if _sqlite_writer is None:
+            return await db.run_sync(fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_sqlite_writer, _write_in_session, fn, args, kwargs)
+    return wrapper
+
+# --- Project ---
+get_project = _run_sync(crud.get_project)
+get_project_detail = _run_sync(crud.get_project_detail)
+get_projects = _run_sync(crud.get_projects)
+get_project_list = _run_sync(crud.get_project_list)
+create_project = _run_sync_write(crud.create_project)
+create_projects = _run_sync_write(crud.create_projects)
+update_project = _run_sync_write(crud.update_project)
+update_project_summary = _run_sync_write(crud.update_project_summary)
+update_project_ai_response = _run_sync_write(crud.update_project_ai_response)
+delete_project = _run_sync_write(crud.delete_project)
+
+# --- Post ---
+get_post = _run_sync(crud.get_post)
+get_posts = _run_sync(crud.get_posts)
+create_project_post = _run_sync_write(crud.create_project_post)
+create_project_posts = _run_sync_write(crud.create_project_posts)
+update_post = _run_sync_write(crud.update_post)
+update_post_status = _run_sync_write(crud.update_post_status)
+schedule_post = _run_sync_write(crud.schedule_post)
+update_post_image_url = _run_sync_write(crud.update_post_image_url)
+get_post_metric_history = _run_sync(crud.get_post_metric_history)
+get_metrics_summary = _run_sync(crud.get_metrics_summary)
+delete_post = _run_sync_write(crud.delete_post)
+
+# --- Character ---
+get_character = _run_sync(crud.get_character)
+get_characters = _run_sync(crud.get_characters)
+create_character = _run_sync_write(crud.create_character)
+update_character = _run_sync_write(crud.update_character)
+delete_character = _run_sync_write(crud.delete_character)
+
+# --- Setting ---
+get_setting = _run_sync(crud.get_setting)
+get_all_settings = _run_sync(crud.get_all_settings)
+update_setting = _run_sync_write(crud.update_setting)
+
+# --- TargetPersona ---
+get_target_persona = _run_sync(crud.get_target_persona)
+get_target_personas = _run_sync(crud.get_target_personas)
+create_target_persona = _run_sync_write(crud.create_target_persona)
+update_target_persona = _run_sync_write(crud.update_target_persona)
+delete_target_persona = _run_sync_write(crud.delete_target_persona)
+
+# --- NoteArticle ---
+create_note_article = _run_sync_write(crud.create_note_article)
+update_note_article = _run_sync_write(crud.update_note_article)
+delete_note_article = _run_sync_write(crud.delete_note_article)
+
+# --- GenerationJob ---
+create_generation_job = _run_sync_write(crud.create_generation_job)
+get_generation_job_progress = _run_sync(crud.get_generation_job_progress)
@@ -1,13 +1,145 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings # ★★★ .envの代わりに、執事(config)をインポート ★★★
 
 # 執事から、準備されたデータベースのURLを受け取る
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+class _TimedPoolMixin:
+    """接続の取り出しにかかった待ち時間と、タイムアウトの回数を記録する接続プール"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _engine_options(url, poolclass) -> dict:
+    # SQLiteは切断されないので、取り出すたびの確認クエリ（非同期ではイベントループとの往復も増える）を省く
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING and url.get_backend_name() != "sqlite"}
+    # SQLiteのメモリDBは接続ごとに別のDBになるので、SQLAlchemyの既定のプールのままにする
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE
+    )
+    return options
+
+def _async_url(url):
+    """DATABASE_URL から、非同期ドライバ（aiosqlite / asyncpg）を使うURLを作る"""
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.get_backend_name() == "postgresql":
+        # asyncpg は psycopg2 の sslmode ではなく ssl という名前で受け取る
+        query = dict(url.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    return url
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+# スケジューラーやワーカーのスレッドから使う同期のエンジン
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(_url, TimedQueuePool))
+# APIのエンドポイントから使う非同期のエンジン
+_async_database_url = make_url(settings.ASYNC_DATABASE_URL) if settings.ASYNC_DATABASE_URL else _async_url(_url)
+async_engine = create_async_engine(_async_database_url, **_engine_options(_async_database_url, TimedAsyncQueuePool))
+
+if _url.get_backend_name() == "sqlite":
+    _synchronous = settings.SQLITE_SYNCHRONOUS.upper()
+    if _synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        print(f"Unknown SQLITE_SYNCHRONOUS '{settings.SQLITE_SYNCHRONOUS}'. Using NORMAL.")
+        _synchronous = "NORMAL"
+
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WALモードでは、書き込み中でも他の接続から読める。書き込み同士がぶつかったときは busy_timeout まで待つ
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA synchronous={_synchronous}")
+        finally:
+            cursor.close()
+
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+def check_returning_support():
+    """
+    UPDATE / INSERT ... RETURNING に対応したDBかどうかを確かめ、対応していなければ起動時にエラーにする（lifespan から呼ぶ）。
+    crud の更新と、投稿・ジョブ・プロジェクトの確保は RETURNING に頼っている。
+    """
+    # SQLiteの対応状況は、最初に接続してバージョンを読むまで分からない
+    with engine.connect():
+        pass
+    dialect = engine.dialect
+    if not (dialect.update_returning and dialect.insert_returning and dialect.insert_executemany_returning_sort_by_parameter_order):
+        raise RuntimeError(
+            f"The database ({dialect.name} {'.'.join(map(str, dialect.server_version_info or ()))}) does not support "
+            "UPDATE/INSERT ... RETURNING. Use SQLite 3.35 or later, or PostgreSQL."
+        )
+
+def _pool_stats(pool) -> dict:
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            pool_size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=settings.DB_MAX_OVERFLOW
+        )
+    if isinstance(pool, _TimedPoolMixin):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                wait_seconds_total=pool.wait_seconds_total,
+                wait_seconds_avg=pool.wait_seconds_total / pool.checkouts if pool.checkouts else 0.0,
+                wait_seconds_max=pool.wait_seconds_max
+            )
+    return stats
+
+def get_pool_stats() -> dict:
+    """接続プールの状態（使用中の接続数・オーバーフロー・待ち時間など）を、APIの非同期エンジンと、バックグラウンドの同期エンジンに分けて返す"""
+    return {"requests": _pool_stats(async_engine.pool), "background": _pool_stats(engine.pool)}
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# APIのリクエストごとに使うセッション。コミット後も読み込んだ値をそのまま返せるよう、期限切れにしない
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
@@ -0,0 +1,170 @@
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone, timedelta
+
+import database, crud, x_client, post_timer
+from config import settings
+from rate_limit import limiter
+
+# 投稿処理を並行して行うワーカープール（同時実行数は設定で変更できる）
+_executor = ThreadPoolExecutor(
+    max_workers=settings.POST_DISPATCH_WORKERS,
+    thread_name_prefix="post-dispatch"
+)
+
+def _as_utc(value: datetime) -> datetime:
+    """タイムゾーン情報のない日時（SQLiteから読んだ値など）をUTCとして扱う"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _backoff_seconds(retry_count: int) -> float:
+    """指数バックオフにフルジッターをかけた待ち時間（秒）を返す"""
+    ceiling = min(settings.POST_RETRY_MAX_SECONDS, settings.POST_RETRY_BASE_SECONDS * (2 ** retry_count))
+    return max(random.uniform(0, ceiling), 1.0)
+
+def _defer(db, post_id: int, delay_seconds: float, failure_reason: str | None = None, count_retry: bool = False):
+    """投稿を予約状態に戻し、delay_seconds 後にタイマーで再送させる"""
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+    crud.defer_post(db, post_id=post_id, retry_at=retry_at, failure_reason=failure_reason, count_retry=count_retry)
+    post_timer.timer.arm(post_id, retry_at)
+    return retry_at
+
+def _send_post(post_id: int, text: str, image_url: str | None, retry_count: int):
+    """確保済みの投稿を1件Xに投稿し、結果をデータベースに記録する関数"""
+    db = database.SessionLocal()
+    try:
+        # レート制限の残り枠がなければ、ウィンドウがリセットされるまで送信を見送る
+        endpoints = [x_client.CREATE_TWEET_ENDPOINT]
+        if image_url:
+            endpoints.append(x_client.MEDIA_UPLOAD_ENDPOINT)
+        wait_seconds = max(limiter.wait_time(endpoint) for endpoint in endpoints)
+        if wait_seconds == 0:
+            wait_seconds = max(limiter.try_acquire(endpoint) for endpoint in endpoints)
+        if wait_seconds > 0:
+            retry_at = _defer(db, post_id, wait_seconds)
+            print(f"Rate limit reached. Deferred post ID: {post_id} until {retry_at}")
+            return
+
+        print(f"Posting tweet for post ID: {post_id}")
+        try:
+            posted_tweet_data = x_client.post_tweet(text=text, image_url=image_url)
+        except x_client.TweetMaybeSentError as e:
+            # 再送すると二重投稿になるおそれがあるので、失敗として記録するだけにする
+            print(f"Failed to post post ID: {post_id}. Error: {e}")
+            crud.update_post_status(db, post_id=post_id, status="failed", failure_reason=str(e))
+            return
+        except Exception as e:
+            reason = f"{type(e).__name__}: {e}"
+            if x_client.is_transient_error(e) and retry_count < settings.POST_MAX_RETRIES:
+                # 429ならウィンドウのリセットまで、それ以外はバックオフして再送する
+                delay = max(limiter.wait_time(x_client.CREATE_TWEET_ENDPOINT), _backoff_seconds(retry_count))
+                retry_at = _defer(db, post_id, delay, failure_reason=reason, count_retry=True)
+                print(f"Transient error for post ID: {post_id}. Retrying at {retry_at}. Error: {e}")
+            else:
+                print(f"Failed to post post ID: {post_id}. Error: {e}")
+                crud.update_post_status(db, post_id=post_id, status="failed", failure_reason=reason)
+            return
+        tweet_id = posted_tweet_data.get('id')
+        crud.update_post_status(db, post_id=post_id, status="posted", tweet_id=tweet_id)
+        print(f"Successfully posted post ID: {post_id}")
+    finally:
+        db.close()
+
+# 送信中のまま残った投稿に記録する失敗の理由
+STALE_POSTING_REASON = "Interrupted while posting. The tweet may or may not have been sent, so it was not retried."
+
+def _fail_unrecorded_post(post_id: int, error: BaseException):
+    """送信処理が例外で終わり、結果を記録できなかった投稿を "failed" にする（書き込めなければ fail_stale_posts に任せる）"""
+    db = database.SessionLocal()
+    try:
+        crud.fail_posting_posts(db, failure_reason=f"Dispatch error: {type(error).__name__}: {error}", post_ids=[post_id])
+    except Exception as e:
+        print(f"Failed to mark post ID: {post_id} as failed. Error: {e}")
+    finally:
+        db.close()
+
+def fail_stale_posts() -> int:
+    """
+    確保されてから POST_POSTING_STALE_MINUTES 分を過ぎても送信中（"posting"）のままの投稿を "failed" にする
+    （起動時と、next_stale_check_at の時刻に呼ぶ）。確保と結果の記録の間でプロセスが止まった投稿は、タイマーにも再読み込みされないため。
+    """
+    if settings.POST_POSTING_STALE_MINUTES <= 0:
+        return 0
+    started_before = datetime.now(timezone.utc) - timedelta(minutes=settings.POST_POSTING_STALE_MINUTES)
+    db = database.SessionLocal()
+    try:
+        post_ids = crud.fail_posting_posts(db, failure_reason=STALE_POSTING_REASON, started_before=started_before)
+    finally:
+        db.close()
+    if post_ids:
+        print(f"Marked {len(post_ids)} stale posting post(s) as failed: {post_ids}")
+    return len(post_ids)
+
+def next_stale_check_at() -> datetime | None:
+    """送信中の投稿が残っていれば、そのうち最も古いものが POST_POSTING_STALE_MINUTES 分を過ぎる時刻を返す"""
+    if settings.POST_POSTING_STALE_MINUTES <= 0:
+        return None
+    db = database.SessionLocal()
+    try:
+        oldest_started_at = crud.get_oldest_posting_started_at(db)
+    finally:
+        db.close()
+    if oldest_started_at is None:
+        return None
+    return _as_utc(oldest_started_at) + timedelta(minutes=settings.POST_POSTING_STALE_MINUTES)
+
+def dispatch_due_posts():
+    """
+    予約時間になった投稿をバッチ単位で確保し、ワーカープールで並行して投稿する関数。
+    確保は crud.claim_due_posts がアトミックに行うため、複数プロセスから同時に呼んでも安全。
+    """
+    batch_size = settings.POST_DISPATCH_BATCH_SIZE
+    while True:
+        db = database.SessionLocal()
+        try:
+            claimed_posts = crud.claim_due_posts(db, now=datetime.now(timezone.utc), limit=batch_size)
+        finally:
+            db.close()
+
+        if not claimed_posts:
+            return
+
+        futures = [
+            _executor.submit(_send_post, post.id, post.content, post.image_url, post.retry_count or 0)
+            for post in claimed_posts
+        ]
+        wait(futures)
+        for post, future in zip(claimed_posts, futures):
+            error = future.exception()
+            if error is not None:
+                print(f"Unexpected error while dispatching post ID: {post.id}. Error: {type(error).__name__}: {error}")
+                _fail_unrecorded_post(post.id, error)
+
+        if len(claimed_posts) < batch_size:
+            return
+
+def get_status(db) -> dict:
+    """キューの深さ・次の送信予定時刻・レート制限の状態をまとめて返す"""
+    due_count, posting_count = crud.get_dispatch_queue_counts(db, now=datetime.now(timezone.utc))
+    rate_limits = limiter.snapshot()
+
+    next_due_at = post_timer.timer.next_due_at()
+    if due_count:
+        next_due_at = datetime.now(timezone.utc)
+    next_send_at = next_due_at
+    create_limit = rate_limits.get(x_client.CREATE_TWEET_ENDPOINT)
+    if next_send_at and create_limit and create_limit["remaining"] == 0 and create_limit["reset_at"]:
+        next_send_at = max(next_send_at, create_limit["reset_at"])
+
+    return {
+        "queue_depth": due_count + posting_count,
+        "in_flight": posting_count,
+        "next_due_at": next_due_at,
+        "next_send_at": next_send_at,
+        "rate_limits": rate_limits,
+    }
+
+def shutdown():
+    """実行中の投稿処理が終わるのを待ってから、ワーカープールを停止する"""
+    _executor.shutdown(wait=True)
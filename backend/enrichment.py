@@ -0,0 +1,161 @@
+import asyncio
+import concurrent.futures
+
+import database, crud, crawler, summarizer
+from config import settings
+
+_loop: asyncio.AbstractEventLoop | None = None
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_recrawl_futures: set[concurrent.futures.Future] = set()
+
+def _claim(project_id: int) -> str | None:
+    db = database.SessionLocal()
+    try:
+        return crud.claim_project_enrichment(db, project_id=project_id)
+    finally:
+        db.close()
+
+def _finish(project_id: int, status: str, research_summary: str | None = None, error: str | None = None):
+    db = database.SessionLocal()
+    try:
+        crud.finish_project_enrichment(db, project_id=project_id, status=status, research_summary=research_summary, error=error)
+    finally:
+        db.close()
+
+async def enrich_project(project_id: int):
+    """プロジェクトのURLを読み込んでAIで要約し、research_summary に保存する"""
+    url = await asyncio.to_thread(_claim, project_id)
+    if url is None:
+        return
+    print(f"--- プロジェクト {project_id} の要約を開始: URL = {url} ---")
+    scraped_text, _ = await crawler.fetch_page(url)
+    if not scraped_text:
+        print(f"--- プロジェクト {project_id}: テキストの抽出に失敗、または内容が短すぎました。要約はスキップします。 ---")
+        await asyncio.to_thread(_finish, project_id, "skipped", None, "テキストの抽出に失敗、または内容が短すぎました。")
+        return
+    try:
+        summary = await summarizer.summarize(scraped_text)
+    except Exception as e:
+        print(f"!!!!!! プロジェクト {project_id}: AIによる要約中にエラーが発生: {e} !!!!!!")
+        await asyncio.to_thread(_finish, project_id, "failed", None, f"AIによる要約に失敗しました: {e}")
+        return
+    await asyncio.to_thread(_finish, project_id, "done", summary, None)
+    await crawler.mark_summarized(url, scraped_text)
+    print(f"--- プロジェクト {project_id} の要約が完了しました。 ---")
+
+def _get_project_for_recrawl(project_id: int):
+    db = database.SessionLocal()
+    try:
+        project = crud.get_project(db, project_id=project_id)
+        return (project.url, project.research_summary) if project else None
+    finally:
+        db.close()
+
+async def recrawl_project(project_id: int) -> str:
+    """
+    プロジェクトのURLを条件付きGETで取り直し、内容が変わったときだけ要約し直す。
+    結果は "updated"・"unchanged"・"failed"・"not_found" のいずれか。
+    """
+    project = await asyncio.to_thread(_get_project_for_recrawl, project_id)
+    if project is None:
+        return "not_found"
+    url, research_summary = project
+    text, changed = await crawler.fetch_page(url)
+    if not text:
+        return "failed"
+    if not changed and research_summary:
+        return "unchanged"
+    try:
+        summary = await summarizer.summarize(text)
+    except Exception as e:
+        print(f"!!!!!! プロジェクト {project_id}: 再クロール後の要約中にエラーが発生: {e} !!!!!!")
+        return "failed"
+    await asyncio.to_thread(_finish, project_id, "done", summary, None)
+    await crawler.mark_summarized(url, text)
+    print(f"--- プロジェクト {project_id}: ページの変更を検知し、要約を更新しました。 ---")
+    return "updated"
+
+def _get_recrawl_targets():
+    db = database.SessionLocal()
+    try:
+        return [project_id for project_id, _ in crud.get_project_urls_for_recrawl(db)]
+    finally:
+        db.close()
+
+async def recrawl_all() -> dict:
+    """全プロジェクトを再クロールする（同じホストへのアクセス間隔は crawler 側で守る）"""
+    project_ids = await asyncio.to_thread(_get_recrawl_targets)
+    semaphore = asyncio.Semaphore(settings.RECRAWL_CONCURRENCY)
+
+    async def recrawl(project_id: int) -> str:
+        async with semaphore:
+            try:
+                return await recrawl_project(project_id)
+            except Exception as e:
+                print(f"Failed to recrawl project {project_id}. Error: {e}")
+                return "failed"
+
+    results = await asyncio.gather(*(recrawl(project_id) for project_id in project_ids))
+    summary = {result: results.count(result) for result in ("updated", "unchanged", "failed", "not_found")}
+    print(f"Recrawl finished: {summary}")
+    return summary
+
+def run_recrawl_job():
+    """定期実行用：スケジューラーのスレッドから、メインのイベントループ上で再クロールを実行する"""
+    if _loop is None:
+        return
+    future = asyncio.run_coroutine_threadsafe(recrawl_all(), _loop)
+    _recrawl_futures.add(future)
+    try:
+        future.result()
+    except concurrent.futures.CancelledError:
+        print("Recrawl was cancelled by shutdown.")
+    finally:
+        _recrawl_futures.discard(future)
+
+async def _worker():
+    while True:
+        project_id = await _queue.get()
+        try:
+            await enrich_project(project_id)
+        except Exception as e:
+            # 確保済みのまま残ったプロジェクトは、次回の起動時に要約待ちへ戻る
+            print(f"Failed to enrich project {project_id}. Error: {e}")
+        finally:
+            _queue.task_done()
+
+def enqueue(project_id: int):
+    """プロジェクトを要約待ちの列に加える（スレッドプールで動く同期エンドポイントからも呼べる）"""
+    if _loop is None:
+        # ワーカーが動いていなければ、次回の起動時に要約待ちとして拾われる
+        return
+    _loop.call_soon_threadsafe(_queue.put_nowait, project_id)
+
+def start():
+    """要約のワーカーを、実行中のイベントループ上で起動する（lifespan から呼ぶ）"""
+    global _loop, _queue
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue()
+    db = database.SessionLocal()
+    try:
+        pending_project_ids = crud.get_pending_enrichment_project_ids(db)
+    finally:
+        db.close()
+    for project_id in pending_project_ids:
+        _queue.put_nowait(project_id)
+    if pending_project_ids:
+        print(f"Requeued {len(pending_project_ids)} project(s) for enrichment.")
+    for _ in range(settings.ENRICHMENT_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+async def stop():
+    global _loop
+    _loop = None
+    # 実行中の定期再クロールも止める（スケジューラーの終了待ちがイベントループを止めないように）
+    for future in list(_recrawl_futures):
+        future.cancel()
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
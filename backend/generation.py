@@ -0,0 +1,252 @@
+import asyncio
+import random
+from datetime import datetime, timezone, timedelta
+
+from google.api_core import exceptions as google_exceptions
+
+import database, crud, utils, llm, prompts, setting_cache
+from config import settings
+
+# 再試行までの待ち時間（指数バックオフ＋ジッター）
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 600
+# Geminiから 429 (ResourceExhausted) が返ったら、一括生成全体をこの秒数止める
+QUOTA_PAUSE_SECONDS = 60
+
+class PermanentGenerationError(Exception):
+    """プロジェクトの削除やテンプレートの未設定など、再試行しても成功しないエラー"""
+
+class RequestPacer:
+    """
+    Geminiへのリクエストを1分あたり requests_per_minute 回までに平準化する。
+    一括生成のワーカー全体で1つを共有し、次に送ってよい時刻を順番に割り当てる。
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            send_at = max(now, self._next_at)
+            self._next_at = send_at + self.interval
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    def pause(self, seconds: float):
+        self._next_at = max(self._next_at, asyncio.get_running_loop().time() + seconds)
+
+_pacer = RequestPacer(settings.GENERATION_JOB_REQUESTS_PER_MINUTE)
+# start() で、実行中のイベントループ上に作り直す
+_wakeup = asyncio.Event()
+# 次に起こす時刻を計算し直すよう、タイマーに知らせる
+_rearm = asyncio.Event()
+_tasks: list[asyncio.Task] = []
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _stale_threshold() -> timedelta:
+    # 1項目の処理はGeminiのタイムアウト以内に終わるので、その2倍を超えて "running" の項目は持ち主がいないとみなす
+    return timedelta(seconds=settings.LLM_TIMEOUT_SECONDS * 2)
+
+def _retry_at(attempts: int) -> datetime:
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    return _now() + timedelta(seconds=random.uniform(0, delay))
+
+def _build_prompt(item) -> tuple[str, bool]:
+    """項目のプロジェクト・キャラクター・ペルソナから投稿生成用のプロンプトを組み立てる（ワーカースレッドで実行する）"""
+    db = database.SessionLocal()
+    try:
+        db_job = crud.get_generation_job(db, job_id=item.job_id)
+        project = crud.get_project(db, project_id=item.project_id)
+        if not db_job or not project:
+            raise PermanentGenerationError("Project not found")
+        template = setting_cache.get_setting(db, key="default_post_prompt")
+        if not template or not template.value:
+            raise PermanentGenerationError("Prompt template 'default_post_prompt' not found in settings")
+        character = prompts.profiles.get_character(db, character_id=item.character_id) if item.character_id else None
+        target_persona = prompts.profiles.get_target_persona(db, persona_id=item.target_persona_id) if item.target_persona_id else None
+        prompt = prompts.render(
+            template,
+            project=project,
+            character=character,
+            target_persona=target_persona,
+            language=db_job.language,
+            deliverable="コンテンツ"
+        )
+        return prompt, not db_job.no_cache
+    finally:
+        db.close()
+
+def _save_result(item, ai_text: str) -> list[int]:
+    """生成結果を投稿として保存し、項目を完了にする（1回のトランザクション。ワーカースレッドで実行する）"""
+    db = database.SessionLocal()
+    try:
+        db_posts = crud.complete_generation_job_item(
+            db, item=item, contents=utils.split_post_blocks(ai_text), ai_response=ai_text, now=_now()
+        )
+        return [db_post.id for db_post in db_posts]
+    finally:
+        db.close()
+
+def _claim_item():
+    db = database.SessionLocal()
+    try:
+        return crud.claim_generation_job_item(db, now=_now())
+    finally:
+        db.close()
+
+def _has_claimable_items() -> bool:
+    db = database.SessionLocal()
+    try:
+        return crud.has_claimable_generation_job_items(db, now=_now())
+    finally:
+        db.close()
+
+def _as_utc(value: datetime) -> datetime:
+    """タイムゾーン情報のない日時（SQLiteから読んだ値など）をUTCとして扱う"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _next_due_at() -> datetime | None:
+    """再試行待ちの項目の待ち時間が明ける時刻と、"running" の項目が持ち主なしとみなされる時刻のうち、早いほうを返す"""
+    db = database.SessionLocal()
+    try:
+        next_available_at, oldest_started_at = crud.get_generation_job_item_deadlines(db)
+    finally:
+        db.close()
+    candidates = []
+    if next_available_at is not None:
+        candidates.append(_as_utc(next_available_at))
+    if oldest_started_at is not None:
+        candidates.append(_as_utc(oldest_started_at) + _stale_threshold())
+    return min(candidates, default=None)
+
+def _release_item(item, error: str, retry: bool, retry_now: bool = False):
+    if retry_now:
+        retry_at = _now()
+    elif retry and item.attempts < settings.GENERATION_JOB_MAX_ATTEMPTS:
+        retry_at = _retry_at(item.attempts)
+    else:
+        retry_at = None
+    db = database.SessionLocal()
+    try:
+        crud.release_generation_job_item(db, item_id=item.id, job_id=item.job_id, error=error, now=_now(), retry_at=retry_at)
+    finally:
+        db.close()
+
+def reset_stale_items() -> int:
+    """持ち主のいなくなった "running" の項目を処理待ちに戻す（起動時と、タイマーが持ち主なしとみなす時刻に呼ぶ）"""
+    db = database.SessionLocal()
+    try:
+        count = crud.reset_stale_generation_job_items(db, started_before=_now() - _stale_threshold())
+    finally:
+        db.close()
+    if count:
+        print(f"Requeued {count} stale generation job item(s).")
+    return count
+
+async def _process_item(item):
+    try:
+        prompt, use_cache = await asyncio.to_thread(_build_prompt, item)
+        await _pacer.wait()
+        ai_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, use_cache=use_cache)
+        post_ids = await asyncio.to_thread(_save_result, item, ai_text)
+        print(f"Generation job {item.job_id}: item {item.id} created {len(post_ids)} post(s).")
+    except asyncio.CancelledError:
+        # シャットダウン時は、次に起動したワーカーがすぐに拾えるよう処理待ちへ戻しておく
+        await asyncio.shield(asyncio.to_thread(_release_item, item, "Interrupted by shutdown", True, True))
+        raise
+    except PermanentGenerationError as e:
+        await asyncio.to_thread(_release_item, item, str(e), False)
+    except google_exceptions.ResourceExhausted as e:
+        print(f"Gemini quota exhausted. Pausing bulk generation for {QUOTA_PAUSE_SECONDS}s.")
+        _pacer.pause(QUOTA_PAUSE_SECONDS)
+        await asyncio.to_thread(_release_item, item, f"Gemini quota exhausted: {e}", True)
+    except Exception as e:
+        print(f"Generation job {item.job_id}: item {item.id} failed (attempt {item.attempts}). Error: {e}")
+        await asyncio.to_thread(_release_item, item, f"{type(e).__name__}: {e}", True)
+
+async def _worker():
+    while True:
+        # 新しいジョブの通知か、タイマーが処理待ちの項目を見つけるまで待つ
+        await _wakeup.wait()
+        _wakeup.clear()
+        # 起こされたら、処理待ちの項目がなくなるまで続けて確保する
+        while True:
+            try:
+                item = await asyncio.to_thread(_claim_item)
+            except Exception as e:
+                print(f"Failed to claim a generation job item. Error: {e}")
+                break
+            if item is None:
+                # 処理待ちの項目がなくなったら、再試行待ちの項目などに合わせてタイマーを掛け直す
+                _rearm.set()
+                break
+            try:
+                await _process_item(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 結果の書き込み自体に失敗した項目は、しばらくして reset_stale_items が処理待ちに戻す
+                print(f"Failed to record generation job item {item.id}. Error: {e}")
+
+async def _timer():
+    """
+    再試行待ちの項目の待ち時間が明ける時刻か、"running" の項目が持ち主なしとみなされる時刻まで眠り、その時刻にだけワーカーを起こす。
+    処理待ちも処理中の項目もなければ、notify() かワーカーの手が空くまで眠り続けるので、クエリは発生しない。
+    GENERATION_JOB_POLL_SECONDS が0より大きければ、他のレプリカで登録されたジョブを拾うためにその間隔でも目を覚ます。
+    """
+    while True:
+        _rearm.clear()
+        try:
+            due_at = await asyncio.to_thread(_next_due_at)
+        except Exception as e:
+            print(f"Failed to read generation job deadlines. Error: {e}")
+            due_at = _now() + timedelta(seconds=RETRY_BASE_SECONDS)
+        timeouts = []
+        if due_at is not None:
+            timeouts.append(max((due_at - _now()).total_seconds(), 0))
+        if settings.GENERATION_JOB_POLL_SECONDS > 0:
+            timeouts.append(settings.GENERATION_JOB_POLL_SECONDS)
+        # wait_for は、待っているイベントとキャンセルが重なるとキャンセルを握りつぶすことがあるので使わない
+        waiter = asyncio.ensure_future(_rearm.wait())
+        try:
+            rearmed, _ = await asyncio.wait({waiter}, timeout=min(timeouts, default=None))
+        finally:
+            waiter.cancel()
+        if rearmed:
+            # 新しいジョブや再試行待ちの項目ができたので、起こす時刻を計算し直す
+            continue
+        try:
+            if await asyncio.to_thread(reset_stale_items) or await asyncio.to_thread(_has_claimable_items):
+                _wakeup.set()
+        except Exception as e:
+            print(f"Failed to check generation job items. Error: {e}")
+
+def notify():
+    """新しいジョブが登録されたことを、待機中のワーカーとタイマーに知らせる"""
+    _wakeup.set()
+    _rearm.set()
+
+def start():
+    """一括生成のワーカーとタイマーを、実行中のイベントループ上で起動する（lifespan から呼ぶ）"""
+    global _wakeup, _rearm
+    _wakeup = asyncio.Event()
+    _rearm = asyncio.Event()
+    reset_stale_items()
+    if _has_claimable_items():
+        _wakeup.set()
+    for _ in range(settings.GENERATION_JOB_WORKERS):
+        _tasks.append(asyncio.create_task(_worker()))
+    _tasks.append(asyncio.create_task(_timer()))
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
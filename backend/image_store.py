@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from fastapi import HTTPException, Request, status
+from PIL import UnidentifiedImageError
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+import database, crud, utils
+from config import settings
+
+READ_CHUNK_SIZE = 256 * 1024
+# multipart の区切りやパートのヘッダの分として、画像の上限に足しておくバイト数
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Cloudinaryへのアップロードや画像処理でイベントループを止めないための専用ワーカープール
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_UPLOAD_WORKERS,
+    thread_name_prefix="image-upload"
+)
+
+class ImageTooLargeError(ValueError):
+    pass
+
+class _UploadTooLargeError(MultiPartException):
+    pass
+
+def _hash_image(image_file: BinaryIO) -> tuple[str, int]:
+    """画像をチャンクごとに読みながらSHA-256とサイズを求める（上限を超えたらその時点で打ち切る）"""
+    digest = hashlib.sha256()
+    size = 0
+    image_file.seek(0)
+    while chunk := image_file.read(READ_CHUNK_SIZE):
+        size += len(chunk)
+        if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise ImageTooLargeError(f"Image is larger than {settings.IMAGE_UPLOAD_MAX_BYTES} bytes.")
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest(), size
+
+def store_image(image_file: BinaryIO) -> str | None:
+    """
+    画像を保存してURLを返す関数（ワーカースレッドで実行する）。
+    同じ内容の画像が保存済みならそのURLを返し、なければXの制限内に縮小・再圧縮してからCloudinaryにアップロードする。
+    """
+    content_hash, size = _hash_image(image_file)
+    db = database.SessionLocal()
+    try:
+        db_asset = crud.get_image_asset_by_hash(db, content_hash=content_hash)
+        if db_asset:
+            print(f"Reusing stored image for hash {content_hash[:12]}.")
+            return db_asset.url
+
+        image_url = utils.upload_image_bytes_to_cloudinary(utils.prepare_image_for_x(image_file))
+        if not image_url:
+            return None
+        return crud.create_image_asset(db, content_hash=content_hash, url=image_url, byte_size=size).url
+    finally:
+        db.close()
+
+async def _capped_stream(request: Request, max_bytes: int):
+    """リクエストの本文を受け取った分だけ数えながら渡し、max_bytes を超えたらその時点で打ち切る"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise _UploadTooLargeError(f"Request body is larger than {max_bytes} bytes.")
+        yield chunk
+
+async def _receive_upload(request: Request, field_name: str):
+    """
+    multipart/form-data の本文を受け取りながら解析し、(フォーム, 画像ファイル) を返す。
+    Content-Length が上限を超えていれば本文を読まずに、受け取った量が上限を超えたらその時点で 413 にするので、
+    大きすぎるアップロードを最後までディスクに書き出してから断ることはない。
+    """
+    max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image file is too large.")
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data upload.")
+    parser = MultiPartParser(request.headers, _capped_stream(request, max_bytes), max_files=1, max_fields=10)
+    try:
+        form = await parser.parse()
+    except _UploadTooLargeError:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image file is too large.")
+    except (MultiPartException, ValueError) as e:
+        # python-multipart は壊れた本文に対して ValueError の派生クラスを投げる
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid multipart body: {e}")
+    upload = form.get(field_name)
+    if not isinstance(upload, UploadFile):
+        await form.close()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Missing file field '{field_name}'.")
+    return form, upload
+
+async def store_upload(request: Request, field_name: str = "file") -> str | None:
+    """アップロードされた画像を上限つきで受け取り、イベントループの外（専用ワーカープール）で保存する"""
+    form, upload = await _receive_upload(request, field_name)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_executor, store_image, upload.file)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except UnidentifiedImageError:
+        # 画像でないファイルや壊れた画像は、Pillow が読み込めない
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Uploaded file is not a supported image.")
+    finally:
+        await form.close()
+
+def shutdown():
+    _executor.shutdown(wait=True)
@@ -0,0 +1,111 @@
+import asyncio
+
+import google.generativeai as genai
+from fastapi import Request
+
+import llm_cache
+from config import settings
+
+PRO_MODEL = "gemini-1.5-pro"
+FLASH_MODEL = "gemini-1.5-flash"
+
+# クライアントの切断を確認する間隔（秒）
+DISCONNECT_POLL_SECONDS = 0.5
+
+# すべての生成エンドポイントで共有する同時実行数の上限
+_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+_models: dict[str, genai.GenerativeModel] = {}
+
+def _get_model(model_name: str) -> genai.GenerativeModel:
+    if model_name not in _models:
+        _models[model_name] = genai.GenerativeModel(model_name)
+    return _models[model_name]
+
+async def _cancel_on_disconnect(request: Request, task: asyncio.Task):
+    """クライアントが切断したら、実行中（または順番待ち中）の生成をキャンセルする"""
+    while not task.done():
+        if await request.is_disconnected():
+            print("Client disconnected. Cancelling the Gemini call.")
+            task.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+async def _generate(prompt: str, model_name: str, timeout: float) -> str:
+    async with _semaphore:
+        response = await asyncio.wait_for(
+            _get_model(model_name).generate_content_async(prompt, request_options={"timeout": timeout}),
+            timeout=timeout
+        )
+        return response.text
+
+async def _cached(prompt: str, model_name: str, use_cache: bool) -> tuple[llm_cache.LLMCache | None, str | None]:
+    """キャッシュが有効なら (キャッシュ, 保存済みの結果) を返す。無効・バイパス時は (None, None)"""
+    cache = llm_cache.get_cache() if use_cache else None
+    if cache is None:
+        return None, None
+    return cache, await asyncio.to_thread(cache.get, model_name, prompt)
+
+async def generate(
+    prompt: str,
+    model_name: str = PRO_MODEL,
+    request: Request | None = None,
+    timeout: float | None = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Geminiでテキストを生成する共通の入口。
+    同時実行数は LLM_MAX_CONCURRENCY で制限され、timeout 秒を超えると asyncio.TimeoutError になる。
+    request を渡すと、クライアントが切断した時点で生成をキャンセルする。
+    LLM_CACHE_ENABLED のときは同じモデル・同じプロンプトの結果を再利用する（use_cache=False でバイパス）。
+    """
+    cache, cached = await _cached(prompt, model_name, use_cache)
+    if cached is not None:
+        return cached
+
+    task = asyncio.ensure_future(_generate(prompt, model_name, timeout or settings.LLM_TIMEOUT_SECONDS))
+    if request is None:
+        text = await task
+    else:
+        watcher = asyncio.create_task(_cancel_on_disconnect(request, task))
+        try:
+            text = await task
+        finally:
+            watcher.cancel()
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, model_name, prompt, text)
+    return text
+
+async def stream(prompt: str, model_name: str = PRO_MODEL, timeout: float | None = None, use_cache: bool = True):
+    """
+    Geminiのストリーミング出力を、届いた断片ごとに返す非同期ジェネレーター。
+    同時実行数の枠は、ストリームを読み終えるまで保持する。timeout は生成全体にかかる時間の上限。
+    キャッシュに結果があれば、それを1つの断片として返す。最後まで読み切った出力だけをキャッシュに保存する。
+    """
+    cache, cached = await _cached(prompt, model_name, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    loop = asyncio.get_running_loop()
+    timeout = timeout or settings.LLM_TIMEOUT_SECONDS
+    deadline = loop.time() + timeout
+    async with _semaphore:
+        response = await asyncio.wait_for(
+            _get_model(model_name).generate_content_async(prompt, stream=True, request_options={"timeout": timeout}),
+            timeout=max(deadline - loop.time(), 0)
+        )
+        chunks = response.__aiter__()
+        received = []
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                break
+            # 安全性フィルターなどでテキストを含まない断片もあるので、その場合は読み飛ばす
+            if chunk.parts:
+                received.append(chunk.text)
+                yield chunk.text
+
+    if cache is not None and received:
+        await asyncio.to_thread(cache.put, model_name, prompt, "".join(received))
@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from config import settings
+
+class LLMCache:
+    """
+    Geminiの生成結果を、モデル名とプロンプトのハッシュをキーにしてSQLiteファイルに保存するキャッシュ。
+    TTLを過ぎたエントリは読み出し時に捨て、合計サイズが上限を超えたら最終アクセスの古い順に削除する。
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_accessed_at ON llm_responses (accessed_at)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model_name: str, prompt: str) -> str | None:
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, size, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, size, created_at = row
+            if created_at + self.ttl_seconds < now:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return response
+
+    def put(self, model_name: str, prompt: str, response: str):
+        key = self.make_key(model_name, prompt)
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, size, now, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """合計サイズが上限に収まるまで、最終アクセスの古いエントリから削除する（ロックを持った状態で呼ぶ）"""
+        # 他のプロセスも同じファイルに書き込むので、削除の前に実際の合計サイズを数え直す
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+        excess = self._total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_responses ORDER BY accessed_at"):
+            victims.append((key,))
+            excess -= size
+            self._total_bytes -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": self._total_bytes,
+            }
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> LLMCache | None:
+    """キャッシュが有効ならアプリ全体で共有するインスタンスを返し、無効なら None を返す"""
+    global _cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(settings.LLM_CACHE_PATH, settings.LLM_CACHE_TTL_SECONDS, settings.LLM_CACHE_MAX_BYTES)
+        return _cache
+
+def stats() -> dict:
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return cache.stats()
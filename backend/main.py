@@ -1,5 +1,8 @@
 import os
+import asyncio
 import re
+import base64
+import math
 import traceback
 import json
 import google.generativeai as genai
@@ -8,45 +11,33 @@ from datetime import datetime, timezone
 from contextlib import asynccontextmanager
 
 # ステップ1：最初に、設定に必要なライブラリだけをインポート
-from fastapi import FastAPI, Depends, HTTPException, Response, status, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 import cloudinary
+import tweepy
 
 # ステップ2：設定完了後に、私たちの作った部品をインポートする
-import database, models, schemas, crud, x_client, utils
+import database, models, schemas, crud, crud_async, x_client, utils, dispatcher, post_timer, metrics, image_store, llm, llm_cache, prompts, generation, setting_cache, enrichment, search
+from config import settings
+from rate_limit import limiter
 
 # --- スケジューラーの定義 ---
 scheduler = BackgroundScheduler(timezone="UTC")
 
-def post_scheduled_tweets():
-    """予約時間になった投稿をチェックして投稿する関数"""
-    db = database.SessionLocal()
-    # print(f"[{datetime.now()}] Checking for scheduled posts...")
-    
-    posts_to_send = db.query(models.Post).filter(
-        models.Post.status == "scheduled",
-        models.Post.scheduled_at <= datetime.now(timezone.utc)
-    ).all()
-
-    if not posts_to_send:
-        db.close()
-        return
-
-    for post in posts_to_send:
-        print(f"Posting tweet for post ID: {post.id}")
-        try:
-            posted_tweet_data = x_client.post_tweet(text=post.content, image_url=post.image_url)
-            tweet_id = posted_tweet_data.get('id')
-            crud.update_post_status(db, post_id=post.id, status="posted", tweet_id=tweet_id)
-            print(f"Successfully posted post ID: {post.id}")
-        except Exception as e:
-            print(f"Failed to post post ID: {post.id}. Error: {e}")
-            crud.update_post_status(db, post_id=post.id, status="failed")
-    
-    db.close()
+def _fail_stale_posts():
+    """
+    送信中のまま止まった投稿を失敗にする。まだ期限を過ぎていない送信中の投稿が残っていれば、
+    その期限の時刻にだけもう一度確認する（残っていなければ、定期的なクエリは発生しない）。
+    """
+    dispatcher.fail_stale_posts()
+    check_at = dispatcher.next_stale_check_at()
+    if check_at is not None:
+        scheduler.add_job(_fail_stale_posts, 'date', run_date=check_at, id="fail_stale_posts", replace_existing=True)
 
 # --- アプリケーションのライフサイクル管理（起動・終了処理） ---
 @asynccontextmanager
@@ -72,20 +63,50 @@ async def lifespan(app: FastAPI):
     print("Cloudinary configured.")
 
     # 4. データベーステーブルの作成
+    database.check_returning_support()
     models.Base.metadata.create_all(bind=database.engine)
     print("Database tables checked/created.")
-
-    # 5. スケジューラーのジョブを追加して開始
-    scheduler.add_job(post_scheduled_tweets, 'interval', minutes=1)
+    search.init(database.engine)
+    with database.SessionLocal() as db:
+        setting_cache.cache.load(db)
+
+    # 5. 予約投稿のタイマーをDBから読み込んで開始（次の予約時刻まで眠り続ける）
+    # 前回の停止で送信中のまま残った投稿を失敗にする
+    _fail_stale_posts()
+    post_timer.reload()
+    post_timer.timer.start(on_due=dispatcher.dispatch_due_posts)
+    if settings.POST_TIMER_RESYNC_MINUTES > 0:
+        scheduler.add_job(post_timer.reload, 'interval', minutes=settings.POST_TIMER_RESYNC_MINUTES)
+    if settings.POST_POSTING_STALE_CHECK_MINUTES > 0:
+        scheduler.add_job(dispatcher.fail_stale_posts, 'interval', minutes=settings.POST_POSTING_STALE_CHECK_MINUTES)
+    if settings.METRICS_REFRESH_INTERVAL_MINUTES > 0:
+        scheduler.add_job(metrics.refresh_due_metrics, 'interval', minutes=settings.METRICS_REFRESH_INTERVAL_MINUTES)
+    if settings.RECRAWL_INTERVAL_HOURS > 0:
+        scheduler.add_job(enrichment.run_recrawl_job, 'interval', hours=settings.RECRAWL_INTERVAL_HOURS, max_instances=1)
     scheduler.start()
     print("Scheduler has been started.")
+
+    # 6. 一括生成ジョブのワーカーを起動（前回の停止で中断された項目も引き継ぐ）
+    generation.start()
+    print("Generation job workers have been started.")
+
+    # 7. プロジェクト要約のワーカーを起動（要約待ちのまま残ったプロジェクトも引き継ぐ）
+    enrichment.start()
+    print("Project enrichment workers have been started.")
     
     print("--- Application startup complete. ---")
     yield
     
     # --- アプリケーション終了時の処理 ---
     print("--- Application shutting down... ---")
+    await enrichment.stop()
+    await generation.stop()
     scheduler.shutdown()
+    post_timer.timer.stop()
+    dispatcher.shutdown()
+    image_store.shutdown()
+    x_client.close_clients()
+    await database.async_engine.dispose()
     print("Scheduler has been shut down.")
 
 # --- FastAPIアプリのインスタンス化 ---
@@ -102,228 +123,346 @@ app.add_middleware(
 )
 
 # --- データベースセッション ---
-def get_db():
-    db = database.SessionLocal()
-    try:
+async def get_db():
+    async with database.AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # --- APIエンドポイント ---
 # -- Project Endpoints --
 @app.post("/projects/", response_model=schemas.Project)
-def create_project_api(project: schemas.ProjectCreate, db: Session = Depends(get_db)):
-    print(f"--- プロジェクト作成処理開始: URL = {project.url} ---")
-    scraped_text = utils.scrape_text_from_url(project.url)
-    summary = ""
-    if scraped_text:
-        print("--- テキストの抽出に成功！AIによる要約を開始します。 ---")
-        try:
-            summarization_prompt = f"""以下のウェブサイトから抽出したテキストを分析し、このプロジェクトの核心的な価値、特徴、ターゲット顧客について、簡潔に要約してください。\n\n---テキスト---\n{scraped_text[:4000]}"""
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(summarization_prompt)
-            summary = response.text
-            print("--- AIによる要約が完了しました。 ---")
-        except Exception as e:
-            print(f"!!!!!! AIによる要約中にエラーが発生: {e} !!!!!!")
-            summary = f"AIによる要約に失敗しました: {e}"
-    else:
-        print("--- テキストの抽出に失敗、または内容が短すぎました。要約はスキップします。 ---")
-
-    print("--- データベースにプロジェクトを保存します... ---")
-    new_project = crud.create_project(db=db, project=project, research_summary=summary)
-    print(f"--- プロジェクト保存完了: ID = {new_project.id} ---")
-    return new_project
+async def create_project_api(project: schemas.ProjectCreate, db: AsyncSession = Depends(get_db)):
+    """プロジェクトをすぐに保存して返す。URLの読み込みとAI要約はバックグラウンドで行い、進み具合は enrichment_status で分かる"""
+    new_project = await crud_async.create_project(db=db, project=project)
+    enrichment.enqueue(new_project.id)
+    print(f"--- プロジェクト保存完了: ID = {new_project.id}（要約はバックグラウンドで実行します） ---")
+    # 非同期のセッションでは関連（投稿・note記事）を後から遅延読み込みできないので、まとめて読み込んで返す
+    return await crud_async.get_project_detail(db, project_id=new_project.id)
+
+@app.post("/projects/bulk", response_model=List[schemas.Project], status_code=status.HTTP_202_ACCEPTED)
+async def create_projects_bulk_api(request_body: schemas.ProjectBulkCreate, db: AsyncSession = Depends(get_db)):
+    """複数のプロジェクトをまとめて作成し、要約はバックグラウンドで並行して行う"""
+    if len(request_body.projects) > settings.PROJECT_BULK_IMPORT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.PROJECT_BULK_IMPORT_MAX_ITEMS} projects can be imported at once")
+    new_projects = await crud_async.create_projects(db, projects=request_body.projects)
+    for new_project in new_projects:
+        enrichment.enqueue(new_project.id)
+    return new_projects
+
+@app.post("/projects/{project_id}/recrawl", response_model=schemas.RecrawlResult)
+async def recrawl_project_api(project_id: int):
+    """プロジェクトのURLを取り直し、ページが変わっていれば要約を更新する"""
+    result = await enrichment.recrawl_project(project_id)
+    if result == "not_found":
+        raise HTTPException(status_code=404, detail="Project not found")
+    return {"project_id": project_id, "result": result}
 
 @app.get("/projects/", response_model=List[schemas.Project])
-def read_projects_api(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_projects(db, skip=skip, limit=limit)
+async def read_projects_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    return await crud_async.get_projects(db, skip=skip, limit=limit)
+
+@app.get("/projects/summaries", response_model=schemas.ProjectListPage)
+async def read_project_summaries_api(limit: int = 50, before_id: int | None = None, db: AsyncSession = Depends(get_db)):
+    """サイドバーなどの一覧表示用。投稿本文は含めず、状態ごとの投稿数だけを返す"""
+    limit = max(1, min(limit, 200))
+    items = await crud_async.get_project_list(db, limit=limit, before_id=before_id)
+    next_before_id = items[-1].id if len(items) == limit else None
+    return {"items": items, "next_before_id": next_before_id}
 
 @app.get("/projects/{project_id}", response_model=schemas.Project)
-def read_project_api(project_id: int, db: Session = Depends(get_db)):
-    db_project = crud.get_project(db, project_id=project_id)
+async def read_project_api(project_id: int, db: AsyncSession = Depends(get_db)):
+    db_project = await crud_async.get_project_detail(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return db_project
 
 @app.put("/projects/{project_id}", response_model=schemas.Project)
-def update_project_api(project_id: int, project: schemas.ProjectCreate, db: Session = Depends(get_db)):
-    updated_project = crud.update_project(db, project_id=project_id, project=project)
+async def update_project_api(project_id: int, project: schemas.ProjectCreate, db: AsyncSession = Depends(get_db)):
+    updated_project = await crud_async.update_project(db, project_id=project_id, project=project)
     if updated_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
-    return updated_project
+    # 更新は1文で済ませ、レスポンスに含める投稿とnote記事はまとめて読み込む
+    return await crud_async.get_project_detail(db, project_id=project_id)
 
 @app.put("/projects/{project_id}/summary", response_model=schemas.Project)
-def update_project_summary_api(project_id: int, summary_data: schemas.ProjectSummaryUpdate, db: Session = Depends(get_db)):
-    updated_project = crud.update_project_summary(db, project_id=project_id, summary=summary_data.research_summary)
+async def update_project_summary_api(project_id: int, summary_data: schemas.ProjectSummaryUpdate, db: AsyncSession = Depends(get_db)):
+    updated_project = await crud_async.update_project_summary(db, project_id=project_id, summary=summary_data.research_summary)
     if updated_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
-    return updated_project
+    return await crud_async.get_project_detail(db, project_id=project_id)
+
+@app.get("/projects/{project_id}/metrics", response_model=schemas.MetricsSummary)
+async def read_project_metrics_api(project_id: int, db: AsyncSession = Depends(get_db)):
+    if await crud_async.get_project(db, project_id=project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await crud_async.get_metrics_summary(db, project_id=project_id)
 
 @app.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project_api(project_id: int, db: Session = Depends(get_db)):
-    result = crud.delete_project(db, project_id=project_id)
+async def delete_project_api(project_id: int, db: AsyncSession = Depends(get_db)):
+    result = await crud_async.delete_project(db, project_id=project_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # -- Post Endpoints --
+def _build_prompt(db: Session, project: models.Project, request_body: schemas.GeneratePostsRequest, setting_key: str, deliverable: str) -> str:
+    """設定のテンプレートとキャラクター・ペルソナ情報から、生成用のプロンプトを組み立てる"""
+    prompt_template_setting = setting_cache.get_setting(db, key=setting_key)
+    if not prompt_template_setting or not prompt_template_setting.value: raise HTTPException(status_code=500, detail=f"Prompt template '{setting_key}' not found in settings")
+
+    character = prompts.profiles.get_character(db, character_id=request_body.character_id) if request_body.character_id else None
+    target_persona = prompts.profiles.get_target_persona(db, persona_id=request_body.target_persona_id) if request_body.target_persona_id else None
+    return prompts.render(
+        prompt_template_setting,
+        project=project,
+        character=character,
+        target_persona=target_persona,
+        language=request_body.language,
+        deliverable=deliverable
+    )
+
+def _build_post_prompt(db: Session, project: models.Project, request_body: schemas.GeneratePostsRequest) -> str:
+    return _build_prompt(db, project, request_body, setting_key="default_post_prompt", deliverable="コンテンツ")
+
+async def _release_db_connection(db: AsyncSession):
+    """
+    LLMの応答を待つ前に、読み込みで使った接続をプールへ返す（生成を待つ間に接続を持ち続けると、同時の生成だけでプールを使い切る）。
+    セッションはこのあとも使え、次のクエリで接続を取り直す。
+    """
+    await db.close()
+
+async def _save_post_block(db: AsyncSession, block: str, project_id: int, character_id: int | None):
+    """AIの出力を '---' で区切ったブロック1つを投稿として保存する（空のブロックは無視する）"""
+    content = block.strip()
+    if not content:
+        return None
+    post_schema = schemas.PostCreate(content=content)
+    return await crud_async.create_project_post(db=db, post=post_schema, project_id=project_id, character_id=character_id)
+
 @app.post("/projects/{project_id}/generate-posts", response_model=List[schemas.Post])
-def generate_posts_api(project_id: int, request_body: schemas.GeneratePostsRequest, db: Session = Depends(get_db)):
+async def generate_posts_api(project_id: int, request_body: schemas.GeneratePostsRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        project = crud.get_project(db, project_id=project_id)
+        project = await crud_async.get_project(db, project_id=project_id)
         if not project: raise HTTPException(status_code=404, detail="Project not found")
         
-        prompt_template_setting = crud.get_setting(db, key="default_post_prompt")
-        if not prompt_template_setting or not prompt_template_setting.value: raise HTTPException(status_code=500, detail="Default prompt template not found in settings")
+        prompt = await db.run_sync(_build_post_prompt, project, request_body)
+        await _release_db_connection(db)
         
-        prompt_template = prompt_template_setting.value
-
-        character_prompt_part = ""
-        if request_body.character_id:
-            character = crud.get_character(db, character_id=request_body.character_id)
-            if character:
-                character_prompt_part = f"""
-# 投稿者キャラクター情報
-あなたは以下の設定を持つ、非常に魅力的な人物です。このキャラクターに完全になりきって、コンテンツを作成してください。
-- 肩書: {character.title}
-- 専門分野: {character.expertise}
-- 背景: {character.background}
-- 価値観: {character.values_beliefs}
-- 目標: {character.goal}
-- 口調: {character.base_tone}で、以下の特徴を持つ: {character.style_features}
-- 口癖: {character.catchphrases}
-- 読者に与えたい印象: {character.impression}
-"""
+        ai_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, request=http_request, use_cache=not request_body.no_cache)
         
-        target_persona_prompt_part = ""
-        if request_body.target_persona_id:
-            target_persona = crud.get_target_persona(db, persona_id=request_body.target_persona_id)
-            if target_persona:
-                target_persona_prompt_part = f"""
-# ターゲット読者情報
-以下のペルソナを持つ読者に、最も響くようにコンテンツを作成してください。
-- ペルソナ: {target_persona.name}
-- 抱えている課題: {target_persona.challenges}
-- 達成したいこと: {target_persona.goals}
-- 知識レベル: {target_persona.knowledge_level}
-- 心を動かすキーワード: {target_persona.keywords}
-- 行動の決め手: {target_persona.decision_triggers}
-"""
-
-        prompt = prompt_template.replace("{{language}}", request_body.language or "日本語")
-        prompt = prompt.replace("{{character_section}}", character_prompt_part)
-        prompt = prompt.replace("{{target_persona_section}}", target_persona_prompt_part)
-        prompt = prompt.replace("{{project_name}}", project.name)
-        prompt = prompt.replace("{{project_url}}", project.url)
-        prompt = prompt.replace("{{research_summary}}", project.research_summary or "調査結果なし")
-        prompt = prompt.replace("{{hashtags}}", project.hashtags or "")
-        
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        ai_text = response.text
-        
-        crud.update_project_ai_response(db, project_id=project_id, ai_response=ai_text)
-        
-        post_blocks = ai_text.split('---')
-        newly_created_posts = []
-        for block in post_blocks:
-            content = block.strip()
-            if content:
-                post_schema = schemas.PostCreate(content=content)
-                new_post = crud.create_project_post(db=db, post=post_schema, project_id=project_id)
-                newly_created_posts.append(new_post)
-        
-        return newly_created_posts
+        # 生成された投稿と latest_ai_response を1回のトランザクションで保存する
+        return await crud_async.create_project_posts(
+            db,
+            contents=utils.split_post_blocks(ai_text),
+            project_id=project_id,
+            character_id=request_body.character_id,
+            ai_response=ai_text
+        )
         
     except Exception as e:
         print(f"!!!!!! 例外が発生しました !!!!!!\nエラーのタイプ: {type(e)}\nエラーの詳細: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"AIの生成または保存に失敗しました: {str(e)}")
 
+def _sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.post("/projects/{project_id}/generate-posts/stream")
+async def generate_posts_stream_api(project_id: int, request_body: schemas.GeneratePostsRequest, db: AsyncSession = Depends(get_db)):
+    """
+    投稿生成のストリーミング版。Geminiの出力から '---' 区切りのブロックが1つ完成するたびに保存し、
+    Server-Sent Events の "post" イベントとしてすぐにクライアントへ送る。最後に "done"（失敗時は "error"）を送る。
+    """
+    project = await crud_async.get_project(db, project_id=project_id)
+    if not project: raise HTTPException(status_code=404, detail="Project not found")
+    prompt = await db.run_sync(_build_post_prompt, project, request_body)
+    await _release_db_connection(db)
+
+    async def event_stream():
+        # レスポンスの送信中も使えるよう、ストリーム専用のセッションを開く
+        stream_db = database.AsyncSessionLocal()
+        ai_text = ""
+        pending = ""
+        created_count = 0
+        try:
+            async for text in llm.stream(prompt, model_name=llm.PRO_MODEL, use_cache=not request_body.no_cache):
+                ai_text += text
+                pending += text
+                while '---' in pending:
+                    block, pending = pending.split('---', 1)
+                    new_post = await _save_post_block(stream_db, block, project_id=project_id, character_id=request_body.character_id)
+                    if new_post:
+                        created_count += 1
+                        yield _sse_event("post", schemas.Post.model_validate(new_post).model_dump_json())
+
+            new_post = await _save_post_block(stream_db, pending, project_id=project_id, character_id=request_body.character_id)
+            if new_post:
+                created_count += 1
+                yield _sse_event("post", schemas.Post.model_validate(new_post).model_dump_json())
+
+            await crud_async.update_project_ai_response(stream_db, project_id=project_id, ai_response=ai_text)
+            yield _sse_event("done", json.dumps({"count": created_count}))
+        except Exception as e:
+            print(f"!!!!!! 例外が発生しました !!!!!!\nエラーのタイプ: {type(e)}\nエラーの詳細: {e}")
+            traceback.print_exc()
+            yield _sse_event("error", json.dumps({"detail": f"AIの生成または保存に失敗しました: {str(e)}"}, ensure_ascii=False))
+        finally:
+            await stream_db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generation-jobs", response_model=schemas.GenerationJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job_api(job: schemas.GenerationJobCreate, db: AsyncSession = Depends(get_db)):
+    """
+    プロジェクト × キャラクター × ペルソナの組み合わせをまとめて投稿生成するジョブを登録する。
+    生成はバックグラウンドのワーカーが行うので、進み具合は GET /generation-jobs/{job_id} で確認する。
+    """
+    project_ids = set(job.project_ids)
+    if not project_ids:
+        raise HTTPException(status_code=400, detail="project_ids must not be empty")
+    item_count = len(project_ids) * max(len(set(job.character_ids)), 1) * max(len(set(job.target_persona_ids)), 1)
+    if item_count > settings.GENERATION_JOB_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A generation job can have at most {settings.GENERATION_JOB_MAX_ITEMS} combinations")
+    missing_project_ids = [project_id for project_id in sorted(project_ids) if not await crud_async.get_project(db, project_id=project_id)]
+    if missing_project_ids:
+        raise HTTPException(status_code=404, detail=f"Projects not found: {missing_project_ids}")
+
+    db_job = await crud_async.create_generation_job(db, job=job)
+    generation.notify()
+    return await crud_async.get_generation_job_progress(db, job_id=db_job.id)
+
+@app.get("/generation-jobs/{job_id}", response_model=schemas.GenerationJob)
+async def read_generation_job_api(job_id: int, db: AsyncSession = Depends(get_db)):
+    progress = await crud_async.get_generation_job_progress(db, job_id=job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return progress
+
 @app.post("/projects/{project_id}/generate-note-article", response_model=dict)
-def generate_note_article_api(project_id: int, request_body: schemas.GeneratePostsRequest, db: Session = Depends(get_db)):
+async def generate_note_article_api(project_id: int, request_body: schemas.GeneratePostsRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        project = crud.get_project(db, project_id=project_id)
+        project = await crud_async.get_project(db, project_id=project_id)
         if not project: raise HTTPException(status_code=404, detail="Project not found")
         
-        prompt_template_setting = crud.get_setting(db, key="default_note_prompt")
-        if not prompt_template_setting or not prompt_template_setting.value: raise HTTPException(status_code=500, detail="Default note prompt template not found in settings")
-        
-        prompt_template = prompt_template_setting.value
-
-        character_prompt_part = ""
-        if request_body.character_id:
-            character = crud.get_character(db, character_id=request_body.character_id)
-            if character:
-                character_prompt_part = f"""
-# 投稿者キャラクター情報
-あなたは以下の設定を持つ、非常に魅力的な人物です。このキャラクターに完全になりきって、記事を作成してください。
-- 肩書: {character.title}
-- 専門分野: {character.expertise}
-- 背景: {character.background}
-- 価値観: {character.values_beliefs}
-- 目標: {character.goal}
-- 口調: {character.base_tone}で、以下の特徴を持つ: {character.style_features}
-- 口癖: {character.catchphrases}
-- 読者に与えたい印象: {character.impression}
-"""
-        
-        target_persona_prompt_part = ""
-        if request_body.target_persona_id:
-            target_persona = crud.get_target_persona(db, persona_id=request_body.target_persona_id)
-            if target_persona:
-                target_persona_prompt_part = f"""
-# ターゲット読者情報
-以下のペルソナを持つ読者に、最も響くようにコンテンツを作成してください。
-- ペルソナ: {target_persona.name}
-- 抱えている課題: {target_persona.challenges}
-- 達成したいこと: {target_persona.goals}
-- 知識レベル: {target_persona.knowledge_level}
-- 心を動かすキーワード: {target_persona.keywords}
-- 行動の決め手: {target_persona.decision_triggers}
-"""
-
-        prompt = prompt_template.replace("{{language}}", request_body.language or "日本語")
-        prompt = prompt.replace("{{character_section}}", character_prompt_part)
-        prompt = prompt.replace("{{target_persona_section}}", target_persona_prompt_part)
-        prompt = prompt.replace("{{project_name}}", project.name)
-        prompt = prompt.replace("{{project_url}}", project.url)
-        prompt = prompt.replace("{{research_summary}}", project.research_summary or "調査結果なし")
+        prompt = await db.run_sync(_build_prompt, project, request_body, setting_key="default_note_prompt", deliverable="記事")
+        await _release_db_connection(db)
 
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
+        article_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, request=http_request, use_cache=not request_body.no_cache)
         
-        crud.update_project_ai_response(db, project_id=project_id, ai_response=response.text)
+        await crud_async.update_project_ai_response(db, project_id=project_id, ai_response=article_text)
         
-        return {"article_text": response.text}
+        return {"article_text": article_text}
         
     except Exception as e:
         print(f"!!!!!! 例外が発生しました !!!!!!\nエラーのタイプ: {type(e)}\nエラーの詳細: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"note記事のAI生成に失敗しました: {str(e)}")
 
-@app.post("/posts/{post_id}/upload-image", response_model=schemas.Post)
-async def upload_post_image_api(post_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    db_post = crud.get_post(db, post_id=post_id)
+def _encode_post_cursor(sort: str, post: models.Post) -> str:
+    value = getattr(post, sort)
+    return base64.urlsafe_b64encode(json.dumps([sort, value.isoformat(), post.id]).encode()).decode()
+
+def _decode_post_cursor(sort: str, cursor: str) -> tuple:
+    try:
+        cursor_sort, value, post_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort:
+            raise ValueError("sort mismatch")
+        return datetime.fromisoformat(value), int(post_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+@app.get("/posts", response_model=schemas.PostPage)
+async def read_posts_api(
+    status_filter: List[str] | None = Query(None, alias="status"),
+    project_id: int | None = None,
+    scheduled_from: datetime | None = None,
+    scheduled_to: datetime | None = None,
+    posted_from: datetime | None = None,
+    posted_to: datetime | None = None,
+    sort: str = "created_at",
+    cursor: str | None = None,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    プロジェクトをまたいで投稿を検索する。sort は created_at（新しい順）・scheduled_at（予約が近い順）・posted_at（新しい順）。
+    次のページは、レスポンスの next_cursor を cursor に渡して取得する。
+    """
+    if sort not in crud.POST_SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {list(crud.POST_SORT_ORDERS)}")
+    limit = max(1, min(limit, 200))
+    posts = await crud_async.get_posts(
+        db,
+        sort=sort,
+        statuses=status_filter,
+        project_id=project_id,
+        scheduled_from=scheduled_from,
+        scheduled_to=scheduled_to,
+        posted_from=posted_from,
+        posted_to=posted_to,
+        after=_decode_post_cursor(sort, cursor) if cursor else None,
+        limit=limit
+    )
+    next_cursor = _encode_post_cursor(sort, posts[-1]) if len(posts) == limit else None
+    return {"items": posts, "next_cursor": next_cursor}
+
+@app.get("/search", response_model=schemas.SearchPage)
+async def search_api(
+    q: str,
+    kind: List[str] | None = Query(None),
+    project_id: int | None = None,
+    limit: int = 20,
+    offset: int = 0,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    投稿・note記事・プロジェクト（名前・ハッシュタグ・リサーチ要約）をまとめて全文検索し、関連度の高い順に返す。
+    kind で種類（post・note_article・project）を絞り込める。次のページは、レスポンスの next_offset を offset に渡して取得する。
+    """
+    if kind and any(k not in search.KINDS for k in kind):
+        raise HTTPException(status_code=400, detail=f"kind must be one of {list(search.KINDS)}")
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    items, hit_count = await db.run_sync(search.search, q, kinds=kind, project_id=project_id, limit=limit, offset=offset)
+    next_offset = offset + limit if hit_count == limit else None
+    return {"items": items, "next_offset": next_offset}
+
+# 本文は image_store が上限つきで受け取りながら解析するので、ドキュメント用にフォームの形だけ書いておく
+_IMAGE_UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+        "required": ["file"]
+    }}}
+}
+
+@app.post("/posts/{post_id}/upload-image", response_model=schemas.Post, openapi_extra={"requestBody": _IMAGE_UPLOAD_REQUEST_BODY})
+async def upload_post_image_api(post_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    db_post = await crud_async.get_post(db, post_id=post_id)
     if not db_post:
         raise HTTPException(status_code=404, detail="Post not found")
     try:
-        image_bytes = await file.read()
-        image_url = utils.upload_image_bytes_to_cloudinary(image_bytes)
+        image_url = await image_store.store_upload(request)
         if not image_url:
             raise HTTPException(status_code=500, detail="Image upload to Cloudinary failed.")
-        updated_post = crud.update_post_image_url(db, post_id=post_id, image_url=image_url)
+        updated_post = await crud_async.update_post_image_url(db, post_id=post_id, image_url=image_url)
         return updated_post
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"!!!!!! Image Upload Failed !!!!!!\nError: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 @app.post("/posts/{post_id}/generate-media-prompts", response_model=dict)
-def generate_media_prompts_api(post_id: int, db: Session = Depends(get_db)):
-    db_post = crud.get_post(db, post_id=post_id)
+async def generate_media_prompts_api(post_id: int, http_request: Request, no_cache: bool = False, db: AsyncSession = Depends(get_db)):
+    db_post = await crud_async.get_post(db, post_id=post_id)
     if not db_post: raise HTTPException(status_code=404, detail="Post not found")
+    await _release_db_connection(db)
     prompt = f"""
 あなたは、最先端の画像生成AI「Midjourney」と動画生成AIを使いこなす、プロのクリエイターです。
 以下のSNS投稿のテキストに最も合う、魅力的でクリエイティブな「画像生成プロンプト」と「動画生成プロンプト」を、それぞれ1つずつ提案してください。
@@ -340,64 +479,101 @@ def generate_media_prompts_api(post_id: int, db: Session = Depends(get_db)):
 }}
 """
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        json_response_text = re.search(r'\{.*\}', response.text, re.DOTALL).group(0)
+        response_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, request=http_request, use_cache=not no_cache)
+        json_response_text = re.search(r'\{.*\}', response_text, re.DOTALL).group(0)
         prompts_data = json.loads(json_response_text)
         return prompts_data
     except Exception as e:
         raise HTTPException(status_code=500, detail="AIによるメディアプロンプトの生成に失敗しました。")
 
 @app.put("/posts/{post_id}", response_model=schemas.Post)
-def update_post_api(post_id: int, post: schemas.PostCreate, db: Session = Depends(get_db)):
-    updated_post = crud.update_post(db, post_id=post_id, content=post.content)
+async def update_post_api(post_id: int, post: schemas.PostCreate, db: AsyncSession = Depends(get_db)):
+    updated_post = await crud_async.update_post(db, post_id=post_id, content=post.content)
     if updated_post is None: raise HTTPException(status_code=404, detail="Post not found")
+    post_timer.timer.sync(updated_post)
     return updated_post
 
 @app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post_api(post_id: int, db: Session = Depends(get_db)):
-    result = crud.delete_post(db, post_id=post_id)
+async def delete_post_api(post_id: int, db: AsyncSession = Depends(get_db)):
+    result = await crud_async.delete_post(db, post_id=post_id)
     if result is None: raise HTTPException(status_code=404, detail="Post not found")
+    post_timer.timer.disarm(post_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.post("/posts/{post_id}/schedule", response_model=schemas.Post)
-def schedule_post_api(post_id: int, schedule: schemas.PostSchedule, db: Session = Depends(get_db)):
+async def schedule_post_api(post_id: int, schedule: schemas.PostSchedule, db: AsyncSession = Depends(get_db)):
     if schedule.scheduled_at.tzinfo is None: schedule.scheduled_at = schedule.scheduled_at.replace(tzinfo=timezone.utc)
     if schedule.scheduled_at < datetime.now(timezone.utc): raise HTTPException(status_code=400, detail="Scheduled time must be in the future.")
-    scheduled_post = crud.schedule_post(db, post_id=post_id, scheduled_at=schedule.scheduled_at)
+    scheduled_post = await crud_async.schedule_post(db, post_id=post_id, scheduled_at=schedule.scheduled_at)
     if scheduled_post is None: raise HTTPException(status_code=404, detail="Post not found")
+    post_timer.timer.arm(scheduled_post.id, scheduled_post.scheduled_at)
     return scheduled_post
 
 @app.post("/posts/{post_id}/post-now", status_code=200)
-def post_now_api(post_id: int, db: Session = Depends(get_db)):
-    db_post = crud.get_post(db, post_id=post_id)
+async def post_now_api(post_id: int, db: AsyncSession = Depends(get_db)):
+    db_post = await crud_async.get_post(db, post_id=post_id)
     if db_post is None: raise HTTPException(status_code=404, detail="Post not found")
+    wait_seconds = limiter.try_acquire(x_client.CREATE_TWEET_ENDPOINT)
+    if wait_seconds > 0:
+        raise HTTPException(status_code=429, detail="X API rate limit reached. Please try again later.", headers={"Retry-After": str(math.ceil(wait_seconds))})
     try:
-        posted_tweet_data = x_client.post_tweet(text=db_post.content, image_url=db_post.image_url)
+        posted_tweet_data = await asyncio.to_thread(x_client.post_tweet, text=db_post.content, image_url=db_post.image_url)
         tweet_id = posted_tweet_data.get('id')
-        crud.update_post_status(db, post_id=post_id, status="posted", tweet_id=tweet_id)
+        await crud_async.update_post_status(db, post_id=post_id, status="posted", tweet_id=tweet_id)
         return {"message": "Tweet posted successfully!", "tweet_id": tweet_id}
+    except tweepy.TooManyRequests as e:
+        retry_after = math.ceil(limiter.wait_time(x_client.CREATE_TWEET_ENDPOINT))
+        raise HTTPException(status_code=429, detail=f"Failed to post to X: {str(e)}", headers={"Retry-After": str(retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to post to X: {str(e)}")
 
+@app.get("/dispatch/status", response_model=schemas.DispatchStatus)
+async def read_dispatch_status_api(db: AsyncSession = Depends(get_db)):
+    return await db.run_sync(dispatcher.get_status)
+
+@app.get("/llm/cache/stats", response_model=schemas.LLMCacheStats)
+async def read_llm_cache_stats_api():
+    return await asyncio.to_thread(llm_cache.stats)
+
+@app.get("/db/pool-stats", response_model=schemas.DBPoolStatsReport)
+async def read_db_pool_stats_api():
+    """データベースの接続プールの状態（使用中の接続数・オーバーフロー・接続の待ち時間）を返す"""
+    return database.get_pool_stats()
+
 @app.post("/posts/{post_id}/update-metrics", response_model=schemas.Post)
-def update_metrics_api(post_id: int, db: Session = Depends(get_db)):
-    db_post = crud.get_post(db, post_id=post_id)
+async def update_metrics_api(post_id: int, db: AsyncSession = Depends(get_db)):
+    db_post = await crud_async.get_post(db, post_id=post_id)
     if not db_post or not db_post.tweet_id: raise HTTPException(status_code=404, detail="Posted tweet with tweet_id not found")
+    posted_at = db_post.posted_at or db_post.scheduled_at or db_post.created_at
     try:
-        metrics = x_client.get_tweet_metrics(db_post.tweet_id)
-        updated_post = crud.update_post_metrics(db, post_id=post_id, metrics=metrics)
-        return updated_post
+        # 定期更新と同じく、履歴のスナップショットを追記して次回の更新時刻も進める
+        refreshed = await asyncio.to_thread(metrics.refresh_post_metrics, post_id, db_post.tweet_id, posted_at)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update metrics: {str(e)}")
+    if refreshed is None:
+        retry_after = math.ceil(limiter.wait_time(x_client.GET_TWEETS_ENDPOINT))
+        raise HTTPException(status_code=429, detail="X API rate limit reached. Please try again later.", headers={"Retry-After": str(retry_after)})
+    # 別のセッションで書き込んだので、読み込み済みの投稿を読み直して返す
+    await db.refresh(db_post)
+    return db_post
+
+@app.post("/posts/metrics/refresh", response_model=schemas.MetricsRefreshResult)
+async def refresh_all_metrics_api(due_only: bool = False):
+    # X APIの呼び出しと同期のDB書き込みを行うので、イベントループを止めないよう別スレッドで実行する
+    return await asyncio.to_thread(metrics.refresh_all_metrics, due_only=due_only)
+
+@app.get("/posts/{post_id}/metrics/history", response_model=List[schemas.PostMetricSnapshot])
+async def read_post_metric_history_api(post_id: int, db: AsyncSession = Depends(get_db)):
+    if await crud_async.get_post(db, post_id=post_id) is None: raise HTTPException(status_code=404, detail="Post not found")
+    return await crud_async.get_post_metric_history(db, post_id=post_id)
 
 # -- Character Endpoints --
 @app.post("/characters/", response_model=schemas.Character)
-def create_character_api(character: schemas.CharacterCreate, db: Session = Depends(get_db)):
-    return crud.create_character(db=db, character=character)
+async def create_character_api(character: schemas.CharacterCreate, db: AsyncSession = Depends(get_db)):
+    return await crud_async.create_character(db=db, character=character)
 
 @app.post("/characters/generate-details", response_model=schemas.CharacterBase)
-def generate_character_details_api(request: schemas.GenerateCharacterRequest):
+async def generate_character_details_api(request: schemas.GenerateCharacterRequest, http_request: Request):
     prompt = f"""
 以下のキーワードを基に、魅力的で一貫性のあるSNS投稿用のキャラクターペルソナを詳細に設定してください。
 出力は、必ず以下のJSON形式に厳密に従ってください。
@@ -405,60 +581,67 @@ def generate_character_details_api(request: schemas.GenerateCharacterRequest):
 # 出力形式 (JSON): {{"name": "（キャラクター名）","title": "（役割/肩書）","expertise": "（専門分野・テーマ）","background": "（ペルソナの経歴や物語）","values_beliefs": "（価値観・信念）","goal": "（発信活動の目標）","base_tone": "（口調の基本：丁寧語、常体など）","style_features": "（文体の特徴）","catchphrases": "（口癖・決め台詞）","favorite_emojis": "（よく使う絵文字）","impression": "（読者に与えたい印象）"}}
 """
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        json_response_text = re.search(r'\{.*\}', response.text, re.DOTALL).group(0)
+        response_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, request=http_request, use_cache=not request.no_cache)
+        json_response_text = re.search(r'\{.*\}', response_text, re.DOTALL).group(0)
         character_data = json.loads(json_response_text)
         return schemas.CharacterBase(**character_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail="AIによるキャラクター生成に失敗しました。")
 
 @app.get("/characters/", response_model=List[schemas.Character])
-def read_characters_api(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_characters(db, skip=skip, limit=limit)
+async def read_characters_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    return await crud_async.get_characters(db, skip=skip, limit=limit)
 
 @app.get("/characters/{character_id}", response_model=schemas.Character)
-def read_character_api(character_id: int, db: Session = Depends(get_db)):
-    db_character = crud.get_character(db, character_id=character_id)
+async def read_character_api(character_id: int, db: AsyncSession = Depends(get_db)):
+    db_character = await crud_async.get_character(db, character_id=character_id)
     if db_character is None: raise HTTPException(status_code=404, detail="Character not found")
     return db_character
 
+@app.get("/characters/{character_id}/metrics", response_model=schemas.MetricsSummary)
+async def read_character_metrics_api(character_id: int, db: AsyncSession = Depends(get_db)):
+    if await crud_async.get_character(db, character_id=character_id) is None: raise HTTPException(status_code=404, detail="Character not found")
+    return await crud_async.get_metrics_summary(db, character_id=character_id)
+
 @app.put("/characters/{character_id}", response_model=schemas.Character)
-def update_character_api(character_id: int, character: schemas.CharacterCreate, db: Session = Depends(get_db)):
-    updated_character = crud.update_character(db, character_id=character_id, character=character)
+async def update_character_api(character_id: int, character: schemas.CharacterCreate, db: AsyncSession = Depends(get_db)):
+    updated_character = await crud_async.update_character(db, character_id=character_id, character=character)
     if updated_character is None: raise HTTPException(status_code=404, detail="Character not found")
+    prompts.profiles.invalidate()
     return updated_character
 
 @app.delete("/characters/{character_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_character_api(character_id: int, db: Session = Depends(get_db)):
-    result = crud.delete_character(db, character_id=character_id)
+async def delete_character_api(character_id: int, db: AsyncSession = Depends(get_db)):
+    result = await crud_async.delete_character(db, character_id=character_id)
     if result is None: raise HTTPException(status_code=404, detail="Character not found")
+    prompts.profiles.invalidate()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # -- Setting Endpoints --
 @app.get("/settings/", response_model=List[schemas.Setting])
-def read_settings_api(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_all_settings(db, skip=skip, limit=limit)
+async def read_settings_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    return await crud_async.get_all_settings(db, skip=skip, limit=limit)
 
 @app.get("/settings/{key}", response_model=schemas.Setting)
-def read_setting_api(key: str, db: Session = Depends(get_db)):
-    db_setting = crud.get_setting(db, key=key)
+async def read_setting_api(key: str, db: AsyncSession = Depends(get_db)):
+    db_setting = await db.run_sync(setting_cache.get_setting, key=key)
     if db_setting is None: raise HTTPException(status_code=404, detail="Setting not found")
     return db_setting
 
 @app.put("/settings/{key}", response_model=schemas.Setting)
-def update_setting_api(key: str, setting: schemas.SettingUpdate, db: Session = Depends(get_db)):
-    updated_setting = crud.update_setting(db, key=key, setting=setting)
+async def update_setting_api(key: str, setting: schemas.SettingUpdate, db: AsyncSession = Depends(get_db)):
+    updated_setting = await crud_async.update_setting(db, key=key, setting=setting)
     if updated_setting is None: raise HTTPException(status_code=404, detail="Setting not found")
+    setting_cache.cache.put(updated_setting)
     return updated_setting
     
 # -- TargetPersona Endpoints --
 @app.post("/target-personas/", response_model=schemas.TargetPersona)
-def create_target_persona_api(persona: schemas.TargetPersonaCreate, db: Session = Depends(get_db)):
-    return crud.create_target_persona(db=db, persona=persona)
+async def create_target_persona_api(persona: schemas.TargetPersonaCreate, db: AsyncSession = Depends(get_db)):
+    return await crud_async.create_target_persona(db=db, persona=persona)
 
 @app.post("/target-personas/generate-details", response_model=schemas.TargetPersonaBase)
-def generate_target_persona_details_api(request: schemas.GenerateTargetPersonaRequest):
+async def generate_target_persona_details_api(request: schemas.GenerateTargetPersonaRequest, http_request: Request):
     prompt = f"""
 以下のキーワードを基に、SNSで情報発信する際の、具体的なターゲットペルソナを詳細に設定してください。
 出力は、必ず以下のJSON形式に厳密に従ってください。
@@ -476,40 +659,41 @@ def generate_target_persona_details_api(request: schemas.GenerateTargetPersonaRe
 }}
 """
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        json_response_text = re.search(r'\{.*\}', response.text, re.DOTALL).group(0)
+        response_text = await llm.generate(prompt, model_name=llm.PRO_MODEL, request=http_request, use_cache=not request.no_cache)
+        json_response_text = re.search(r'\{.*\}', response_text, re.DOTALL).group(0)
         persona_data = json.loads(json_response_text)
         return schemas.TargetPersonaBase(**persona_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail="AIによるターゲットペルソナ生成に失敗しました。")
 
 @app.get("/target-personas/", response_model=List[schemas.TargetPersona])
-def read_target_personas_api(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_target_personas(db, skip=skip, limit=limit)
+async def read_target_personas_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    return await crud_async.get_target_personas(db, skip=skip, limit=limit)
 
 @app.get("/target-personas/{persona_id}", response_model=schemas.TargetPersona)
-def read_target_persona_api(persona_id: int, db: Session = Depends(get_db)):
-    db_persona = crud.get_target_persona(db, persona_id=persona_id)
+async def read_target_persona_api(persona_id: int, db: AsyncSession = Depends(get_db)):
+    db_persona = await crud_async.get_target_persona(db, persona_id=persona_id)
     if db_persona is None:
         raise HTTPException(status_code=404, detail="Target Persona not found")
     return db_persona
 
 @app.put("/target-personas/{persona_id}", response_model=schemas.TargetPersona)
-def update_target_persona_api(persona_id: int, persona: schemas.TargetPersonaCreate, db: Session = Depends(get_db)):
-    updated_persona = crud.update_target_persona(db, persona_id=persona_id, persona=persona)
+async def update_target_persona_api(persona_id: int, persona: schemas.TargetPersonaCreate, db: AsyncSession = Depends(get_db)):
+    updated_persona = await crud_async.update_target_persona(db, persona_id=persona_id, persona=persona)
     if updated_persona is None:
         raise HTTPException(status_code=404, detail="Target Persona not found")
+    prompts.profiles.invalidate()
     return updated_persona
 
 @app.delete("/target-personas/{persona_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_target_persona_api(persona_id: int, db: Session = Depends(get_db)):
-    result = crud.delete_target_persona(db, persona_id=persona_id)
+async def delete_target_persona_api(persona_id: int, db: AsyncSession = Depends(get_db)):
+    result = await crud_async.delete_target_persona(db, persona_id=persona_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Target Persona not found")
+    prompts.profiles.invalidate()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
     
 # --- Root Endpoint ---
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World", "Database": "Connected!"}
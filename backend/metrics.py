@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import database, crud, x_client
+from config import settings
+from rate_limit import limiter
+
+# 投稿からの経過時間に応じたメトリクスの更新間隔。
+# 投稿から1日目は1時間ごと、1週間目までは1日ごと、それ以降は1週間ごとに更新して、API呼び出しの総数を抑える
+REFRESH_CADENCE = (
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=7), timedelta(days=1)),
+)
+LONG_TAIL_REFRESH_INTERVAL = timedelta(weeks=1)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def next_refresh_at(posted_at: datetime | None, now: datetime) -> datetime:
+    """投稿日時から、次にメトリクスを更新すべき時刻を決める"""
+    if posted_at is None:
+        return now + LONG_TAIL_REFRESH_INTERVAL
+    age = now - _as_utc(posted_at)
+    for max_age, interval in REFRESH_CADENCE:
+        if age < max_age:
+            return now + interval
+    return now + LONG_TAIL_REFRESH_INTERVAL
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _refresh_batch(batch: list) -> int | None:
+    """
+    最大100件の (post_id, tweet_id, posted_at) のメトリクスを1回のAPI呼び出しで取得し、1トランザクションで書き込む。
+    レート制限の枠がなければ何もせず None を返す（次回の更新に回す）。
+    """
+    if limiter.try_acquire(x_client.GET_TWEETS_ENDPOINT) > 0:
+        return None
+
+    metrics_by_tweet_id = x_client.get_tweets_metrics([tweet_id for _, tweet_id, _ in batch])
+    now = datetime.now(timezone.utc)
+    metrics_by_post_id = {}
+    next_refresh_by_post_id = {}
+    for post_id, tweet_id, posted_at in batch:
+        if tweet_id in metrics_by_tweet_id:
+            metrics_by_post_id[post_id] = metrics_by_tweet_id[tweet_id]
+            next_refresh_by_post_id[post_id] = next_refresh_at(posted_at, now)
+
+    db = database.SessionLocal()
+    try:
+        return crud.bulk_update_post_metrics(db, metrics_by_post_id, next_refresh_by_post_id, captured_at=now)
+    finally:
+        db.close()
+
+def refresh_post_metrics(post_id: int, tweet_id: str, posted_at: datetime | None) -> int | None:
+    """
+    1件のツイートのメトリクスを、定期更新と同じ経路（レート制限の枠の確保・スナップショットの追記・次回更新時刻の更新）で取得する。
+    更新できたら1、ツイートが見つからなければ0、レート制限の枠がなければ None を返す。
+    """
+    return _refresh_batch([(post_id, str(tweet_id), posted_at)])
+
+def _refresh_batch_safely(batch: list) -> int | None | Exception:
+    try:
+        return _refresh_batch(batch)
+    except Exception as e:
+        return e
+
+def refresh_all_metrics(due_only: bool = False) -> dict:
+    """
+    投稿済みツイートのメトリクスを、100件ずつのバッチに分けて並行して更新する関数。
+    due_only=True なら、経過時間に応じた次回更新時刻を過ぎたツイートだけを更新する。
+    """
+    db = database.SessionLocal()
+    try:
+        due_before = datetime.now(timezone.utc) if due_only else None
+        posted = [
+            (post_id, str(tweet_id), posted_at)
+            for post_id, tweet_id, posted_at in crud.get_posts_for_metrics_refresh(db, due_before=due_before)
+        ]
+    finally:
+        db.close()
+
+    batches = list(_chunks(posted, x_client.MAX_TWEET_IDS_PER_LOOKUP))
+    with ThreadPoolExecutor(max_workers=settings.METRICS_REFRESH_CONCURRENCY, thread_name_prefix="metrics-refresh") as executor:
+        results = list(executor.map(_refresh_batch_safely, batches))
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        print(f"Failed to refresh a metrics batch. Error: {error}")
+    result = {
+        "posts": len(posted),
+        "batches": len(batches),
+        "refreshed": sum(result for result in results if isinstance(result, int)),
+        "deferred_batches": sum(1 for result in results if result is None),
+        "failed_batches": len(errors),
+    }
+    print(f"Metrics refresh finished: {result}")
+    return result
+
+def refresh_due_metrics() -> dict:
+    """定期実行用：次回更新時刻を過ぎたツイートのメトリクスだけを更新する"""
+    return refresh_all_metrics(due_only=True)
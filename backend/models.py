@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, TEXT
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, TEXT, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -12,6 +17,10 @@ class Project(Base):
     latest_ai_response = Column(TEXT, nullable=True)
     research_summary = Column(TEXT, nullable=True)
     hashtags = Column(TEXT, nullable=True)
+    # URLの読み込みとAI要約の進み具合（pending -> running -> done / skipped / failed）
+    # 既存の行は作成時に要約まで済んでいるので、DB側の既定値は "done" にしておく
+    enrichment_status = Column(String(20), nullable=False, default="pending", server_default="done", index=True)
+    enrichment_error = Column(TEXT, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -20,13 +29,26 @@ class Project(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # プロジェクトごとの状態別の投稿数を、テーブルを読まずにインデックスだけで数えるため
+        Index("ix_posts_project_id_status", "project_id", "status"),
+        # 予約投稿のディスパッチと GET /posts の絞り込み・キーセット・ページネーション用（id は同時刻の並び順を決める）
+        Index("ix_posts_status_scheduled_at_id", "status", "scheduled_at", "id"),
+        Index("ix_posts_status_posted_at_id", "status", "posted_at", "id"),
+        Index("ix_posts_project_id_created_at_id", "project_id", "created_at", "id"),
+        Index("ix_posts_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(TEXT, nullable=False)
     status = Column(String, default="draft")
     scheduled_at = Column(DateTime(timezone=True), nullable=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)
+    # SQLiteの CURRENT_TIMESTAMP は秒単位の文字列になり、カーソルに入れるマイクロ秒付きの日時と比べると順序がずれる。
+    # キーセット・ページネーションで正しく比べられるよう、作成日時はアプリ側で入れる（DB側の既定値は直接INSERTする行のため）
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
+    posted_at = Column(DateTime(timezone=True), nullable=True)
     
     tweet_id = Column(String, nullable=True)
     retweet_count = Column(Integer, default=0)
@@ -34,8 +56,67 @@ class Post(Base):
     like_count = Column(Integer, default=0)
     impression_count = Column(Integer, default=0)
     image_url = Column(TEXT, nullable=True)
+    retry_count = Column(Integer, default=0)
+    failure_reason = Column(TEXT, nullable=True)
+    metrics_refresh_due_at = Column(DateTime(timezone=True), nullable=True)
+    # ディスパッチで "posting" に確保した日時（送信中のまま止まった投稿を見つけるため）
+    posting_started_at = Column(DateTime(timezone=True), nullable=True)
     
     project = relationship("Project", back_populates="posts")
+    metric_snapshots = relationship("PostMetricSnapshot", back_populates="post", cascade="all, delete-orphan")
+
+# アップロード済み画像（同じ内容の画像はハッシュで見つけて、Cloudinaryには1回だけ保存する）
+class ImageAsset(Base):
+    __tablename__ = "image_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False, unique=True, index=True)
+    url = Column(TEXT, nullable=False)
+    byte_size = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# プロジェクトURLの取得結果（再クロール時の条件付きGETと、内容が変わっていないときの要約スキップに使う）
+class CrawlCache(Base):
+    __tablename__ = "crawl_cache"
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String, nullable=False, unique=True, index=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    # 最後に要約が保存できたときのテキストのハッシュ（要約に失敗したページは、次回も変更ありとして扱う）
+    content_hash = Column(String(64), nullable=True)
+    text = Column(TEXT, nullable=True)
+    # 最後に本文を受け取った日時と、最後に確認した日時（304を含む）
+    fetched_at = Column(DateTime(timezone=True), nullable=True)
+    checked_at = Column(DateTime(timezone=True), nullable=True)
+
+# ページのチャンクごとの要約（内容が同じチャンクは、再要約のときにGeminiを呼ばずに使い回す）
+class ChunkSummary(Base):
+    __tablename__ = "chunk_summaries"
+
+    id = Column(Integer, primary_key=True)
+    # モデル名とチャンク本文から作ったSHA-256
+    chunk_hash = Column(String(64), nullable=False, unique=True, index=True)
+    model = Column(String, nullable=False)
+    summary = Column(TEXT, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# メトリクスの履歴（追記のみ。更新のたびに1行ずつ増える）
+class PostMetricSnapshot(Base):
+    __tablename__ = "post_metric_snapshots"
+    __table_args__ = (
+        Index("ix_post_metric_snapshots_post_id_captured_at", "post_id", "captured_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+    captured_at = Column(DateTime(timezone=True), nullable=False)
+    retweet_count = Column(Integer, default=0)
+    reply_count = Column(Integer, default=0)
+    like_count = Column(Integer, default=0)
+    impression_count = Column(Integer, default=0)
+
+    post = relationship("Post", back_populates="metric_snapshots")
 
 class Character(Base):
     __tablename__ = "characters"
@@ -54,6 +135,8 @@ class Character(Base):
     catchphrases = Column(TEXT, nullable=True)
     favorite_emojis = Column(TEXT, nullable=True)
     impression = Column(TEXT, nullable=True)
+    # 更新のたびに1つ増やす（プロンプトのセクションキャッシュが古さに気づくための目印）
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 class Setting(Base):
     __tablename__ = "settings"
@@ -62,6 +145,8 @@ class Setting(Base):
     key = Column(String, nullable=False, unique=True, index=True)
     value = Column(TEXT, nullable=True)
     description = Column(TEXT, nullable=True)
+    # 更新のたびに1つ増やす（他のプロセスが設定キャッシュの古さに気づくための目印）
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -76,6 +161,8 @@ class TargetPersona(Base):
     info_sources = Column(TEXT, nullable=True)
     keywords = Column(TEXT, nullable=True)
     decision_triggers = Column(TEXT, nullable=True)
+    # 更新のたびに1つ増やす（プロンプトのセクションキャッシュが古さに気づくための目印）
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -92,3 +179,40 @@ class NoteArticle(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     project = relationship("Project", back_populates="note_articles")
+
+# 一括生成ジョブ（プロジェクト × キャラクター × ペルソナの組み合わせを、まとめてワーカーに処理させる）
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default="pending")
+    language = Column(String, nullable=True)
+    no_cache = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    items = relationship("GenerationJobItem", back_populates="job", cascade="all, delete-orphan", order_by="GenerationJobItem.id")
+
+class GenerationJobItem(Base):
+    __tablename__ = "generation_job_items"
+    __table_args__ = (
+        Index("ix_generation_job_items_status_available_at", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("generation_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)
+    target_persona_id = Column(Integer, ForeignKey("target_personas.id", ondelete="SET NULL"), nullable=True)
+    # pending -> running -> done / failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # 再試行の待ち時間が明けるまでは確保しない
+    available_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    error = Column(TEXT, nullable=True)
+    # 生成された投稿のID（JSON配列）
+    post_ids = Column(TEXT, nullable=True)
+
+    job = relationship("GenerationJob", back_populates="items")
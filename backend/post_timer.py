@@ -0,0 +1,136 @@
+import heapq
+import threading
+from datetime import datetime, timezone, timedelta
+
+import database, crud
+
+# ディスパッチに失敗したときに、同じ投稿を再度起こすまでの待ち時間
+RETRY_DELAY = timedelta(seconds=30)
+
+def _as_utc(value: datetime) -> datetime:
+    """タイムゾーン情報のない日時（SQLiteから読んだ値など）をUTCとして扱う"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+class PostTimer:
+    """
+    予約投稿の scheduled_at を最小ヒープで管理し、最も早い予約時刻にだけ目を覚ますタイマー。
+    予約の変更・削除ではヒープを直接いじらず、_armed に最新の予約時刻を持っておき、
+    取り出したときに古くなったエントリを読み捨てる。
+    """
+
+    def __init__(self):
+        self._on_due = None
+        self._heap: list[tuple[datetime, int]] = []
+        self._armed: dict[int, datetime] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+    def load(self, scheduled_posts):
+        """(post_id, scheduled_at) の一覧でヒープを作り直す"""
+        with self._cond:
+            self._armed = {post_id: _as_utc(scheduled_at) for post_id, scheduled_at in scheduled_posts}
+            self._heap = [(scheduled_at, post_id) for post_id, scheduled_at in self._armed.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def arm(self, post_id: int, scheduled_at: datetime):
+        """投稿の予約時刻を登録（または更新）する"""
+        scheduled_at = _as_utc(scheduled_at)
+        with self._cond:
+            self._armed[post_id] = scheduled_at
+            heapq.heappush(self._heap, (scheduled_at, post_id))
+            if self._heap[0] == (scheduled_at, post_id):
+                self._cond.notify()
+
+    def disarm(self, post_id: int):
+        """投稿の予約を取り消す（ヒープ上のエントリは取り出し時に読み捨てられる）"""
+        with self._cond:
+            self._armed.pop(post_id, None)
+
+    def sync(self, post):
+        """Postの現在の状態に合わせて、予約を登録または取り消す"""
+        if post.status == "scheduled" and post.scheduled_at:
+            self.arm(post.id, post.scheduled_at)
+        else:
+            self.disarm(post.id)
+
+    def next_due_at(self) -> datetime | None:
+        """次に目を覚ます予定の時刻を返す"""
+        with self._cond:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def start(self, on_due):
+        """予約時刻になるたびに on_due を呼び出すタイマースレッドを開始する"""
+        with self._cond:
+            if self._running:
+                return
+            self._on_due = on_due
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="post-timer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _discard_stale(self):
+        while self._heap:
+            scheduled_at, post_id = self._heap[0]
+            if self._armed.get(post_id) == scheduled_at:
+                return
+            heapq.heappop(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    self._discard_stale()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(timeout=delay)
+                if not self._running:
+                    return
+
+                now = datetime.now(timezone.utc)
+                due_post_ids = []
+                while self._heap and self._heap[0][0] <= now:
+                    scheduled_at, post_id = heapq.heappop(self._heap)
+                    if self._armed.get(post_id) == scheduled_at:
+                        del self._armed[post_id]
+                        due_post_ids.append(post_id)
+
+            if due_post_ids:
+                # 投稿処理が長引いてもタイマー自体は止めないよう、別スレッドで実行する
+                threading.Thread(target=self._fire, args=(due_post_ids,), daemon=True).start()
+
+    def _fire(self, due_post_ids: list[int]):
+        try:
+            self._on_due()
+        except Exception as e:
+            print(f"Failed to dispatch due posts {due_post_ids}. Error: {e}")
+            retry_at = datetime.now(timezone.utc) + RETRY_DELAY
+            for post_id in due_post_ids:
+                self.arm(post_id, retry_at)
+
+# アプリ全体で共有するタイマー
+timer = PostTimer()
+
+def reload():
+    """データベース上の予約投稿でタイマーを初期化する"""
+    db = database.SessionLocal()
+    try:
+        timer.load(crud.get_scheduled_post_times(db))
+    finally:
+        db.close()
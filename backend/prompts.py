@@ -0,0 +1,183 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import Session
+
+import crud, models
+from config import settings
+
+# テンプレート中のプレースホルダー（例: {{project_name}}）
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+SECTION_CACHE_SIZE = 512
+
+class CompiledTemplate:
+    """テンプレートを固定文字列とプレースホルダー名に分解しておき、1回の結合でプロンプトを組み立てるクラス"""
+
+    def __init__(self, text: str):
+        parts = _PLACEHOLDER.split(text)
+        self._literals = parts[0::2]
+        self._names = parts[1::2]
+
+    def render(self, values: dict[str, str]) -> str:
+        pieces = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            # 値のないプレースホルダーは、これまで通りそのまま残す
+            pieces.append(values.get(name, "{{" + name + "}}"))
+            pieces.append(literal)
+        return "".join(pieces)
+
+class _LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class ProfileCache:
+    """
+    プロンプトに埋め込むキャラクターとペルソナの行をIDごとにメモリに持ち、組み立てのたびにDBに問い合わせずに返すキャッシュ。
+    このプロセスでの更新・削除は invalidate() ですぐに反映し、他のプロセスでの更新は poll_seconds ごとに
+    件数・バージョンの合計・IDの合計（フィンガープリント）を確かめて、変わっていれば全て捨てる。
+    """
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._rows: dict[tuple, object] = {}
+        self._fingerprint: tuple | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self, db: Session):
+        with self._lock:
+            if self._fingerprint is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+                return
+            # 同時に来た他のリクエストが重ねて確認しないよう、先に確認時刻を進めておく
+            self._checked_at = time.monotonic()
+            fingerprint = self._fingerprint
+        current = crud.get_profiles_fingerprint(db)
+        if current != fingerprint:
+            with self._lock:
+                self._rows = {}
+                self._fingerprint = current
+
+    def _get(self, db: Session, model, row_id: int):
+        self._refresh_if_stale(db)
+        key = (model.__tablename__, row_id)
+        with self._lock:
+            row = self._rows.get(key)
+        if row is None:
+            row = crud.get_profile_row(db, model, row_id)
+            if row is not None:
+                with self._lock:
+                    self._rows[key] = row
+        return row
+
+    def get_character(self, db: Session, character_id: int):
+        return self._get(db, models.Character, character_id)
+
+    def get_target_persona(self, db: Session, persona_id: int):
+        return self._get(db, models.TargetPersona, persona_id)
+
+    def invalidate(self):
+        """このプロセスでキャラクターかペルソナを更新・削除したときに呼ぶ"""
+        with self._lock:
+            self._rows = {}
+            self._fingerprint = None
+
+# アプリ全体で共有するキャラクター・ペルソナのキャッシュ
+profiles = ProfileCache(poll_seconds=settings.SETTINGS_CACHE_POLL_SECONDS)
+
+# 設定キー -> (テンプレート本文, コンパイル結果)。本文が変わったら作り直す
+_templates: dict[str, tuple[str, CompiledTemplate]] = {}
+_templates_lock = threading.Lock()
+_sections = _LRUCache(SECTION_CACHE_SIZE)
+
+def get_template(setting: models.Setting) -> CompiledTemplate:
+    """Settingのテンプレートを一度だけコンパイルし、Settingの値が変わるまで使い回す"""
+    with _templates_lock:
+        cached = _templates.get(setting.key)
+        if cached and cached[0] == setting.value:
+            return cached[1]
+    compiled = CompiledTemplate(setting.value)
+    with _templates_lock:
+        _templates[setting.key] = (setting.value, compiled)
+    return compiled
+
+def _row_version(row) -> tuple:
+    # version は crud の更新のたびに1つ増えるので、同じ秒の中で続けて更新されても古いセクションは返さない
+    return (row.id, row.version)
+
+def character_section(character: models.Character, deliverable: str) -> str:
+    """キャラクター情報のプロンプト部分（IDとバージョンごとにキャッシュする）"""
+    key = ("character", deliverable) + _row_version(character)
+    section = _sections.get(key)
+    if section is None:
+        section = f"""
+# 投稿者キャラクター情報
+あなたは以下の設定を持つ、非常に魅力的な人物です。このキャラクターに完全になりきって、{deliverable}を作成してください。
+- 肩書: {character.title}
+- 専門分野: {character.expertise}
+- 背景: {character.background}
+- 価値観: {character.values_beliefs}
+- 目標: {character.goal}
+- 口調: {character.base_tone}で、以下の特徴を持つ: {character.style_features}
+- 口癖: {character.catchphrases}
+- 読者に与えたい印象: {character.impression}
+"""
+        _sections.put(key, section)
+    return section
+
+def target_persona_section(target_persona: models.TargetPersona) -> str:
+    """ターゲットペルソナ情報のプロンプト部分（IDとバージョンごとにキャッシュする）"""
+    key = ("target_persona",) + _row_version(target_persona)
+    section = _sections.get(key)
+    if section is None:
+        section = f"""
+# ターゲット読者情報
+以下のペルソナを持つ読者に、最も響くようにコンテンツを作成してください。
+- ペルソナ: {target_persona.name}
+- 抱えている課題: {target_persona.challenges}
+- 達成したいこと: {target_persona.goals}
+- 知識レベル: {target_persona.knowledge_level}
+- 心を動かすキーワード: {target_persona.keywords}
+- 行動の決め手: {target_persona.decision_triggers}
+"""
+        _sections.put(key, section)
+    return section
+
+def render(
+    setting: models.Setting,
+    project: models.Project,
+    character: models.Character | None = None,
+    target_persona: models.TargetPersona | None = None,
+    language: str | None = None,
+    deliverable: str = "コンテンツ",
+) -> str:
+    """
+    X投稿・note記事の生成プロンプトを組み立てる共通関数。
+    deliverable はキャラクター指示の「〜を作成してください」に入る言葉（例: "コンテンツ"、"記事"）。
+    """
+    return get_template(setting).render({
+        "language": language or "日本語",
+        "character_section": character_section(character, deliverable) if character else "",
+        "target_persona_section": target_persona_section(target_persona) if target_persona else "",
+        "project_name": project.name,
+        "project_url": project.url,
+        "research_summary": project.research_summary or "調査結果なし",
+        "hashtags": project.hashtags or "",
+    })
@@ -0,0 +1,106 @@
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# パスに含まれるIDを置き換えて、同じエンドポイントを1つのキーにまとめるための正規表現
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def endpoint_key(method: str, url: str) -> str:
+    """HTTPメソッドとURLから、レート制限を管理するためのエンドポイント名を作る（例: "POST /2/tweets"）"""
+    path = _ID_SEGMENT.sub("/:id", urlparse(url).path)
+    return f"{method.upper()} {path}"
+
+class TokenBucket:
+    """
+    X APIのエンドポイント1つ分のレート制限。
+    x-rate-limit-* ヘッダからウィンドウの上限・残り回数・リセット時刻を学習し、
+    残り回数がなくなったらリセット時刻まで送信を待たせる。ヘッダを受け取るまでは制限しない。
+    """
+
+    def __init__(self):
+        self.limit: int | None = None
+        self.remaining: int | None = None
+        self.reset_at: float | None = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.reset_at is not None and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = None
+
+    def try_acquire(self) -> float:
+        """送信枠を1つ確保する。確保できたら0を、できなければリセットまでの秒数を返す"""
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            if self.remaining is None:
+                return 0.0
+            if self.remaining > 0:
+                self.remaining -= 1
+                return 0.0
+            return max(self.reset_at - now, 0.0) if self.reset_at else 0.0
+
+    def wait_time(self) -> float:
+        """送信枠が空くまでの秒数を返す（枠は消費しない）"""
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            if self.remaining is None or self.remaining > 0 or not self.reset_at:
+                return 0.0
+            return max(self.reset_at - now, 0.0)
+
+    def update(self, headers):
+        """レスポンスヘッダの x-rate-limit-* で状態を更新する"""
+        limit = headers.get("x-rate-limit-limit")
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            if limit is not None:
+                self.limit = int(limit)
+            self.remaining = int(remaining)
+            self.reset_at = float(reset)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refill(time.time())
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_at": datetime.fromtimestamp(self.reset_at, timezone.utc) if self.reset_at else None,
+            }
+
+class RateLimiter:
+    """エンドポイントごとの TokenBucket をまとめて管理するクラス"""
+
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket()
+            return self._buckets[key]
+
+    def try_acquire(self, key: str) -> float:
+        return self.bucket(key).try_acquire()
+
+    def wait_time(self, key: str) -> float:
+        return self.bucket(key).wait_time()
+
+    def observe(self, response, *args, **kwargs):
+        """requests のレスポンスフックとして登録し、すべてのレスポンスのヘッダを取り込む"""
+        key = endpoint_key(response.request.method, response.request.url)
+        self.bucket(key).update(response.headers)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.snapshot() for key, bucket in buckets.items()}
+
+# アプリ全体で共有するレート制限の状態
+limiter = RateLimiter()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 
 # --- NoteArticle Schemas (Projectで参照するため先に定義) ---
 class NoteArticleBase(BaseModel):
@@ -36,15 +36,64 @@ class Post(PostBase):
     status: str
     scheduled_at: Optional[datetime] = None
     project_id: int
+    character_id: Optional[int] = None
     created_at: datetime
+    posted_at: Optional[datetime] = None
     tweet_id: Optional[str] = None
     retweet_count: Optional[int] = 0
     reply_count: Optional[int] = 0
     like_count: Optional[int] = 0
     impression_count: Optional[int] = 0
     image_url: Optional[str] = None
+    retry_count: Optional[int] = 0
+    failure_reason: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class PostPage(BaseModel):
+    items: List[Post]
+    # 次のページを取得するときに cursor に渡す値（最後のページなら None）
+    next_cursor: Optional[str] = None
+
+class PostMetricSnapshot(BaseModel):
+    captured_at: datetime
+    retweet_count: Optional[int] = 0
+    reply_count: Optional[int] = 0
+    like_count: Optional[int] = 0
+    impression_count: Optional[int] = 0
     class Config:
         from_attributes = True
+class MetricsDailyPoint(BaseModel):
+    day: date
+    retweet_count: int = 0
+    reply_count: int = 0
+    like_count: int = 0
+    impression_count: int = 0
+class MetricsSummary(BaseModel):
+    posted_count: int = 0
+    retweet_count: int = 0
+    reply_count: int = 0
+    like_count: int = 0
+    impression_count: int = 0
+    daily: List[MetricsDailyPoint] = []
+class MetricsRefreshResult(BaseModel):
+    posts: int
+    batches: int
+    refreshed: int
+    deferred_batches: int
+    failed_batches: int
+
+# --- Dispatch Schemas ---
+class RateLimitState(BaseModel):
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    reset_at: Optional[datetime] = None
+class DispatchStatus(BaseModel):
+    queue_depth: int
+    in_flight: int
+    next_due_at: Optional[datetime] = None
+    next_send_at: Optional[datetime] = None
+    rate_limits: Dict[str, RateLimitState] = {}
 
 # --- Character Schemas ---
 class CharacterBase(BaseModel):
@@ -75,13 +124,20 @@ class ProjectBase(BaseModel):
     hashtags: Optional[str] = None
 class ProjectCreate(ProjectBase):
     pass
+class ProjectBulkCreate(BaseModel):
+    projects: List[ProjectCreate]
 class ProjectSummaryUpdate(BaseModel):
     research_summary: str
+class RecrawlResult(BaseModel):
+    project_id: int
+    result: str
 class Project(ProjectBase):
     id: int
     latest_ai_response: str | None = None
     research_summary: str | None = None
     hashtags: Optional[str] = None
+    enrichment_status: Optional[str] = None
+    enrichment_error: Optional[str] = None
     created_at: datetime
     updated_at: datetime | None = None
     posts: List[Post] = []
@@ -89,6 +145,24 @@ class Project(ProjectBase):
     class Config:
         from_attributes = True
 
+class ProjectListItem(BaseModel):
+    id: int
+    name: str
+    url: str
+    hashtags: Optional[str] = None
+    enrichment_status: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    draft_count: int = 0
+    scheduled_count: int = 0
+    posted_count: int = 0
+    class Config:
+        from_attributes = True
+class ProjectListPage(BaseModel):
+    items: List[ProjectListItem]
+    # 次のページを取得するときに before_id に渡す値（最後のページなら None）
+    next_before_id: Optional[int] = None
+
 # --- TargetPersona Schemas ---
 class TargetPersonaBase(BaseModel):
     name: str
@@ -112,10 +186,67 @@ class GeneratePostsRequest(BaseModel):
     character_id: Optional[int] = None
     target_persona_id: Optional[int] = None
     language: Optional[str] = "日本語"
+    no_cache: bool = False
 class GenerateCharacterRequest(BaseModel):
     seed_text: str
+    no_cache: bool = False
 class GenerateTargetPersonaRequest(BaseModel):
     seed_text: str
+    no_cache: bool = False
+class GenerationJobCreate(BaseModel):
+    project_ids: List[int]
+    # 空のリスト（または省略）は「指定なし」の1通りとして扱う
+    character_ids: List[Optional[int]] = []
+    target_persona_ids: List[Optional[int]] = []
+    language: Optional[str] = "日本語"
+    no_cache: bool = False
+class GenerationJobItem(BaseModel):
+    id: int
+    project_id: int
+    character_id: Optional[int] = None
+    target_persona_id: Optional[int] = None
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    post_ids: List[int] = []
+class GenerationJob(BaseModel):
+    id: int
+    status: str
+    language: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    total: int
+    pending: int
+    running: int
+    done: int
+    failed: int
+    post_ids: List[int] = []
+    items: List[GenerationJobItem] = []
+class LLMCacheStats(BaseModel):
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    hit_rate: float = 0.0
+    expired: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+class DBPoolStats(BaseModel):
+    pool_class: str
+    pool_size: Optional[int] = None
+    checked_out: Optional[int] = None
+    checked_in: Optional[int] = None
+    overflow: Optional[int] = None
+    max_overflow: Optional[int] = None
+    checkouts: Optional[int] = None
+    timeouts: Optional[int] = None
+    wait_seconds_total: Optional[float] = None
+    wait_seconds_avg: Optional[float] = None
+    wait_seconds_max: Optional[float] = None
+class DBPoolStatsReport(BaseModel):
+    # APIのリクエストが使う非同期エンジンと、バックグラウンドのスレッドが使う同期エンジン
+    requests: DBPoolStats
+    background: DBPoolStats
 
 # --- Setting Schemas ---
 class SettingBase(BaseModel):
@@ -129,7 +260,23 @@ class Setting(SettingBase):
     id: int
     key: str
     description: Optional[str] = None
+    version: int = 1
     created_at: datetime
     updated_at: Optional[datetime] = None
     class Config:
         from_attributes = True
+
+# --- Search Schemas ---
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    project_id: Optional[int] = None
+    score: float
+    title: Optional[str] = None
+    excerpt: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+class SearchPage(BaseModel):
+    items: List[SearchResult]
+    # 次のページを取得するときに offset に渡す値（最後のページなら None）
+    next_offset: Optional[int] = None
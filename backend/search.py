@@ -0,0 +1,227 @@
+import re
+import unicodedata
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import models
+
+# 検索対象の種類。索引の行IDは ref_id * len(KINDS) + 種類の番号 にして、差し替え・削除を主キーだけで行う
+KINDS = ("post", "note_article", "project")
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+# 日本語・中国語・韓国語の文字（分かち書きしない文字）の並び
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]+")
+# それ以外の単語（英数字など）
+_WORD = re.compile(r"[^\W_]+")
+# 検索結果に付ける抜粋の長さ（文字数）
+EXCERPT_CHARS = 120
+
+def _doc_id(kind: str, ref_id: int) -> int:
+    return ref_id * len(KINDS) + _KIND_CODES[kind]
+
+def _normalize(value: str) -> str:
+    # 全角英数字・半角カナなどの表記ゆれをそろえる
+    return unicodedata.normalize("NFKC", value).lower()
+
+def _terms(value: str) -> list[str]:
+    """
+    テキストを索引の語に分ける。日本語などは2文字ずつずらして切り出し（bigram）、英数字は単語ごとに分ける。
+    形態素解析の辞書がなくても、日本語の部分一致で検索できる。
+    """
+    value = _normalize(value)
+    terms, position = [], 0
+    for match in _CJK_RUN.finditer(value):
+        terms.extend(_WORD.findall(value[position:match.start()]))
+        run = match.group()
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        position = match.end()
+    terms.extend(_WORD.findall(value[position:]))
+    return terms
+
+def _index_text(*values: str | None) -> str:
+    return " ".join(term for value in values if value for term in _terms(value))
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+# --- 索引の作成 ---
+def init(engine: Engine):
+    """
+    検索用の索引を作る（起動時に create_all の後で呼ぶ）。DATABASE_URL のDBに合わせて、
+    SQLiteではFTS5の仮想テーブル、PostgreSQLでは tsvector の列とGINインデックスを使う。
+    索引が空のときは、既存の投稿・note記事・プロジェクトから作り直す。
+    """
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS search_documents ("
+                "id BIGINT PRIMARY KEY, kind VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL, "
+                "project_id INTEGER, terms TSVECTOR NOT NULL)"
+            ))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_terms ON search_documents USING GIN (terms)"))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_project_id ON search_documents (project_id)"))
+        else:
+            # 語はPython側で区切ってスペースでつないで入れるので、FTS5側はスペースで分けるだけでよい
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, project_id UNINDEXED, terms, tokenize='unicode61')"
+            ))
+    with Session(engine) as db:
+        if db.execute(text("SELECT 1 FROM search_documents LIMIT 1")).first() is None:
+            rebuild(db)
+
+def rebuild(db: Session):
+    """投稿・note記事・プロジェクトの全行から索引を作り直す"""
+    db.execute(text("DELETE FROM search_documents"))
+    index_posts(db, db.query(models.Post.id, models.Post.project_id, models.Post.content).all())
+    index_note_articles(db, db.query(models.NoteArticle.id, models.NoteArticle.project_id, models.NoteArticle.title, models.NoteArticle.content).all())
+    index_projects(db, db.query(
+        models.Project.id, models.Project.name, models.Project.hashtags, models.Project.research_summary, models.Project.latest_ai_response
+    ).all())
+    db.commit()
+    print("Search index rebuilt.")
+
+# --- 索引の更新（crud の書き込みから、コミット前に同じトランザクションで呼ぶ） ---
+def _upsert(db: Session, kind: str, documents: list[tuple]):
+    """(ref_id, project_id, 索引にするテキスト) のリストをまとめて索引に入れる"""
+    if not documents:
+        return
+    params = [
+        {"id": _doc_id(kind, ref_id), "kind": kind, "ref_id": ref_id, "project_id": project_id, "terms": terms}
+        for ref_id, project_id, terms in documents
+    ]
+    if _is_postgres(db):
+        db.execute(text(
+            "INSERT INTO search_documents (id, kind, ref_id, project_id, terms) "
+            "VALUES (:id, :kind, :ref_id, :project_id, to_tsvector('simple', :terms)) "
+            "ON CONFLICT (id) DO UPDATE SET project_id = EXCLUDED.project_id, terms = EXCLUDED.terms"
+        ), params)
+    else:
+        # FTS5の仮想テーブルはUPSERTに対応していないので、同じrowidの行を消してから入れる
+        db.execute(text("DELETE FROM search_documents WHERE rowid = :id"), params)
+        db.execute(text(
+            "INSERT INTO search_documents (rowid, kind, ref_id, project_id, terms) "
+            "VALUES (:id, :kind, :ref_id, :project_id, :terms)"
+        ), params)
+
+def index_posts(db: Session, posts):
+    _upsert(db, "post", [(post.id, post.project_id, _index_text(post.content)) for post in posts])
+
+def index_note_articles(db: Session, articles):
+    _upsert(db, "note_article", [
+        (article.id, article.project_id, _index_text(article.title, article.content)) for article in articles
+    ])
+
+def index_projects(db: Session, projects):
+    _upsert(db, "project", [
+        (project.id, project.id, _index_text(project.name, project.hashtags, project.research_summary, project.latest_ai_response))
+        for project in projects
+    ])
+
+def remove(db: Session, kind: str, ref_id: int):
+    id_column = "id" if _is_postgres(db) else "rowid"
+    db.execute(text(f"DELETE FROM search_documents WHERE {id_column} = :id"), {"id": _doc_id(kind, ref_id)})
+
+def remove_project(db: Session, project_id: int):
+    """プロジェクトと、その投稿・note記事の索引をまとめて消す"""
+    db.execute(text("DELETE FROM search_documents WHERE project_id = :project_id"), {"project_id": project_id})
+
+# --- 検索 ---
+def _match_expression(query: str, postgres: bool) -> str | None:
+    """検索語を索引と同じ方法で分け、すべての語を含む文書に一致する式を作る（1文字だけの語は前方一致）"""
+    terms = list(dict.fromkeys(_terms(query)))
+    if not terms:
+        return None
+    if postgres:
+        quoted = ["'" + term.replace("'", "''") + "'" + (":*" if len(term) == 1 else "") for term in terms]
+        return " & ".join(quoted)
+    quoted = ['"' + term.replace('"', '""') + '"' + ("*" if len(term) == 1 else "") for term in terms]
+    return " AND ".join(quoted)
+
+def _find_hits(db: Session, query: str, kinds: list[str] | None, project_id: int | None, limit: int, offset: int):
+    postgres = _is_postgres(db)
+    expression = _match_expression(query, postgres)
+    if expression is None:
+        return []
+    params = {"expression": expression, "limit": limit, "offset": offset}
+    conditions = ""
+    if kinds:
+        conditions += " AND kind IN (" + ", ".join(f":kind_{i}" for i in range(len(kinds))) + ")"
+        params.update({f"kind_{i}": kind for i, kind in enumerate(kinds)})
+    if project_id is not None:
+        conditions += " AND project_id = :project_id"
+        params["project_id"] = project_id
+    if postgres:
+        sql = (
+            "SELECT kind, ref_id, project_id, ts_rank(terms, to_tsquery('simple', :expression)) AS score "
+            "FROM search_documents WHERE terms @@ to_tsquery('simple', :expression)" + conditions +
+            " ORDER BY score DESC, id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        # bm25() は関連度が高いほど小さい（負の）値を返すので、符号を反転してスコアにする
+        sql = (
+            "SELECT kind, ref_id, project_id, -bm25(search_documents) AS score "
+            "FROM search_documents WHERE search_documents MATCH :expression" + conditions +
+            " ORDER BY score DESC, rowid DESC LIMIT :limit OFFSET :offset"
+        )
+    return db.execute(text(sql), params).all()
+
+def _excerpt(value: str | None, query: str) -> str | None:
+    """本文のうち、検索語が最初に出てくるあたりを抜き出す"""
+    if not value:
+        return value
+    normalized = _normalize(value)
+    positions = [normalized.find(term) for term in _terms(query)]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - EXCERPT_CHARS // 4) if positions else 0
+    # NFKC正規化で文字数が変わったときは位置がずれるので、正規化後のテキストから抜き出す
+    source = value if len(normalized) == len(value) else normalized
+    excerpt = source[start:start + EXCERPT_CHARS]
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + EXCERPT_CHARS < len(source) else "")
+
+def search(db: Session, query: str, kinds: list[str] | None = None, project_id: int | None = None, limit: int = 20, offset: int = 0):
+    """
+    索引を検索して、関連度の高い順に結果を返す。
+    見出しと抜粋は、ヒットした行の元の表から種類ごとに1回ずつ（最大3クエリ）まとめて読み込む。
+    """
+    hits = _find_hits(db, query, kinds, project_id, limit, offset)
+    ids_by_kind = {kind: [hit.ref_id for hit in hits if hit.kind == kind] for kind in KINDS}
+    sources = {}
+    if ids_by_kind["post"]:
+        for post in db.query(models.Post.id, models.Post.content, models.Post.status, models.Post.created_at).filter(models.Post.id.in_(ids_by_kind["post"])):
+            sources[("post", post.id)] = {"title": None, "body": post.content, "status": post.status, "created_at": post.created_at}
+    if ids_by_kind["note_article"]:
+        for article in db.query(
+            models.NoteArticle.id, models.NoteArticle.title, models.NoteArticle.content, models.NoteArticle.status, models.NoteArticle.created_at
+        ).filter(models.NoteArticle.id.in_(ids_by_kind["note_article"])):
+            sources[("note_article", article.id)] = {"title": article.title, "body": article.content, "status": article.status, "created_at": article.created_at}
+    if ids_by_kind["project"]:
+        for project in db.query(
+            models.Project.id, models.Project.name, models.Project.research_summary, models.Project.hashtags, models.Project.created_at
+        ).filter(models.Project.id.in_(ids_by_kind["project"])):
+            sources[("project", project.id)] = {
+                "title": project.name, "body": project.research_summary or project.hashtags, "status": None, "created_at": project.created_at
+            }
+
+    results = []
+    for hit in hits:
+        source = sources.get((hit.kind, hit.ref_id))
+        if source is None:
+            # 索引だけが残っている行（外部からの直接削除など）は結果に含めない
+            continue
+        results.append({
+            "kind": hit.kind,
+            "id": hit.ref_id,
+            "project_id": hit.project_id,
+            "score": hit.score,
+            "title": source["title"],
+            "excerpt": _excerpt(source["body"], query),
+            "status": source["status"],
+            "created_at": source["created_at"]
+        })
+    return results, len(hits)
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+import crud, models, schemas
+from config import settings
+
+class SettingCache:
+    """
+    settings テーブルの全行をメモリに持ち、プロンプトテンプレートなどの読み出しをDBに問い合わせずに返すキャッシュ。
+    このプロセスでの更新は put() ですぐに反映し、他のプロセスでの更新は poll_seconds ごとに
+    件数とバージョンの合計（フィンガープリント）を確かめて、変わっていれば全件を読み直す。
+    """
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._settings: dict[str, schemas.Setting] | None = None
+        self._fingerprint: tuple | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db: Session):
+        """全件を読み直す（起動時と、他のプロセスでの更新に気づいたときに呼ぶ）"""
+        fingerprint = crud.get_settings_fingerprint(db)
+        # セッションに読み込み済みの古い行があっても、DBの値で上書きして読む
+        rows = db.query(models.Setting).execution_options(populate_existing=True).all()
+        loaded = {row.key: schemas.Setting.model_validate(row) for row in rows}
+        with self._lock:
+            self._settings = loaded
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+        print(f"Setting cache loaded ({len(loaded)} settings).")
+
+    def _refresh_if_stale(self, db: Session):
+        with self._lock:
+            if self._settings is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+                return
+            # 同時に来た他のリクエストが重ねて確認しないよう、先に確認時刻を進めておく
+            self._checked_at = time.monotonic()
+            loaded = self._settings is not None
+            fingerprint = self._fingerprint
+        if not loaded or crud.get_settings_fingerprint(db) != fingerprint:
+            self.load(db)
+
+    def get(self, db: Session, key: str) -> schemas.Setting | None:
+        self._refresh_if_stale(db)
+        with self._lock:
+            return self._settings.get(key)
+
+    def put(self, db_setting: models.Setting):
+        """このプロセスで更新した設定を、すぐにキャッシュへ書き込む"""
+        cached = schemas.Setting.model_validate(db_setting)
+        with self._lock:
+            if self._settings is None:
+                return
+            previous = self._settings.get(cached.key)
+            self._settings = {**self._settings, cached.key: cached}
+            if self._fingerprint is not None:
+                count, version_sum = self._fingerprint
+                if previous is None:
+                    self._fingerprint = (count + 1, version_sum + cached.version)
+                else:
+                    self._fingerprint = (count, version_sum - previous.version + cached.version)
+
+    def invalidate(self):
+        with self._lock:
+            self._settings = None
+            self._fingerprint = None
+
+# アプリ全体で共有する設定キャッシュ
+cache = SettingCache(poll_seconds=settings.SETTINGS_CACHE_POLL_SECONDS)
+
+def get_setting(db: Session, key: str) -> schemas.Setting | None:
+    return cache.get(db, key)
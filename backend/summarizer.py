@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import re
+
+import database, crud, llm
+from config import settings
+
+SUMMARY_PROMPT = """以下のウェブサイトから抽出したテキストを分析し、このプロジェクトの核心的な価値、特徴、ターゲット顧客について、簡潔に要約してください。\n\n---テキスト---\n{text}"""
+
+CHUNK_PROMPT = """以下は、あるプロジェクトのウェブサイトから抽出したテキストの一部です（全{total}部のうち第{index}部）。このプロジェクトの価値、特徴、ターゲット顧客、具体的な数字や固有名詞など、後で全体を要約するときに必要な情報を、箇条書きで漏れなく簡潔にまとめてください。\n\n---テキスト---\n{text}"""
+
+REDUCE_PROMPT = """以下は、あるプロジェクトのウェブサイトを部分ごとに要約したメモです。これらを統合して、このプロジェクトの核心的な価値、特徴、ターゲット顧客について、簡潔に要約してください。\n\n---部分ごとの要約---\n{text}"""
+
+# チャンクの最小サイズ（これより短いうちは区切らない）。最大サイズは SUMMARY_CHUNK_CHARS
+MIN_CHUNK_RATIO = 0.5
+# 内容で区切り位置を決めるための除数（段落のハッシュがこの数で割り切れたら区切る）
+BOUNDARY_DIVISOR = 4
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])|(?<=\. )")
+
+def estimate_tokens(text: str) -> int:
+    """トークン数のおおよその見積もり（英数字は4文字で1トークン、日本語などはおよそ1文字1トークン）"""
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> list[str]:
+    """1段落が長すぎるときは文の区切りで分け、それでも長い文は max_chars で切る"""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _is_boundary(paragraph: str) -> bool:
+    return hashlib.sha256(paragraph.encode("utf-8")).digest()[0] % BOUNDARY_DIVISOR == 0
+
+def split_into_chunks(text: str, max_chars: int) -> list[str]:
+    """
+    テキストを段落の区切りでチャンクに分ける。
+    区切り位置は段落の内容（ハッシュ）で決めるので、ページの一部が編集されても、
+    その前後のチャンクの区切りは変わらず、要約のキャッシュをそのまま使える。
+    """
+    paragraphs = []
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if paragraph:
+            paragraphs.extend(_split_long_paragraph(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph])
+
+    min_chars = int(max_chars * MIN_CHUNK_RATIO)
+    chunks, current, length = [], [], 0
+    for paragraph in paragraphs:
+        if current and length + len(paragraph) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, length = [], 0
+        current.append(paragraph)
+        length += len(paragraph) + 1
+        if length >= min_chars and _is_boundary(paragraph):
+            chunks.append("\n".join(current))
+            current, length = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _within_budget(chunks: list[str], token_budget: int) -> list[str]:
+    """先頭から順に、トークン数の合計が予算に収まるチャンクだけを使う"""
+    selected, used = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if selected and used + tokens > token_budget:
+            print(f"Summary token budget reached. Using {len(selected)} of {len(chunks)} chunks.")
+            break
+        selected.append(chunk)
+        used += tokens
+    return selected
+
+def _cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+def _load_cached(keys: list[str]) -> dict[str, str]:
+    db = database.SessionLocal()
+    try:
+        return crud.get_chunk_summaries(db, chunk_hashes=keys)
+    finally:
+        db.close()
+
+def _save_cached(summaries: dict[str, str], model_name: str):
+    db = database.SessionLocal()
+    try:
+        crud.save_chunk_summaries(db, summaries=summaries, model_name=model_name)
+    finally:
+        db.close()
+
+async def _map(chunks: list[str], model_name: str) -> list[str]:
+    """チャンクごとの要約を並行して作る。同じ内容のチャンクはDBにキャッシュした要約を使う"""
+    prompts = [
+        CHUNK_PROMPT.format(total=len(chunks), index=index, text=chunk)
+        for index, chunk in enumerate(chunks, start=1)
+    ]
+    # 位置（第n部）が変わっただけのチャンクもキャッシュを使えるよう、キーにはチャンクの本文だけを使う
+    keys = [_cache_key(model_name, CHUNK_PROMPT.format(total="", index="", text=chunk)) for chunk in chunks]
+    cached = await asyncio.to_thread(_load_cached, keys)
+    missing = [(key, prompt) for key, prompt in zip(keys, prompts) if key not in cached]
+    if missing:
+        results = await asyncio.gather(*(llm.generate(prompt, model_name=model_name) for _, prompt in missing))
+        generated = {key: summary for (key, _), summary in zip(missing, results)}
+        await asyncio.to_thread(_save_cached, generated, model_name)
+        cached.update(generated)
+    print(f"Chunk summaries: {len(chunks) - len(missing)} cached, {len(missing)} generated.")
+    return [cached[key] for key in keys]
+
+async def summarize(text: str, model_name: str = llm.FLASH_MODEL) -> str:
+    """
+    ページのテキストを要約して research_summary を作る。
+    1チャンクに収まる短いページはそのまま1回で要約し、長いページはチャンクごとに要約（map）してから統合（reduce）する。
+    読み込むテキストの量は SUMMARY_TOKEN_BUDGET で制限する。
+    """
+    max_chars = settings.SUMMARY_CHUNK_CHARS
+    chunks = _within_budget(split_into_chunks(text, max_chars), settings.SUMMARY_TOKEN_BUDGET)
+    if len(chunks) <= 1:
+        return await llm.generate(SUMMARY_PROMPT.format(text="\n".join(chunks)), model_name=model_name)
+
+    partial_summaries = await _map(chunks, model_name)
+    # 部分要約を並べても長すぎる場合は、さらに部分要約同士をまとめてから統合する
+    while len(partial_summaries) > 1 and sum(len(summary) for summary in partial_summaries) > max_chars:
+        regrouped = split_into_chunks("\n".join(partial_summaries), max_chars)
+        if len(regrouped) >= len(partial_summaries):
+            break
+        partial_summaries = await _map(regrouped, model_name)
+    return await llm.generate(REDUCE_PROMPT.format(text="\n\n".join(partial_summaries)), model_name=model_name)
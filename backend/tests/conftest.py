@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+# テストは一時ディレクトリのSQLiteで動かす（.env の DATABASE_URL より先に設定しておく）
+_tmp_dir = tempfile.mkdtemp(prefix="x-post-app-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import text
+
+import database, models, prompts, search
+
+models.Base.metadata.create_all(bind=database.engine)
+search.init(database.engine)
+
+def _clear_tables():
+    with database.engine.begin() as connection:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+        connection.execute(text("DELETE FROM search_documents"))
+    # 消した行のIDは次のテストで使い回されるので、キャッシュした行も捨てておく
+    prompts.profiles.invalidate()
+
+@pytest.fixture
+def db():
+    """テストごとのセッション（終わったら全テーブルを空にする）"""
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        _clear_tables()
+
+@pytest.fixture
+def project(db):
+    db_project = models.Project(name="Test project", url="https://example.com", enrichment_status="done")
+    db.add(db_project)
+    db.commit()
+    db.refresh(db_project)
+    return db_project
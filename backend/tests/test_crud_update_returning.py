@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+
+import crud, database, models, schemas
+
+@pytest.fixture
+def statements():
+    """テスト中にデータベースへ送られたSQL文の、先頭のキーワードと対象テーブルを集める"""
+    executed = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(" ".join(statement.split()[:3]))
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(database.engine, "before_cursor_execute", record)
+
+@pytest.fixture
+def rows(db, project):
+    post = models.Post(content="draft", project_id=project.id)
+    character = models.Character(name="Aki", title="Engineer")
+    persona = models.TargetPersona(name="Founder", goals="grow")
+    setting = models.Setting(key="default_post_prompt", value="{{project_name}}")
+    article = models.NoteArticle(title="Title", content="Body", project_id=project.id)
+    db.add_all([post, character, persona, setting, article])
+    db.commit()
+    return {"post": post.id, "character": character.id, "persona": persona.id, "article": article.id, "project": project.id}
+
+# (名前, 変更の呼び出し, 更新後の行で確かめる (列, 値))
+MUTATIONS = [
+    ("update_post_status", lambda db, ids: crud.update_post_status(db, ids["post"], "posted", tweet_id="42"), ("tweet_id", "42")),
+    ("schedule_post", lambda db, ids: crud.schedule_post(db, ids["post"], datetime(2030, 1, 1, tzinfo=timezone.utc)), ("status", "scheduled")),
+    ("update_post_image_url", lambda db, ids: crud.update_post_image_url(db, ids["post"], "https://images.example.com/1.jpg"), ("image_url", "https://images.example.com/1.jpg")),
+    ("update_character", lambda db, ids: crud.update_character(db, ids["character"], schemas.CharacterCreate(name="Aki", title="Writer")), ("version", 2)),
+    ("update_target_persona", lambda db, ids: crud.update_target_persona(db, ids["persona"], schemas.TargetPersonaCreate(name="Founder", goals="hire")), ("version", 2)),
+    ("update_setting", lambda db, ids: crud.update_setting(db, "default_post_prompt", schemas.SettingUpdate(value="{{hashtags}}")), ("version", 2)),
+]
+# 検索の索引も更新する変更（索引の文は、SQLiteでは同じ rowid の DELETE と INSERT の2文）
+INDEXED_MUTATIONS = [
+    ("update_post", lambda db, ids: crud.update_post(db, ids["post"], "edited"), ("content", "edited")),
+    ("update_project_summary", lambda db, ids: crud.update_project_summary(db, ids["project"], "summary"), ("research_summary", "summary")),
+    ("update_project_ai_response", lambda db, ids: crud.update_project_ai_response(db, ids["project"], "ai text"), ("latest_ai_response", "ai text")),
+    ("update_note_article", lambda db, ids: crud.update_note_article(db, ids["article"], schemas.NoteArticleUpdate(title="New", content="Body")), ("title", "New")),
+]
+SEARCH_INDEX_STATEMENTS = ["DELETE FROM search_documents", "INSERT INTO search_documents"]
+
+def _is_update(statement: str) -> bool:
+    return statement.startswith("UPDATE ")
+
+@pytest.mark.parametrize("name, mutate, expected", MUTATIONS, ids=[m[0] for m in MUTATIONS])
+def test_mutation_is_one_update_returning(db, rows, statements, name, mutate, expected):
+    updated = mutate(db, rows)
+    column, value = expected
+    # コミット後に属性を読んでも、読み直しのSELECTは走らない
+    assert getattr(updated, column) == value
+
+    assert len(statements) == 1
+    assert _is_update(statements[0])
+
+@pytest.mark.parametrize("name, mutate, expected", INDEXED_MUTATIONS, ids=[m[0] for m in INDEXED_MUTATIONS])
+def test_indexed_mutation_adds_only_the_search_index_statements(db, rows, statements, name, mutate, expected):
+    updated = mutate(db, rows)
+    column, value = expected
+    assert getattr(updated, column) == value
+
+    assert len(statements) == 3
+    assert _is_update(statements[0])
+    assert statements[1:] == SEARCH_INDEX_STATEMENTS
+
+def test_startup_rejects_a_database_without_returning(monkeypatch):
+    database.check_returning_support()
+
+    monkeypatch.setattr(database.engine.dialect, "update_returning", False)
+    with pytest.raises(RuntimeError, match="RETURNING"):
+        database.check_returning_support()
+
+def test_mutation_of_a_missing_row_is_one_statement(db, statements):
+    assert crud.update_post_status(db, 999, "posted") is None
+    assert len(statements) == 1
+    assert _is_update(statements[0])
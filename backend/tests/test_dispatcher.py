@@ -0,0 +1,126 @@
+import threading
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+
+import requests
+
+import crud, dispatcher, models, x_client
+from config import settings
+
+def _add_posts(db, project, count: int, status: str = "scheduled", **values):
+    posts = [models.Post(content=f"post {i}", project_id=project.id, status=status, **values) for i in range(count)]
+    db.add_all(posts)
+    db.commit()
+    return [post.id for post in posts]
+
+def test_dispatch_sends_each_post_exactly_once_across_workers(db, project, monkeypatch):
+    post_ids = _add_posts(db, project, 60, scheduled_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    sent = Counter()
+    sent_lock = threading.Lock()
+
+    def post_tweet(text, image_url=None):
+        with sent_lock:
+            sent[text] += 1
+        return {"id": f"tweet-{text}"}
+
+    monkeypatch.setattr(x_client, "post_tweet", post_tweet)
+    # 小さいバッチにして、確保の奪い合いを何度も起こす
+    monkeypatch.setattr(settings, "POST_DISPATCH_BATCH_SIZE", 5)
+
+    # 複数のレプリカのタイマーが同時に目を覚ました状態を再現する
+    start = threading.Barrier(4)
+    def replica():
+        start.wait()
+        dispatcher.dispatch_due_posts()
+    threads = [threading.Thread(target=replica) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(sent) == sorted(f"post {i}" for i in range(60))
+    assert set(sent.values()) == {1}
+    db.expire_all()
+    statuses = {post.status for post in db.query(models.Post).filter(models.Post.id.in_(post_ids))}
+    assert statuses == {"posted"}
+
+def test_dispatch_logs_worker_errors_and_fails_the_post(db, project, monkeypatch, capsys):
+    [post_id] = _add_posts(db, project, 1, scheduled_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    monkeypatch.setattr(x_client, "post_tweet", lambda text, image_url=None: {"id": "tweet-1"})
+
+    def broken_update_post_status(db, post_id, status, **kwargs):
+        raise RuntimeError("database is gone")
+    monkeypatch.setattr(crud, "update_post_status", broken_update_post_status)
+
+    dispatcher.dispatch_due_posts()
+
+    assert f"post ID: {post_id}" in capsys.readouterr().out
+    db.expire_all()
+    db_post = crud.get_post(db, post_id=post_id)
+    assert db_post.status == "failed"
+    assert "database is gone" in db_post.failure_reason
+
+def test_fail_stale_posts_only_touches_old_posting_rows(db, project, monkeypatch):
+    monkeypatch.setattr(settings, "POST_POSTING_STALE_MINUTES", 15)
+    now = datetime.now(timezone.utc)
+    [stale_id] = _add_posts(db, project, 1, status="posting", posting_started_at=now - timedelta(hours=1))
+    [recent_id] = _add_posts(db, project, 1, status="posting", posting_started_at=now - timedelta(minutes=1))
+    [scheduled_id] = _add_posts(db, project, 1, scheduled_at=now - timedelta(hours=1))
+
+    assert dispatcher.fail_stale_posts() == 1
+
+    db.expire_all()
+    assert crud.get_post(db, post_id=stale_id).status == "failed"
+    assert crud.get_post(db, post_id=stale_id).failure_reason == dispatcher.STALE_POSTING_REASON
+    assert crud.get_post(db, post_id=recent_id).status == "posting"
+    assert crud.get_post(db, post_id=scheduled_id).status == "scheduled"
+
+class _FailingClient:
+    """create_tweet が毎回 error を投げる tweepy.Client の代わり"""
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def create_tweet(self, text, media_ids=None):
+        self.calls += 1
+        raise self.error
+
+def test_timeout_after_create_tweet_was_sent_is_not_retried(db, project, monkeypatch):
+    [post_id] = _add_posts(db, project, 1, scheduled_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    client = _FailingClient(requests.ReadTimeout("read timed out"))
+    monkeypatch.setattr(x_client, "get_x_client_v2", lambda: client)
+
+    dispatcher.dispatch_due_posts()
+    # 予約に戻っていないので、もう一度呼んでも送り直さない
+    dispatcher.dispatch_due_posts()
+
+    assert client.calls == 1
+    db.expire_all()
+    db_post = crud.get_post(db, post_id=post_id)
+    assert db_post.status == "failed"
+    assert db_post.retry_count == 0
+    assert "may or may not have been sent" in db_post.failure_reason
+
+def test_connect_timeout_before_create_tweet_was_sent_is_retried(db, project, monkeypatch):
+    [post_id] = _add_posts(db, project, 1, scheduled_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    client = _FailingClient(requests.ConnectTimeout("connect timed out"))
+    monkeypatch.setattr(x_client, "get_x_client_v2", lambda: client)
+
+    dispatcher.dispatch_due_posts()
+
+    assert client.calls == 1
+    db.expire_all()
+    db_post = crud.get_post(db, post_id=post_id)
+    assert db_post.status == "scheduled"
+    assert db_post.retry_count == 1
+    assert "ConnectTimeout" in db_post.failure_reason
+
+def test_next_stale_check_at_follows_the_oldest_posting_row(db, project, monkeypatch):
+    monkeypatch.setattr(settings, "POST_POSTING_STALE_MINUTES", 15)
+    assert dispatcher.next_stale_check_at() is None
+
+    started_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    _add_posts(db, project, 1, status="posting", posting_started_at=started_at)
+    _add_posts(db, project, 1, status="posting", posting_started_at=started_at + timedelta(minutes=3))
+
+    assert dispatcher.next_stale_check_at() == started_at + timedelta(minutes=15)
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+import crawler, enrichment, models, summarizer, utils
+
+@pytest.fixture
+def site(monkeypatch):
+    """ETag 付きで同じページを返し、If-None-Match が一致すれば304を返すスタブ"""
+    page = {"text": "ページの本文 v1", "etag": '"v1"'}
+    def fetch_page_text(url, etag=None, last_modified=None, max_bytes=None, max_chars=None):
+        if etag == page["etag"]:
+            return {"not_modified": True}
+        return {"not_modified": False, "text": page["text"], "etag": page["etag"], "last_modified": None}
+    monkeypatch.setattr(utils, "fetch_page_text", fetch_page_text)
+    monkeypatch.setattr(crawler, "_gate", crawler.HostGate(0))
+    return page
+
+def test_failed_summary_is_retried_on_the_next_recrawl(db, project, site, monkeypatch):
+    project.research_summary = "古い要約"
+    db.commit()
+    site["text"], site["etag"] = "ページの本文 v2", '"v2"'
+
+    async def failing_summarize(text):
+        raise RuntimeError("Gemini is down")
+    monkeypatch.setattr(summarizer, "summarize", failing_summarize)
+    assert asyncio.run(enrichment.recrawl_project(project.id)) == "failed"
+
+    async def summarize(text):
+        return f"要約: {text}"
+    monkeypatch.setattr(summarizer, "summarize", summarize)
+    # 2回目は304が返るが、v2 の要約はまだ保存されていないので要約し直す
+    assert asyncio.run(enrichment.recrawl_project(project.id)) == "updated"
+    assert asyncio.run(enrichment.recrawl_project(project.id)) == "unchanged"
+
+    db.expire_all()
+    assert db.get(models.Project, project.id).research_summary == "要約: ページの本文 v2"
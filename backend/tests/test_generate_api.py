@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database, llm, main, models, setting_cache
+
+@pytest.fixture
+def checked_out_during_llm(db, monkeypatch):
+    """LLMの応答を待っている間に、APIの接続プールから取り出されたままの接続数を記録する"""
+    for key in ("default_post_prompt", "default_note_prompt"):
+        db.add(models.Setting(key=key, value="{{project_name}}"))
+    db.commit()
+    setting_cache.cache.invalidate()
+    counts = []
+
+    async def generate(prompt, model_name=llm.PRO_MODEL, request=None, use_cache=True, **kwargs):
+        counts.append(database.async_engine.pool.checkedout())
+        return '一つ目\n---\n二つ目\n---\n{"image_prompt": "a", "video_prompt": "b"}'
+
+    async def stream(prompt, model_name=llm.PRO_MODEL, timeout=None, use_cache=True):
+        for text in ("一つ", "目\n--", "-\n二つ目"):
+            counts.append(database.async_engine.pool.checkedout())
+            yield text
+
+    monkeypatch.setattr(llm, "generate", generate)
+    monkeypatch.setattr(llm, "stream", stream)
+    yield counts
+    setting_cache.cache.invalidate()
+
+def test_generation_endpoints_do_not_hold_a_connection_while_waiting_for_the_llm(db, project, checked_out_during_llm):
+    post = models.Post(content="draft", project_id=project.id)
+    db.add(post)
+    db.commit()
+    client = TestClient(main.app)
+
+    assert client.post(f"/projects/{project.id}/generate-posts", json={}).status_code == 200
+    assert client.post(f"/projects/{project.id}/generate-note-article", json={}).status_code == 200
+    assert client.post(f"/posts/{post.id}/generate-media-prompts").status_code == 200
+    stream = client.post(f"/projects/{project.id}/generate-posts/stream", json={})
+    assert "event: done" in stream.text
+
+    assert len(checked_out_during_llm) == 6
+    assert set(checked_out_during_llm) == {0}
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import event
+
+import crud, database, generation, models, schemas
+from config import settings
+
+def test_release_does_not_reopen_a_finished_item(db, project):
+    job = crud.create_generation_job(db, schemas.GenerationJobCreate(project_ids=[project.id]))
+    item = crud.claim_generation_job_item(db, now=datetime.now(timezone.utc))
+    crud.complete_generation_job_item(db, item=item, contents=["done"], ai_response="done", now=datetime.now(timezone.utc))
+
+    # 結果の保存と重なったシャットダウンが、完了した項目を処理待ちに戻そうとする
+    released = crud.release_generation_job_item(
+        db, item_id=item.id, job_id=job.id, error="Interrupted by shutdown",
+        now=datetime.now(timezone.utc), retry_at=datetime.now(timezone.utc)
+    )
+
+    assert released is False
+    db.expire_all()
+    assert db.get(models.GenerationJobItem, item.id).status == "done"
+    assert crud.claim_generation_job_item(db, now=datetime.now(timezone.utc)) is None
+
+def test_idle_workers_do_not_query_after_startup(db):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def run_idle():
+        generation.start()
+        try:
+            # 起動時の確認が終わってから、待機中に送られた文だけを数える
+            await asyncio.sleep(0.1)
+            event.listen(database.engine, "before_cursor_execute", record)
+            await asyncio.sleep(0.3)
+        finally:
+            event.remove(database.engine, "before_cursor_execute", record)
+            await generation.stop()
+
+    asyncio.run(run_idle())
+
+    assert statements == []
+
+def test_deferred_retry_wakes_a_worker_without_polling(db, project, monkeypatch):
+    assert settings.GENERATION_JOB_POLL_SECONDS == 0
+    attempts = []
+    def release(item):
+        # 1回目は 0.2 秒後の再試行待ちに戻す
+        with database.SessionLocal() as session:
+            now = datetime.now(timezone.utc)
+            crud.release_generation_job_item(session, item_id=item.id, job_id=item.job_id, error="retry", now=now, retry_at=now + timedelta(seconds=0.2))
+    async def process(item):
+        attempts.append(item.attempts)
+        if item.attempts == 1:
+            await asyncio.to_thread(release, item)
+        else:
+            await asyncio.to_thread(generation._save_result, item, "post")
+    monkeypatch.setattr(generation, "_process_item", process)
+
+    async def run():
+        generation.start()
+        try:
+            await asyncio.to_thread(crud.create_generation_job, db, schemas.GenerationJobCreate(project_ids=[project.id]))
+            generation.notify()
+            for _ in range(100):
+                if len(attempts) == 2:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await generation.stop()
+
+    asyncio.run(run())
+
+    assert attempts == [1, 2]
+
+def test_opt_in_polling_picks_up_jobs_registered_elsewhere(db, project, monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_JOB_POLL_SECONDS", 0.02)
+    processed = []
+    async def process(item):
+        processed.append(item.id)
+        await asyncio.to_thread(generation._save_result, item, "post")
+    monkeypatch.setattr(generation, "_process_item", process)
+
+    async def run():
+        generation.start()
+        try:
+            # notify() を呼ばない（他のレプリカでの登録と同じ）
+            await asyncio.to_thread(crud.create_generation_job, db, schemas.GenerationJobCreate(project_ids=[project.id]))
+            for _ in range(100):
+                if processed:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await generation.stop()
+
+    asyncio.run(run())
+
+    assert len(processed) == 1
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import image_store, main, models, utils
+from config import settings
+
+@pytest.fixture
+def post(db, project):
+    db_post = models.Post(content="with image", project_id=project.id)
+    db.add(db_post)
+    db.commit()
+    return db_post
+
+@pytest.fixture
+def cloudinary(monkeypatch):
+    """Cloudinaryへのアップロードを記録だけするスタブ"""
+    uploads = []
+    def upload(image_file):
+        uploads.append(image_file)
+        return f"https://images.example.com/{len(uploads)}.jpg"
+    monkeypatch.setattr(utils, "prepare_image_for_x", lambda image_file: image_file)
+    monkeypatch.setattr(utils, "upload_image_bytes_to_cloudinary", upload)
+    return uploads
+
+def test_same_image_is_uploaded_once(db, project, post, cloudinary):
+    other_post = models.Post(content="same image", project_id=project.id)
+    db.add(other_post)
+    db.commit()
+    client = TestClient(main.app)
+
+    first = client.post(f"/posts/{post.id}/upload-image", files={"file": ("a.jpg", b"image-bytes", "image/jpeg")})
+    second = client.post(f"/posts/{other_post.id}/upload-image", files={"file": ("b.jpg", b"image-bytes", "image/jpeg")})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["image_url"] == second.json()["image_url"]
+    assert len(cloudinary) == 1
+
+def test_oversized_content_length_is_rejected_before_reading(post, cloudinary, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_UPLOAD_MAX_BYTES", 1024)
+    body = b"x" * (1024 + image_store.MULTIPART_OVERHEAD_BYTES + 1)
+
+    response = TestClient(main.app).post(
+        f"/posts/{post.id}/upload-image", files={"file": ("big.jpg", body, "image/jpeg")}
+    )
+
+    assert response.status_code == 413
+    assert cloudinary == []
+
+def test_body_without_content_length_stops_at_the_cap(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_UPLOAD_MAX_BYTES", 1024)
+    chunk = b"x" * 16 * 1024
+    total_chunks = 100
+    sent = 0
+    part_header = b'--abc\r\nContent-Disposition: form-data; name="file"; filename="big.jpg"\r\nContent-Type: image/jpeg\r\n\r\n'
+
+    async def receive():
+        nonlocal sent
+        sent += 1
+        body = part_header + chunk if sent == 1 else chunk
+        return {"type": "http.request", "body": body, "more_body": sent < total_chunks}
+
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=abc")],
+    }, receive)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(image_store.store_upload(request))
+
+    assert error.value.status_code == 413
+    # 上限（画像＋multipart の余白）を少し超えたところで受け取りをやめている
+    assert sent * len(chunk) <= settings.IMAGE_UPLOAD_MAX_BYTES + image_store.MULTIPART_OVERHEAD_BYTES + len(chunk) + len(part_header)
+    assert sent < total_chunks
+
+def test_file_that_is_not_an_image_is_rejected(db, post, monkeypatch):
+    uploads = []
+    monkeypatch.setattr(utils, "upload_image_bytes_to_cloudinary", lambda image_file: uploads.append(image_file))
+
+    response = TestClient(main.app).post(
+        f"/posts/{post.id}/upload-image", files={"file": ("notes.jpg", b"not an image", "image/jpeg")}
+    )
+
+    assert response.status_code == 415
+    assert uploads == []
+    db.refresh(post)
+    assert post.image_url is None
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timezone, timedelta
+
+from fastapi.testclient import TestClient
+
+import main, metrics, models, x_client
+from rate_limit import RateLimiter
+
+def _add_posted_post(db, project, posted_at: datetime):
+    db_post = models.Post(content="posted", project_id=project.id, status="posted", tweet_id="42", posted_at=posted_at)
+    db.add(db_post)
+    db.commit()
+    return db_post.id
+
+def test_update_metrics_api_records_history_and_next_refresh(db, project, monkeypatch):
+    posted_at = datetime.now(timezone.utc) - timedelta(hours=2)
+    post_id = _add_posted_post(db, project, posted_at)
+    shared_limiter = RateLimiter()
+    monkeypatch.setattr(metrics, "limiter", shared_limiter)
+    monkeypatch.setattr(main, "limiter", shared_limiter)
+    monkeypatch.setattr(x_client, "get_tweets_metrics", lambda tweet_ids: {"42": {"like_count": 7, "retweet_count": 2}})
+
+    response = TestClient(main.app).post(f"/posts/{post_id}/update-metrics")
+
+    assert response.status_code == 200
+    assert response.json()["like_count"] == 7
+    snapshots = db.query(models.PostMetricSnapshot).filter(models.PostMetricSnapshot.post_id == post_id).all()
+    assert [(snapshot.like_count, snapshot.retweet_count) for snapshot in snapshots] == [(7, 2)]
+    db_post = db.query(models.Post).filter(models.Post.id == post_id).one()
+    # 投稿から1日以内のツイートは、1時間後にまた更新する
+    due_at = db_post.metrics_refresh_due_at.replace(tzinfo=timezone.utc)
+    assert timedelta(minutes=59) < due_at - datetime.now(timezone.utc) <= timedelta(hours=1)
+
+def test_update_metrics_api_respects_the_lookup_rate_limit(db, project, monkeypatch):
+    post_id = _add_posted_post(db, project, datetime.now(timezone.utc))
+    shared_limiter = RateLimiter()
+    shared_limiter.bucket(x_client.GET_TWEETS_ENDPOINT).update({
+        "x-rate-limit-limit": "15", "x-rate-limit-remaining": "0", "x-rate-limit-reset": str(time.time() + 60)
+    })
+    monkeypatch.setattr(metrics, "limiter", shared_limiter)
+    monkeypatch.setattr(main, "limiter", shared_limiter)
+
+    def unexpected_lookup(tweet_ids):
+        raise AssertionError("X API must not be called without a rate-limit token")
+    monkeypatch.setattr(x_client, "get_tweets_metrics", unexpected_lookup)
+
+    response = TestClient(main.app).post(f"/posts/{post_id}/update-metrics")
+
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    assert db.query(models.PostMetricSnapshot).count() == 0
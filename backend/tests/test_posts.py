@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+import crud, main, schemas
+
+def test_bulk_inserts_return_rows_in_the_given_order(db, project):
+    contents = [f"post {i}" for i in range(20)]
+
+    db_posts = crud.create_project_posts(db, contents, project_id=project.id, ai_response="\n---\n".join(contents))
+    db_projects = crud.create_projects(db, [schemas.ProjectCreate(name=f"project {i}", url=f"https://example.com/{i}") for i in range(5)])
+
+    assert [db_post.content for db_post in db_posts] == contents
+    assert [db_project.name for db_project in db_projects] == [f"project {i}" for i in range(5)]
+
+def test_created_at_cursor_pages_through_posts_created_in_the_same_second(db, project):
+    # SQLiteの CURRENT_TIMESTAMP は秒単位なので、続けて作った投稿は created_at が同じ秒になる
+    crud.create_project_posts(db, [f"post {i}" for i in range(5)], project_id=project.id)
+    client = TestClient(main.app)
+
+    seen = []
+    cursor = None
+    for _ in range(10):
+        params = {"sort": "created_at", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/posts", params=params).json()
+        seen.extend(item["content"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"post {i}" for i in reversed(range(5))]
@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+import main, models
+
+def test_project_summaries_count_posts_without_returning_them(db, project):
+    db.add_all([
+        models.Post(content="a", project_id=project.id, status="draft"),
+        models.Post(content="b", project_id=project.id, status="draft"),
+        models.Post(content="c", project_id=project.id, status="posted"),
+    ])
+    db.commit()
+
+    page = TestClient(main.app).get("/projects/summaries", params={"limit": 100}).json()
+
+    [item] = page["items"]
+    assert (item["id"], item["name"], item["url"]) == (project.id, project.name, project.url)
+    assert (item["draft_count"], item["scheduled_count"], item["posted_count"]) == (2, 0, 1)
+    assert "posts" not in item
+    assert page["next_before_id"] is None
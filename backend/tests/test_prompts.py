@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import crud, database, main, models, prompts, schemas, setting_cache
+
+def test_character_section_follows_updates_within_the_same_second(db):
+    character = crud.create_character(db, schemas.CharacterCreate(name="Aki", title="Engineer"))
+    assert "Engineer" in prompts.character_section(character, "コンテンツ")
+
+    # SQLiteの CURRENT_TIMESTAMP は秒単位なので、続けて2回更新すると updated_at は変わらないことがある
+    crud.update_character(db, character.id, schemas.CharacterCreate(name="Aki", title="Designer"))
+    crud.update_character(db, character.id, schemas.CharacterCreate(name="Aki", title="Writer"))
+    section = prompts.character_section(crud.get_character(db, character.id), "コンテンツ")
+
+    assert "Writer" in section
+    assert "Designer" not in section
+
+def test_target_persona_section_follows_updates(db):
+    persona = crud.create_target_persona(db, schemas.TargetPersonaCreate(name="Founder", goals="grow"))
+    assert "grow" in prompts.target_persona_section(persona)
+
+    updated = crud.update_target_persona(db, persona.id, schemas.TargetPersonaCreate(name="Founder", goals="hire"))
+
+    assert updated.version == 2
+    assert "hire" in prompts.target_persona_section(crud.get_target_persona(db, persona.id))
+
+def test_render_fills_every_placeholder_in_one_pass():
+    setting = models.Setting(key="default_post_prompt", value="{{project_name}} {{hashtags}} {{language}} {{unknown}}")
+    project = models.Project(name="App", url="https://example.com", hashtags="#app")
+
+    assert prompts.render(setting, project=project) == "App #app 日本語 {{unknown}}"
+
+def test_warm_prompt_build_does_not_query_the_database(db, project):
+    character = crud.create_character(db, schemas.CharacterCreate(name="Aki", title="Engineer"))
+    persona = crud.create_target_persona(db, schemas.TargetPersonaCreate(name="Founder", goals="grow"))
+    db.add(models.Setting(key="default_post_prompt", value="{{character_section}}{{target_persona_section}}"))
+    db.commit()
+    setting_cache.cache.invalidate()
+    request_body = schemas.GeneratePostsRequest(character_id=character.id, target_persona_id=persona.id)
+    main._build_post_prompt(db, project, request_body)
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        prompt = main._build_post_prompt(db, project, request_body)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+        setting_cache.cache.invalidate()
+
+    assert "Engineer" in prompt and "grow" in prompt
+    assert statements == []
+
+def test_profile_updates_through_the_api_reach_the_next_prompt(db, project):
+    character = crud.create_character(db, schemas.CharacterCreate(name="Aki", title="Engineer"))
+    assert prompts.profiles.get_character(db, character_id=character.id).title == "Engineer"
+    client = TestClient(main.app)
+
+    assert client.put(f"/characters/{character.id}", json={"name": "Aki", "title": "Writer"}).status_code == 200
+    assert prompts.profiles.get_character(db, character_id=character.id).title == "Writer"
+
+    assert client.delete(f"/characters/{character.id}").status_code == 204
+    assert prompts.profiles.get_character(db, character_id=character.id) is None
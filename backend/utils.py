@@ -1,37 +1,221 @@
+import io
+import re
+import codecs
 import requests
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from requests.compat import chardet
+from typing import BinaryIO, Iterable
+from PIL import Image, ImageOps
 import cloudinary
 import cloudinary.uploader
 import traceback
+from config import settings
 
-# このファイルからは、osやdotenvの読み込み、config設定をすべて削除します
+# Xにアップロードできる画像の上限（ファイルサイズと長辺のピクセル数）
+X_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+X_IMAGE_MAX_DIMENSION = 4096
+
+# このファイルからは、osやdotenvの読み込みをすべて削除し、設定は config の settings から受け取ります
         
-def scrape_text_from_url(url: str) -> str | None:
+def split_post_blocks(ai_text: str) -> list[str]:
+    """AIの出力を '---' で区切り、空のブロックを除いた投稿本文のリストにする"""
+    return [block.strip() for block in ai_text.split('---') if block.strip()]
+
+SCRAPE_HEADERS = { 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36' }
+
+# ページの読み込みの上限（ダウンロードするバイト数と、抽出するテキストの文字数）は settings.SCRAPE_MAX_BYTES / SCRAPE_MAX_CHARS
+SCRAPE_MIN_CHARS = 100
+SCRAPE_CHUNK_SIZE = 64 * 1024
+# 文字コードの宣言（<meta charset>）を探す範囲と、宣言がないときに推定に使う範囲
+CHARSET_SNIFF_BYTES = 4096
+
+# 中身を読まずに読み飛ばす要素と、前後で改行を入れるブロック要素
+_SKIPPED_TAGS = frozenset(["script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"])
+_BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section",
+    "table", "td", "th", "title", "tr", "ul",
+])
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+class _TextExtractor(HTMLParser):
     """
-    指定されたURLからプレーンテキストを抽出する関数
+    HTMLを読み込みながら本文のテキストだけを取り出すパーサー。
+    script・style などの中身は読み飛ばし、ブロック要素ごとに1行にまとめる。max_chars 文字に達したら done になる。
     """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+        self._lines: list[str] = []
+        self._line: list[str] = []
+        self._length = 0
+        self._skip_depth = 0
+
+    def _break_line(self):
+        line = " ".join("".join(self._line).split())
+        self._line = []
+        if not line or self.done:
+            return
+        self._lines.append(line)
+        self._length += len(line) + 1
+        if self._length >= self.max_chars:
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._break_line()
+
+    def handle_startendtag(self, tag, attrs):
+        # <svg/> のような自己終了タグは中身がないので、読み飛ばしの深さは変えない
+        if tag in _BLOCK_TAGS:
+            self._break_line()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif tag in _BLOCK_TAGS:
+            self._break_line()
+
+    def handle_data(self, data):
+        if not self._skip_depth and not self.done:
+            self._line.append(data)
+
+    def text(self) -> str:
+        self._break_line()
+        return "\n".join(self._lines)[:self.max_chars]
+
+def _detect_encoding(content_type: str | None, head: bytes) -> str:
+    """文字コードを、Content-Typeの宣言 → <meta charset> → 先頭部分からの推定 の順に決める"""
+    candidates = []
+    header_match = _HEADER_CHARSET.search(content_type or "")
+    if header_match:
+        candidates.append(header_match.group(1))
+    meta_match = _META_CHARSET.search(head[:CHARSET_SNIFF_BYTES])
+    if meta_match:
+        candidates.append(meta_match.group(1).decode("ascii", "ignore"))
+    candidates.append(chardet.detect(head[:CHARSET_SNIFF_BYTES])["encoding"] if head else None)
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+def extract_text_from_chunks(
+    chunks: Iterable[bytes],
+    content_type: str | None = None,
+    max_bytes: int | None = None,
+    max_chars: int | None = None,
+) -> str | None:
+    """
+    HTMLのバイト列を少しずつデコード・解析して本文テキストを返す関数。
+    max_bytes バイトを読むか max_chars 文字を取り出した時点で読み込みをやめる（省略時は settings の上限）。短すぎるページは None。
+    """
+    max_bytes = max_bytes or settings.SCRAPE_MAX_BYTES
+    max_chars = max_chars or settings.SCRAPE_MAX_CHARS
+    parser = _TextExtractor(max_chars)
+    decoder = None
+    bytes_read = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        chunk = chunk[:max_bytes - bytes_read]
+        bytes_read += len(chunk)
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_detect_encoding(content_type, chunk))(errors="replace")
+        parser.feed(decoder.decode(chunk))
+        if parser.done or bytes_read >= max_bytes:
+            break
+    if decoder is not None and not parser.done:
+        parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    text = parser.text()
+    if len(text) < SCRAPE_MIN_CHARS:
+        return None
+    return text
+
+def fetch_page_text(
+    url: str,
+    etag: str | None = None,
+    last_modified: str | None = None,
+    max_bytes: int | None = None,
+    max_chars: int | None = None,
+) -> dict | None:
+    """
+    URLを条件付きGETで取得してプレーンテキストを抽出する関数。
+    前回の ETag / Last-Modified を渡すと、変更がなければ {"not_modified": True} を返す。
+    変更があれば {"not_modified": False, "text", "etag", "last_modified"} を返し、取得に失敗したら None を返す。
+    本文はストリーミングで読み、max_bytes / max_chars に達したら残りはダウンロードしない。
+    """
+    headers = dict(SCRAPE_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        headers = { 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36' }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'lxml')
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        if len(text) < 100:
-            return None
-        return text
+        with requests.get(url, headers=headers, timeout=15, stream=True) as response:
+            if response.status_code == 304:
+                return {"not_modified": True}
+            response.raise_for_status()
+            text = extract_text_from_chunks(
+                response.iter_content(SCRAPE_CHUNK_SIZE),
+                content_type=response.headers.get('Content-Type'),
+                max_bytes=max_bytes,
+                max_chars=max_chars
+            )
+            return {
+                "not_modified": False,
+                "text": text,
+                "etag": response.headers.get('ETag'),
+                "last_modified": response.headers.get('Last-Modified'),
+            }
     except requests.RequestException as e:
         print(f"Error fetching or reading URL {url}: {e}")
         return None
 
-def upload_image_bytes_to_cloudinary(image_bytes: bytes) -> str | None:
+def prepare_image_for_x(image_file: BinaryIO) -> BinaryIO:
+    """
+    画像をXのメディア制限（5MB・長辺4096px）に収まるよう、必要なときだけ縮小・JPEG再圧縮する関数。
+    制限内の画像とアニメーションGIFは、そのまま先頭に巻き戻して返す。
+    """
+    image_file.seek(0, io.SEEK_END)
+    size = image_file.tell()
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        if getattr(image, "is_animated", False) or (size <= X_IMAGE_MAX_BYTES and max(image.size) <= X_IMAGE_MAX_DIMENSION):
+            image_file.seek(0)
+            return image_file
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((X_IMAGE_MAX_DIMENSION, X_IMAGE_MAX_DIMENSION))
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEGは透過を扱えないので、白背景に合成する
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        for quality in (90, 80, 70, 60, 50):
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= X_IMAGE_MAX_BYTES:
+                break
+    buffer.seek(0)
+    return buffer
+
+def upload_image_bytes_to_cloudinary(image_bytes: bytes | BinaryIO) -> str | None:
     """
-    画像データ（バイト）を受け取り、Cloudinaryにアップロードして、そのURLを返す関数
+    画像データ（バイトまたはファイルオブジェクト）を受け取り、Cloudinaryにアップロードして、そのURLを返す関数
     """
     try:
         # この関数は、設定済みのCloudinaryライブラリを使ってアップロードするだけになります
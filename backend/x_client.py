@@ -2,12 +2,59 @@ import os
 import tweepy
 from dotenv import load_dotenv
 import requests
-import io
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from functools import lru_cache
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+import hashlib
+import mimetypes
+import tempfile
+import threading
+from config import settings
+import rate_limit
+
+# レート制限を管理するエンドポイント名（rate_limit.endpoint_key の形式）
+CREATE_TWEET_ENDPOINT = "POST /2/tweets"
+MEDIA_UPLOAD_ENDPOINT = "POST /1.1/media/upload.json"
+GET_TWEETS_ENDPOINT = "GET /2/tweets"
+
+# get_tweets に一度に渡せるツイートIDの上限
+MAX_TWEET_IDS_PER_LOOKUP = 100
 
 load_dotenv()
 
+# --- HTTP接続の準備 ---
+class PooledSession(requests.Session):
+    """
+    キープアライブ接続を使い回すためのセッション。
+    tweepy.API はリクエストのたびに session.close() を呼んでコネクションプールを捨ててしまうため、
+    close() では何もせず、アプリ終了時に shutdown() で閉じる。タイムアウト未指定のリクエストには既定値を付ける。
+    """
+    def __init__(self):
+        super().__init__()
+        self.default_timeout = (settings.X_HTTP_CONNECT_TIMEOUT, settings.X_HTTP_READ_TIMEOUT)
+        adapter = HTTPAdapter(pool_connections=settings.X_HTTP_POOL_SIZE, pool_maxsize=settings.X_HTTP_POOL_SIZE)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        # すべてのレスポンスからレート制限ヘッダを読み取る
+        self.hooks["response"].append(rate_limit.limiter.observe)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
 # --- 認証情報の準備 ---
+# 認証済みクライアントは一度だけ作り、以降は同じもの（と同じコネクションプール）を使い回す
 # API v2用（ツイート投稿、情報取得など）
+@lru_cache(maxsize=None)
 def get_x_client_v2():
     client = tweepy.Client(
         consumer_key=os.getenv("X_API_KEY"),
@@ -15,15 +62,169 @@ def get_x_client_v2():
         access_token=os.getenv("X_ACCESS_TOKEN"),
         access_token_secret=os.getenv("X_ACCESS_TOKEN_SECRET")
     )
+    client.session = PooledSession()
     return client
 
 # API v1.1用（メディアアップロード用）
+@lru_cache(maxsize=None)
 def get_x_api_v1():
     auth = tweepy.OAuth1UserHandler(
         os.getenv("X_API_KEY"), os.getenv("X_API_KEY_SECRET"),
         os.getenv("X_ACCESS_TOKEN"), os.getenv("X_ACCESS_TOKEN_SECRET")
     )
-    return tweepy.API(auth)
+    api = tweepy.API(auth, timeout=(settings.X_HTTP_CONNECT_TIMEOUT, settings.X_HTTP_READ_TIMEOUT))
+    api.session = PooledSession()
+    return api
+
+# 画像ダウンロード用
+@lru_cache(maxsize=None)
+def get_media_session():
+    return PooledSession()
+
+class TweetMaybeSentError(Exception):
+    """ツイートの投稿リクエストを送った後に起きたエラー。Xに投稿されたかどうか分からないため、再送してはいけない"""
+
+def _failed_before_sending(error: Exception) -> bool:
+    """接続の確立に失敗したなど、リクエストがXに届く前に起きたエラーかどうかを判定する"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        # requests は接続の失敗を MaxRetryError で包み、reason に元のエラーを入れる
+        return isinstance(getattr(error.args[0], "reason", error.args[0]), NewConnectionError)
+    return False
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    時間をおいて再試行すれば成功する見込みのあるエラー（429、5xx、通信エラー）かどうかを判定する。
+    ツイートの投稿リクエストを送った後のエラーは、post_tweet が TweetMaybeSentError にするので再試行の対象にならない。
+    """
+    if isinstance(error, (tweepy.TooManyRequests, tweepy.TwitterServerError)):
+        return True
+    if isinstance(error, tweepy.HTTPException):
+        return False
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (error.response.status_code == 429 or error.response.status_code >= 500)
+    # tweepy.API は通信エラーを TweepyException で包んで投げる
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, tweepy.TweepyException))
+
+def close_clients():
+    """使い回しているHTTP接続をすべて閉じる（アプリ終了時に呼ぶ）"""
+    for factory in (get_x_client_v2, get_x_api_v1):
+        if factory.cache_info().currsize:
+            factory().session.shutdown()
+        factory.cache_clear()
+    if get_media_session.cache_info().currsize:
+        get_media_session().shutdown()
+    get_media_session.cache_clear()
+
+# --- メディアの再利用 ---
+# X の media_id は発行から一定時間（通常24時間）有効なので、期限まで余裕があるものは再アップロードせずに使い回す
+MEDIA_REUSE_MARGIN = timedelta(hours=1)
+DEFAULT_MEDIA_LIFETIME = timedelta(hours=24)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class MediaCache:
+    """アップロード済みの media_id を、画像URLと画像内容のハッシュの両方から引けるようにしておくLRUキャッシュ"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._by_url: OrderedDict[str, tuple[str, int, datetime]] = OrderedDict()
+        self._by_hash: OrderedDict[str, tuple[int, datetime]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _usable(expires_at: datetime) -> bool:
+        return expires_at - datetime.now(timezone.utc) > MEDIA_REUSE_MARGIN
+
+    def get_by_url(self, image_url: str) -> int | None:
+        with self._lock:
+            entry = self._by_url.get(image_url)
+            if entry is None:
+                return None
+            content_hash, media_id, expires_at = entry
+            if not self._usable(expires_at):
+                del self._by_url[image_url]
+                return None
+            self._by_url.move_to_end(image_url)
+            return media_id
+
+    def get_by_hash(self, content_hash: str) -> tuple[int, datetime] | None:
+        with self._lock:
+            entry = self._by_hash.get(content_hash)
+            if entry is None:
+                return None
+            media_id, expires_at = entry
+            if not self._usable(expires_at):
+                del self._by_hash[content_hash]
+                return None
+            self._by_hash.move_to_end(content_hash)
+            return media_id, expires_at
+
+    def put(self, image_url: str, content_hash: str, media_id: int, expires_at: datetime):
+        with self._lock:
+            self._by_url[image_url] = (content_hash, media_id, expires_at)
+            self._by_url.move_to_end(image_url)
+            self._by_hash[content_hash] = (media_id, expires_at)
+            self._by_hash.move_to_end(content_hash)
+            for entries in (self._by_url, self._by_hash):
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+
+media_cache = MediaCache(max_entries=settings.X_MEDIA_CACHE_SIZE)
+
+def _download_media(image_url: str):
+    """
+    画像をストリーミングでダウンロードし、(ファイル, サイズ, SHA-256, Content-Type) を返す。
+    一定サイズを超えた分は一時ファイルに書き出すので、画像の大きさに関係なくメモリ使用量は一定に収まる。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.X_MEDIA_SPOOL_MAX_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with get_media_session().get(image_url, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.X_MEDIA_MAX_BYTES:
+                    raise ValueError(f"Media is larger than {settings.X_MEDIA_MAX_BYTES} bytes: {image_url}")
+                digest.update(chunk)
+                spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size, digest.hexdigest(), content_type
+
+def upload_media(image_url: str) -> int:
+    """
+    画像URLの画像をXにアップロードして media_id を返す関数。
+    同じURL、または同じ内容の画像を有効期限内にアップロード済みなら、その media_id を使い回す。
+    """
+    media_id = media_cache.get_by_url(image_url)
+    if media_id is not None:
+        print(f"Reusing uploaded media for {image_url}. Media ID: {media_id}")
+        return media_id
+
+    media_file, size, content_hash, content_type = _download_media(image_url)
+    with media_file:
+        cached = media_cache.get_by_hash(content_hash)
+        if cached is not None:
+            media_id, expires_at = cached
+            print(f"Reusing uploaded media with the same content. Media ID: {media_id}")
+            media_cache.put(image_url, content_hash, media_id, expires_at)
+            return media_id
+
+        extension = mimetypes.guess_extension(content_type) if content_type else None
+        media = get_x_api_v1().media_upload(
+            filename=f"image{extension or '.jpg'}",
+            file=media_file,
+            chunked=size > settings.X_MEDIA_CHUNKED_THRESHOLD
+        )
+
+    lifetime = timedelta(seconds=getattr(media, "expires_after_secs", None) or DEFAULT_MEDIA_LIFETIME.total_seconds())
+    media_cache.put(image_url, content_hash, media.media_id, datetime.now(timezone.utc) + lifetime)
+    return media.media_id
 
 # --- 機能ごとの関数 ---
 
@@ -36,41 +237,49 @@ def post_tweet(text: str, image_url: str | None = None):
     media_ids = []
     if image_url:
         print(f"Image URL found. Uploading to Twitter: {image_url}")
-        api_v1 = get_x_api_v1()
         try:
-            # 1. URLから画像データをダウンロード
-            response = requests.get(image_url, stream=True)
-            response.raise_for_status()
-            
-            # 2. Tweepyを使ってXにメディアをアップロード
-            media = api_v1.media_upload(filename="image.jpg", file=io.BytesIO(response.content))
-            media_ids.append(media.media_id)
-            print(f"Image uploaded to Twitter. Media ID: {media.media_id}")
+            # 1. 画像をダウンロードしてXにアップロード（アップロード済みなら media_id を再利用）
+            media_id = upload_media(image_url)
+            media_ids.append(media_id)
+            print(f"Image uploaded to Twitter. Media ID: {media_id}")
         except Exception as e:
             print(f"Error uploading image to Twitter: {e}")
             raise e # エラーを呼び出し元に伝える
 
     try:
-        # 3. テキストとメディアID（あれば）を使ってツイートを投稿
+        # 2. テキストとメディアID（あれば）を使ってツイートを投稿
         response = client_v2.create_tweet(text=text, media_ids=media_ids if media_ids else None)
         print("Tweet posted successfully to X.")
         return response.data
     except Exception as e:
         print(f"Error posting tweet to X: {e}")
-        raise e
+        # 429 と 4xx はXが投稿を受け付けなかったことが分かっている。接続前の失敗もツイートは届いていない。
+        # それ以外（読み込みのタイムアウト、送信後の切断、5xx など）は投稿されている可能性がある
+        if isinstance(e, tweepy.HTTPException) and not isinstance(e, tweepy.TwitterServerError):
+            raise e
+        if _failed_before_sending(e):
+            raise e
+        raise TweetMaybeSentError(
+            f"The tweet may or may not have been sent, so it was not retried. {type(e).__name__}: {e}"
+        ) from e
 
-def get_tweet_metrics(tweet_id: str):
+def get_tweets_metrics(tweet_ids: list[str]) -> dict[str, dict]:
+    """
+    最大100件のツイートIDのメトリクスを1回のAPI呼び出しでまとめて取得し、
+    ツイートIDをキーにした辞書で返す関数
+    """
     client = get_x_client_v2()
     try:
-        response = client.get_tweets(ids=[tweet_id], tweet_fields=["public_metrics", "non_public_metrics"])
-        if response.data:
+        response = client.get_tweets(ids=tweet_ids, tweet_fields=["public_metrics", "non_public_metrics"])
+        metrics_by_id = {}
+        for tweet in response.data or []:
             metrics = {}
-            if response.data[0].public_metrics:
-                metrics.update(response.data[0].public_metrics)
-            if response.data[0].non_public_metrics:
-                metrics.update(response.data[0].non_public_metrics)
-            return metrics
-        return {}
+            if tweet.public_metrics:
+                metrics.update(tweet.public_metrics)
+            if tweet.non_public_metrics:
+                metrics.update(tweet.non_public_metrics)
+            metrics_by_id[str(tweet.id)] = metrics
+        return metrics_by_id
     except Exception as e:
-        print(f"Error getting metrics for tweet {tweet_id}: {e}")
-        raise e
\ No newline at end of file
+        print(f"Error getting metrics for {len(tweet_ids)} tweets: {e}")
+        raise e
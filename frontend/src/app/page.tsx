@@ -23,12 +23,13 @@ export default function Home() {
     const fetchProjects = async () => {
       setIsLoading(true);
       try {
-        const res = await fetch(`${API_URL}/projects/`);
+        // 一覧には投稿本文がいらないので、状態ごとの投稿数だけを返す軽いエンドポイントを使う
+        const res = await fetch(`${API_URL}/projects/summaries?limit=100`);
         if (!res.ok) {
           throw new Error('プロジェクト一覧の取得に失敗しました。');
         }
         const data = await res.json();
-        setProjects(data);
+        setProjects(data.items);
       } catch (err) {
         if (err instanceof Error) {
             setError(err.message);